@@ -0,0 +1,109 @@
+"""Generators for synthetic components, shared by the benchmarks.
+
+Each generator takes a size n and returns the source of a component
+definition named c. make_component turns such a source into an (unchecked)
+Component, so that the phases of the pipeline can be run one at a time.
+"""
+import ast
+
+import typy
+from typy._static_envs import StaticEnv
+from typy import std
+
+def members(n):
+    """n value members."""
+    return "def c():\n" + "".join(
+        "    x%d [: num] = %d\n" % (i, i) for i in range(n))
+
+def record_width(n):
+    """A record type with n fields, a value of that type and n projections."""
+    fields = ", ".join("f%d : num" % i for i in range(n))
+    values = ", ".join("f%d: %d" % (i, i) for i in range(n))
+    return ("def c():\n"
+            "    t [type] = record[" + fields + "]\n"
+            "    x [: t] = {" + values + "}\n" + "".join(
+            "    y%d [: num] = x.f%d\n" % (i, i) for i in range(n)))
+
+def variant_tags(n):
+    """A variant type with n tags, matched on with one rule per tag."""
+    tags = ", ".join("T%d(num)" % i for i in range(n))
+    return ("def c():\n"
+            "    t [type] = variant[" + tags + "]\n"
+            "    x [: t] = T%d(0)\n" % (n - 1) +
+            "    @fn\n"
+            "    def f(v : t) -> num:\n"
+            "        [v].match\n" + "".join(
+            "        with T%d(y): y\n" % i for i in range(n)))
+
+def match_rules(n):
+    """A match on a number with n literal rules and a catch-all."""
+    return ("def c():\n"
+            "    @fn\n"
+            "    def f(v : num) -> num:\n"
+            "        [v].match\n" + "".join(
+            "        with %d: %d\n" % (i, i) for i in range(n)) +
+            "        with _: 0\n")
+
+def binop_chain(n):
+    """A chain of n literals combined with +."""
+    return ("def c():\n"
+            "    x [: num] = " + " + ".join(["1"] * n) + "\n")
+
+def fn_depth(n):
+    """n nested function literals, the innermost of which uses all of the
+    arguments of the enclosing ones."""
+    lines = ["def c():"]
+    for i in range(n):
+        indent = "    " * (i + 1)
+        lines.append(indent + "@fn")
+        lines.append(indent + "def f%d(a%d : num):" % (i, i))
+    lines.append("    " * (n + 1) + " + ".join("a%d" % i for i in range(n)))
+    return "\n".join(lines) + "\n"
+
+def independent_fns(n):
+    """A variant type and n functions that use it but not one another."""
+    return ("def c():\n"
+            "    t [type] = variant[A, B(num), C(num, num)]\n" + "".join(
+            "    @fn\n"
+            "    def f%d(v : t) -> num:\n"
+            "        [v].match\n"
+            "        with A: %d\n"
+            "        with B(x): x + %d\n"
+            "        with C(x, y): x * y + %d\n" % (i, i, i, i)
+            for i in range(n)))
+
+def projections(n):
+    """n members that each project a member out of another component, p."""
+    return "def c():\n" + "".join(
+        "    y%d [: num] = p.x%d\n" % (i, i) for i in range(n))
+
+def _projections_env(n):
+    p = make_component(members(n))
+    p._evaluate()
+    return {'p': p}
+
+# axis name -> (generator, default sizes, extra static env or None)
+AXES = {
+    "members": (members, (100, 1000), None),
+    "record_width": (record_width, (10, 100), None),
+    "variant_tags": (variant_tags, (10, 100), None),
+    "match_rules": (match_rules, (10, 100), None),
+    "binop_chain": (binop_chain, (100, 1000), None),
+    "fn_depth": (fn_depth, (4, 16, 32), None),
+    "projections": (projections, (10, 100), _projections_env),
+}
+
+_std_fragments = ("unit", "boolean", "string", "num", "ieee", "cplx",
+                  "record", "tpl", "variant", "fn", "py")
+
+def std_env():
+    return dict((name, getattr(std, name)) for name in _std_fragments)
+
+def make_component(source, env=None):
+    """Returns the Component defined by source, without checking it. Names
+    from typy.std are in scope, in addition to those in env."""
+    globals = std_env()
+    if env is not None:
+        globals.update(env)
+    tree = ast.parse(source).body[0]
+    return typy.Component(tree, StaticEnv({}, globals), source)
@@ -0,0 +1,40 @@
+"""Checking time for long chains of binary operators.
+
+Each term in 1 + 1 + ... + 1 is a literal, which cannot synthesize a type,
+so every level of the chain makes failing synthesis attempts on its
+operands before falling back to analysis. Time per term should stay
+roughly constant as the chain gets longer.
+
+To run:
+  $ python benchmarks/binop_chain.py [n ...]
+"""
+import ast
+import sys
+import time
+
+import typy
+from typy._static_envs import StaticEnv
+from typy.std import num
+
+def chain_component(n):
+    source = "def c():\n    x [: num] = " + " + ".join(["1"] * n) + "\n"
+    tree = ast.parse(source).body[0]
+    return typy.Component(tree, StaticEnv({}, {'num': num}))
+
+def time_check(n):
+    c = chain_component(n)
+    start = time.perf_counter()
+    c._check()
+    return time.perf_counter() - start
+
+def main(argv):
+    # the checker recurses once per level of the chain
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+    ns = [int(arg) for arg in argv] or [200, 500, 1000, 2000]
+    print("%8s %12s %14s" % ("terms", "check (s)", "per term (us)"))
+    for n in ns:
+        elapsed = time_check(n)
+        print("%8d %12.4f %14.2f" % (n, elapsed, elapsed / n * 1e6))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,144 @@
+"""Compile-time benchmarks for the typy pipeline.
+
+Synthesizes components along several scaling axes (see _generators.AXES)
+and measures the wall time and peak memory of each phase of the pipeline
+(parse, check, translate, compile, exec) separately. Times are the minimum
+over several repetitions. Peak memory is measured in a separate run under
+tracemalloc, and counts only the memory allocated during each phase.
+
+Results can be saved as JSON and compared against a previously saved
+baseline; the exit status is non-zero if any case regressed by more than
+the threshold.
+
+To run:
+  $ python benchmarks/compile_time.py [--axis AXIS ...] [--sizes N ...]
+        [--repeat R] [--output results.json]
+        [--baseline baseline.json] [--threshold 1.25]
+"""
+import argparse
+import collections
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import typy
+import _generators
+
+PHASES = ("parse", "check", "translate", "compile", "exec")
+
+def _phases(c):
+    static_env = c.static_env
+    def compile_():
+        c._code = static_env.compile_module_ast(c._translation)
+    def exec_():
+        c._module = static_env.eval_module_code(c._code)
+    return (("parse", c._parse),
+            ("check", c._check),
+            ("translate", c._translate),
+            ("compile", compile_),
+            ("exec", exec_))
+
+def run_case(generator, n, env_factory, trace_memory):
+    env = env_factory(n) if env_factory is not None else None
+    c = _generators.make_component(generator(n), env)
+    result = collections.OrderedDict()
+    for (phase, run) in _phases(c):
+        if trace_memory:
+            tracemalloc.start()
+            run()
+            result[phase] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        else:
+            start = time.perf_counter()
+            run()
+            result[phase] = time.perf_counter() - start
+    return result
+
+def benchmark(axes, sizes, repeat):
+    results = collections.OrderedDict()
+    for axis in axes:
+        generator, default_sizes, env_factory = _generators.AXES[axis]
+        for n in sizes or default_sizes:
+            times = None
+            for _ in range(repeat):
+                run_times = run_case(generator, n, env_factory, False)
+                if times is None:
+                    times = run_times
+                else:
+                    for phase in PHASES:
+                        times[phase] = min(times[phase], run_times[phase])
+            memory = run_case(generator, n, env_factory, True)
+            results["%s/%d" % (axis, n)] = collections.OrderedDict((
+                ("axis", axis),
+                ("n", n),
+                ("times", times),
+                ("total_time", sum(times.values())),
+                ("peak_memory", memory)))
+    return results
+
+def print_results(results):
+    print("%-20s" % "case" + "".join("%11s" % p for p in PHASES) +
+          "%11s %12s" % ("total", "peak mem"))
+    for case, result in results.items():
+        times = result["times"]
+        print("%-20s" % case +
+              "".join("%10.4fs" % times[p] for p in PHASES) +
+              "%10.4fs %10.1fKB" % (result["total_time"],
+                                   max(result["peak_memory"].values()) / 1024))
+
+def compare(results, baseline, threshold):
+    """Prints the ratio of each case's times to the baseline, and returns
+    the cases that regressed by more than threshold."""
+    regressions = [ ]
+    print("\n%-20s %10s %10s %8s" % ("case", "baseline", "current", "ratio"))
+    for case, result in results.items():
+        try:
+            base = baseline["results"][case]
+        except KeyError:
+            continue
+        ratio = result["total_time"] / base["total_time"]
+        flag = ""
+        if ratio > threshold:
+            regressions.append(case)
+            flag = "  REGRESSION"
+        print("%-20s %9.4fs %9.4fs %7.2fx%s" % (
+            case, base["total_time"], result["total_time"], ratio, flag))
+    return regressions
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--axis", action="append",
+                        choices=sorted(_generators.AXES.keys()),
+                        help="axes to run (default: all)")
+    parser.add_argument("--sizes", type=int, nargs="+",
+                        help="sizes to run (default: per-axis defaults)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="file to save results to, as JSON")
+    parser.add_argument("--baseline", help="results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="slowdown ratio that counts as a regression")
+    args = parser.parse_args(argv)
+
+    # checking recurses on long operator chains and deep nesting
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 100000))
+    typy.set_cache_dir(None)
+
+    axes = args.axis or sorted(_generators.AXES.keys())
+    results = benchmark(axes, args.sizes, args.repeat)
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(collections.OrderedDict((
+                ("python", platform.python_version()),
+                ("results", results))), f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
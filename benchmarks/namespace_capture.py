@@ -0,0 +1,92 @@
+"""Memory used by the namespaces of translated components.
+
+The module that a component's translation is evaluated in binds only the
+static names that the translation references (see
+StaticEnv.exec_module_code). This benchmark defines components in static
+environments with increasing numbers of globals, standing in for large
+defining modules, and reports the size of the translated module's
+namespace next to the size it would have if the defining module's globals
+were copied into it, along with the time taken to evaluate the
+translation.
+
+To run:
+  $ python benchmarks/namespace_capture.py [--globals N ...]
+        [--repeat R] [--output results.json]
+"""
+import argparse
+import collections
+import json
+import sys
+import timeit
+import tracemalloc
+
+import typy
+import _generators
+
+SOURCE = _generators.members(10)
+
+def make(n_globals):
+    env = dict(("g%d" % i, i) for i in range(n_globals))
+    c = _generators.make_component(SOURCE, env)
+    c._translate()
+    static_env = c.static_env
+    return static_env, static_env.compile_module_ast(c._translation)
+
+def full_copy(static_env, code):
+    # the namespace, had all of the defining module's globals been copied
+    module = static_env.new_module()
+    module.__dict__.update(static_env.globals)
+    module.__dict__.update(static_env.closure)
+    exec(code, module.__dict__)
+    return module
+
+def allocated(f):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    module = f()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del module
+    return after - before
+
+def benchmark(sizes, repeat):
+    results = collections.OrderedDict()
+    for n_globals in sizes:
+        static_env, code = make(n_globals)
+        minimal = lambda: static_env.eval_module_code(code)
+        full = lambda: full_copy(static_env, code)
+        results[n_globals] = collections.OrderedDict((
+            ("globals", n_globals),
+            ("names", len(minimal().__dict__)),
+            ("bytes", allocated(minimal)),
+            ("full_copy_bytes", allocated(full)),
+            ("eval_us", min(timeit.repeat(
+                minimal, number=1, repeat=repeat)) * 1e6),
+            ("full_copy_eval_us", min(timeit.repeat(
+                full, number=1, repeat=repeat)) * 1e6)))
+    return results
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--globals", type=int, nargs="+",
+                        default=(100, 1000, 10000))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="file to save results to, as JSON")
+    args = parser.parse_args(argv)
+
+    typy.set_cache_dir(None)
+    results = benchmark(args.globals, args.repeat)
+    print("%8s %6s %12s %12s %10s %10s" % (
+        "globals", "names", "bytes", "full copy", "eval", "full copy"))
+    for result in results.values():
+        print("%8d %6d %12d %12d %8.1fus %8.1fus" % (
+            result["globals"], result["names"], result["bytes"],
+            result["full_copy_bytes"], result["eval_us"],
+            result["full_copy_eval_us"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,75 @@
+"""Speedup of checking the members of a component in parallel.
+
+Checks and translates components with many independent fn members (see
+_generators.independent_fns) with increasing numbers of worker processes
+(see typy.set_workers), and reports the wall time of each along with its
+speedup relative to checking the members one at a time. Times are the
+minimum over several repetitions. The speedup is bounded by the number of
+cores, which is reported too.
+
+To run:
+  $ python benchmarks/parallel_check.py [--sizes N ...] [--workers W ...]
+        [--repeat R] [--output results.json]
+"""
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+
+import typy
+import _generators
+
+def check_time(n, workers, repeat):
+    source = _generators.independent_fns(n)
+    typy.set_workers(workers)
+    try:
+        times = [ ]
+        for _ in range(repeat):
+            c = _generators.make_component(source)
+            start = time.perf_counter()
+            c._translate()
+            times.append(time.perf_counter() - start)
+        return min(times)
+    finally:
+        typy.set_workers(None)
+
+def benchmark(sizes, workers, repeat):
+    results = collections.OrderedDict()
+    for n in sizes:
+        sequential = check_time(n, None, repeat)
+        for w in workers:
+            t = sequential if w == 1 else check_time(n, w, repeat)
+            results["%d/%d" % (n, w)] = collections.OrderedDict((
+                ("members", n),
+                ("workers", w),
+                ("seconds", t),
+                ("speedup", sequential / t)))
+    return results
+
+def main(argv):
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=(100, 400))
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted(set((1, 2, 4, cpus))))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="file to save results to, as JSON")
+    args = parser.parse_args(argv)
+
+    typy.set_cache_dir(None)
+    results = benchmark(args.sizes, args.workers, args.repeat)
+    print("cores: %d" % cpus)
+    print("%8s %8s %10s %8s" % ("members", "workers", "time", "speedup"))
+    for result in results.values():
+        print("%8d %8d %9.3fs %7.2fx" % (
+            result["members"], result["workers"], result["seconds"],
+            result["speedup"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(dict(results, cores=cpus), f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,46 @@
+"""Component parsing time for very large generated components.
+
+Generates components with n value members (plus a match statement every
+100 members, so that match rule grouping is exercised) and times
+Component._parse, excluding the time taken by Python's own parser. Time
+per member should stay roughly constant as n grows.
+
+To run:
+  $ python benchmarks/parse_members.py [n ...]
+"""
+import ast
+import sys
+import time
+
+import typy
+from typy._static_envs import StaticEnv
+from typy.std import unit
+
+def member_source(i):
+    if i % 100 == 99:
+        return ("    match [x_%d]\n"
+                "    with (): pass\n"
+                "    with _: pass\n" % (i - 1))
+    else:
+        return "    x_%d [: unit] = ()\n" % i
+
+def members_component(n):
+    source = "def c():\n" + "".join(member_source(i) for i in range(n))
+    tree = ast.parse(source).body[0]
+    return typy.Component(tree, StaticEnv({}, {'unit': unit}))
+
+def time_parse(n):
+    c = members_component(n)
+    start = time.perf_counter()
+    c._parse()
+    return time.perf_counter() - start
+
+def main(argv):
+    ns = [int(arg) for arg in argv] or [1000, 10000, 100000]
+    print("%8s %12s %16s" % ("members", "parse (s)", "per member (us)"))
+    for n in ns:
+        elapsed = time_parse(n)
+        print("%8d %12.4f %16.2f" % (n, elapsed, elapsed / n * 1e6))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
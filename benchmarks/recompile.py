@@ -0,0 +1,77 @@
+"""Time to recompile a component after editing one of its members.
+
+Compiles components with many fn members (see _generators.independent_fns),
+edits the body of one member, and reports the time to recompile the
+component incrementally (see Component.recompile) alongside the time to
+compile the edited component from scratch. Times are the minimum over
+several repetitions.
+
+To run:
+  $ python benchmarks/recompile.py [--sizes N ...] [--repeat R]
+        [--output results.json]
+"""
+import argparse
+import ast
+import collections
+import json
+import sys
+import time
+
+import typy
+import _generators
+
+def edit(source, n):
+    """Changes the literal in the first rule of the middle member."""
+    i = n // 2
+    return source.replace("with A: %d\n" % i, "with A: %d\n" % (i + n))
+
+def compile_time(source):
+    c = _generators.make_component(source)
+    start = time.perf_counter()
+    c._evaluate()
+    return time.perf_counter() - start
+
+def recompile_time(source, edited):
+    c = _generators.make_component(source)
+    c._evaluate()
+    tree = ast.parse(edited).body[0]
+    start = time.perf_counter()
+    c._recompile(tree, c.static_env, edited)
+    return time.perf_counter() - start
+
+def benchmark(sizes, repeat):
+    results = collections.OrderedDict()
+    for n in sizes:
+        source = _generators.independent_fns(n)
+        edited = edit(source, n)
+        full = min(compile_time(edited) for _ in range(repeat))
+        incremental = min(recompile_time(source, edited)
+                          for _ in range(repeat))
+        results[str(n)] = collections.OrderedDict((
+            ("members", n + 1),
+            ("full_s", full),
+            ("incremental_s", incremental),
+            ("speedup", full / incremental)))
+    return results
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=(100, 300))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="file to save results to, as JSON")
+    args = parser.parse_args(argv)
+
+    typy.set_cache_dir(None)
+    results = benchmark(args.sizes, args.repeat)
+    print("%8s %10s %12s %8s" % ("members", "full", "incremental", "speedup"))
+    for result in results.values():
+        print("%8d %9.3fs %11.3fs %7.2fx" % (
+            result["members"], result["full_s"], result["incremental_s"],
+            result["speedup"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
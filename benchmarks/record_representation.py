@@ -0,0 +1,92 @@
+"""Compares the tuple (record) and slotted class (slotted_record)
+representations of records.
+
+For each representation, reports the memory allocated per record value
+(measured with tracemalloc while building a list of records) and the time
+taken to project a field out of a record, for records of several widths.
+
+To run:
+  $ python benchmarks/record_representation.py [--records N]
+        [--widths W ...] [--number N] [--repeat R] [--output results.json]
+"""
+import argparse
+import collections
+import json
+import sys
+import timeit
+import tracemalloc
+
+import typy
+from typy import std
+import _generators
+
+FRAGMENTS = ("record", "slotted_record")
+
+def source(fragment, width):
+    fields = ", ".join("f%d : num" % i for i in range(width))
+    values = ", ".join("f%d: n" % i for i in range(width))
+    return ("def c():\n"
+            "    t [type] = " + fragment + "[" + fields + "]\n"
+            "    @fn\n"
+            "    def mk(n : num) -> t:\n"
+            "        {" + values + "}\n"
+            "    @fn\n"
+            "    def get(r : t) -> num:\n"
+            "        r.f%d\n" % (width - 1))
+
+def functions(fragment, width):
+    c = _generators.make_component(
+        source(fragment, width),
+        {"slotted_record": std.slotted_record})
+    c._evaluate()
+    return c._module.mk, c._module.get
+
+def bytes_per_record(mk, n):
+    mk(0) # create the record class, if any, outside of the measurement
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    records = [mk(i) for i in range(n)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # exclude the list itself
+    return (after - before - sys.getsizeof(records)) / n
+
+def access_time(get, mk, number, repeat):
+    r = mk(1)
+    return min(timeit.repeat(lambda: get(r), number=number,
+                             repeat=repeat)) / number
+
+def benchmark(n_records, widths, number, repeat):
+    results = collections.OrderedDict()
+    for width in widths:
+        for fragment in FRAGMENTS:
+            mk, get = functions(fragment, width)
+            results["%s/%d" % (fragment, width)] = collections.OrderedDict((
+                ("fragment", fragment),
+                ("width", width),
+                ("bytes_per_record", bytes_per_record(mk, n_records)),
+                ("access_ns", access_time(get, mk, number, repeat) * 1e9)))
+    return results
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=1000000)
+    parser.add_argument("--widths", type=int, nargs="+", default=(2, 8))
+    parser.add_argument("--number", type=int, default=1000000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="file to save results to, as JSON")
+    args = parser.parse_args(argv)
+
+    typy.set_cache_dir(None)
+    results = benchmark(args.records, args.widths, args.number, args.repeat)
+    print("%-20s %14s %12s" % ("case", "bytes/record", "access"))
+    for case, result in results.items():
+        print("%-20s %14.1f %10.1fns" % (
+            case, result["bytes_per_record"], result["access_ns"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
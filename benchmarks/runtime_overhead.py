@@ -0,0 +1,252 @@
+"""Runtime overhead of translated typy code relative to idiomatic Python.
+
+Runs equivalent workloads through functions defined in typy components and
+through hand-written Python functions, and reports the ratio of their run
+times, grouped by the typy.std fragment whose translation is being
+exercised (and the component system, for cross-component references).
+A ratio of 1.0 means that the translation is as fast as idiomatic Python.
+
+To run:
+  $ python benchmarks/runtime_overhead.py [--number N] [--repeat R]
+        [--output results.json]
+"""
+import argparse
+import collections
+import json
+import sys
+import timeit
+
+import _generators
+
+TYPY_SOURCE = '''def c():
+    t [type] = record[a : num, b : num]
+    @fn
+    def record_access(x : num) -> num:
+        r [: t] = {a: x, b: x}
+        r.a + r.b
+    v [type] = variant[Leaf(num), Node(num, num)]
+    @fn
+    def variant_match(x : num) -> num:
+        y [: v] = Node(x, x)
+        [y].match
+        with Leaf(z): z
+        with Node(z, w): z + w
+    @fn
+    def literal_match(s : string) -> num:
+        [s].match
+        with "get": 0
+        with "put": 1
+        with "post": 2
+        with "delete": 3
+        with "head": 4
+        with "options": 5
+        with "patch": 6
+        with "trace": 7
+        with "connect": 8
+        with _: -1
+    @fn
+    def log_route(s : string) -> num:
+        [s].match
+        with f"GET /static/{p}": 0
+        with f"GET /api/{p}": 1
+        with f"GET /{p}": 2
+        with f"POST /api/{p}": 3
+        with f"POST /{p}": 4
+        with f"PUT /{p}": 5
+        with f"DELETE /{p}": 6
+        with f"HEAD /{p}": 7
+        with _: -1
+    o [type] = variant[Nothing, Just(num)]
+    @fn
+    def option_match(x : num) -> num:
+        y [: o] = Just(x)
+        [y].match
+        with Nothing: 0
+        with Just(z): z
+    @fn
+    def add(x : num, y : num) -> num:
+        x + y
+    @fn
+    def fn_call(x : num) -> num:
+        add(x, 1)
+    @fn
+    def string_format(s : string) -> string:
+        f"<{s}>" + s
+    @fn
+    def num_arith(x : num) -> num:
+        x * x + x - 1
+    @fn
+    def ieee_arith(x : ieee) -> ieee:
+        x * x + x - 1.0
+'''
+
+TYPY_CLIENT_SOURCE = '''def d():
+    @fn
+    def component_call(x : num) -> num:
+        c.add(x, 1)
+'''
+
+# idiomatic Python equivalents
+
+class T(object):
+    __slots__ = ('a', 'b')
+    def __init__(self, a, b):
+        self.a = a
+        self.b = b
+
+def record_access(x):
+    r = T(x, x)
+    return r.a + r.b
+
+class V(object):
+    __slots__ = ()
+class Leaf(V):
+    __slots__ = ('z',)
+    def __init__(self, z):
+        self.z = z
+class Node(V):
+    __slots__ = ('z', 'w')
+    def __init__(self, z, w):
+        self.z = z
+        self.w = w
+
+def variant_match(x):
+    y = Node(x, x)
+    if isinstance(y, Leaf):
+        return y.z
+    elif isinstance(y, Node):
+        return y.z + y.w
+
+def literal_match(s):
+    if s == "get":
+        return 0
+    elif s == "put":
+        return 1
+    elif s == "post":
+        return 2
+    elif s == "delete":
+        return 3
+    elif s == "head":
+        return 4
+    elif s == "options":
+        return 5
+    elif s == "patch":
+        return 6
+    elif s == "trace":
+        return 7
+    elif s == "connect":
+        return 8
+    else:
+        return -1
+
+def log_route(s):
+    if s.startswith("GET /static/"):
+        return 0
+    elif s.startswith("GET /api/"):
+        return 1
+    elif s.startswith("GET /"):
+        return 2
+    elif s.startswith("POST /api/"):
+        return 3
+    elif s.startswith("POST /"):
+        return 4
+    elif s.startswith("PUT /"):
+        return 5
+    elif s.startswith("DELETE /"):
+        return 6
+    elif s.startswith("HEAD /"):
+        return 7
+    else:
+        return -1
+
+def option_match(x):
+    y = x
+    if y is None:
+        return 0
+    else:
+        return y
+
+def add(x, y):
+    return x + y
+
+def fn_call(x):
+    return add(x, 1)
+
+def component_call(x):
+    return add(x, 1)
+
+def string_format(s):
+    return f"<{s}>" + s
+
+def num_arith(x):
+    return x * x + x - 1
+
+def ieee_arith(x):
+    return x * x + x - 1.0
+
+# (workload, fragment, argument)
+WORKLOADS = (
+    ("record_access", "record", 3),
+    ("variant_match", "variant", 3),
+    ("option_match", "variant", 3),
+    ("literal_match", "string", "connect"),
+    ("log_route", "string", "HEAD /index.html"),
+    ("fn_call", "fn", 3),
+    ("component_call", "component", 3),
+    ("string_format", "string", "abc"),
+    ("num_arith", "num", 3),
+    ("ieee_arith", "ieee", 3.0),
+)
+
+def typy_functions():
+    c = _generators.make_component(TYPY_SOURCE)
+    c._evaluate()
+    d = _generators.make_component(TYPY_CLIENT_SOURCE, {'c': c})
+    d._evaluate()
+    functions = dict(
+        (name, getattr(c._module, name)) for (name, _, _) in WORKLOADS
+        if hasattr(c._module, name))
+    functions["component_call"] = d._module.component_call
+    return functions
+
+def time_function(f, arg, number, repeat):
+    return min(timeit.repeat(lambda: f(arg), number=number,
+                             repeat=repeat)) / number
+
+def benchmark(number, repeat):
+    typy_fs = typy_functions()
+    python_fs = globals()
+    results = collections.OrderedDict()
+    for (name, fragment, arg) in WORKLOADS:
+        typy_f, python_f = typy_fs[name], python_fs[name]
+        assert typy_f(arg) == python_f(arg), name
+        typy_time = time_function(typy_f, arg, number, repeat)
+        python_time = time_function(python_f, arg, number, repeat)
+        results[name] = collections.OrderedDict((
+            ("fragment", fragment),
+            ("typy_ns", typy_time * 1e9),
+            ("python_ns", python_time * 1e9),
+            ("ratio", typy_time / python_time)))
+    return results
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--number", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="file to save results to, as JSON")
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.number, args.repeat)
+    print("%-16s %-10s %10s %10s %7s" % (
+        "workload", "fragment", "typy", "python", "ratio"))
+    for name, result in results.items():
+        print("%-16s %-10s %8.1fns %8.1fns %6.2fx" % (
+            name, result["fragment"], result["typy_ns"],
+            result["python_ns"], result["ratio"]))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
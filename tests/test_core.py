@@ -122,3 +122,553 @@ def test_too_many_val_assigns():
             t [: unit] = t2 = unit
 
 
+
+def test_component_translation_cache(tmpdir):
+    typy.set_cache_dir(str(tmpdir))
+    try:
+        def make():
+            @component
+            def c():
+                t [type] = unit
+                x [: t] = ()
+            return c
+        c1 = make()
+        assert c1._checked
+        c2 = make()
+        assert not c2._checked # loaded from the cache
+        assert c2._module.x == ()
+        assert c2.kind_of('t').ty == c1.kind_of('t').ty
+    finally:
+        typy.set_cache_dir(None)
+
+def test_component_translation_cache_dependencies(tmpdir):
+    typy.set_cache_dir(str(tmpdir))
+    try:
+        def make():
+            @component
+            def c():
+                x [: unit] = ()
+            @component
+            def d():
+                y [: unit] = c.x
+            return c, d
+        make()
+        c, d = make()
+        assert not c._checked and not d._checked
+        assert d._module.y == ()
+    finally:
+        typy.set_cache_dir(None)
+
+def test_component_translation_cache_member_dependencies(tmpdir):
+    typy.set_cache_dir(str(tmpdir))
+    try:
+        def make():
+            @component
+            def c():
+                t [type] = unit
+                x [: t] = ()
+                y [: t] = x
+            return c
+        make()
+        c = make()
+        assert not c._checked
+        # using a member of a component loaded from the cache checks the
+        # members that it refers to first
+        @component
+        def e():
+            z [: unit] = c.y
+        assert e._module.z == ()
+    finally:
+        typy.set_cache_dir(None)
+
+def test_component_ref_binding():
+    from typy.std import fn, num
+    from typy.util.testing import trans_str
+    @component
+    def c():
+        @fn
+        def add(x : num, y : num) -> num:
+            x + y
+    @component
+    def d():
+        @fn
+        def f(x : num) -> num:
+            c.add(x, 1)
+    # the reference is resolved once, when d's translation is loaded
+    assert "_module" not in trans_str(d._translation)
+    assert d._module.f(1) == 2
+    # and rebound when c is re-evaluated
+    c._module.add = lambda x, y: x - y
+    c._rebind_refs()
+    assert d._module.f(1) == 0
+
+def test_component_ref_binding_redefined():
+    import gc
+    from typy.std import fn, num
+    @component
+    def c():
+        @fn
+        def add(x : num, y : num) -> num:
+            x + y
+    for _ in range(20):
+        @component
+        def d():
+            @fn
+            def f(x : num) -> num:
+                c.add(x, 1)
+        # re-evaluating d replaces its bindings
+        d._module = None
+        d._evaluated = False
+        d._evaluate()
+        assert len(c._ref_bindings[d][1]) == 1
+    gc.collect()
+    # and the bindings of earlier definitions of d are dropped
+    assert list(c._ref_bindings.keys()) == [d]
+    c._module.add = lambda x, y: x - y
+    c._rebind_refs()
+    assert d._module.f(1) == 0
+
+def test_component_namespace():
+    from typy.std import num
+    @component
+    def c():
+        x [: num] = 1
+    m = c._module
+    # only the static names that the translation references are bound
+    assert 'x' in m.__dict__
+    assert 'pytest' not in m.__dict__ and 'component' not in m.__dict__
+
+def test_component_pickle():
+    import pickle
+    import sys
+    from typy.std import fn, num
+    @component
+    def c():
+        @fn
+        def f(x : num) -> num:
+            x + 1
+    @component(lazy=True)
+    def d():
+        @fn
+        def g(x : num) -> num:
+            x * 2
+        @fn
+        def h(x : num) -> num:
+            x * 3
+    assert sys.modules[c._module_name] is c._module
+    f = c._module.f
+    assert pickle.loads(pickle.dumps(f)) is f
+    g = d.g
+    assert pickle.loads(pickle.dumps(g)) is g
+    # members of lazy components are evaluated when they are looked up
+    # by pickle, e.g. in a process that has not used them
+    lazy_module = sys.modules[d._module_name]
+    assert lazy_module.g is g
+    assert not hasattr(d._module, 'h')
+    assert lazy_module.h(1) == 3 and d._module.h(1) == 3
+
+def test_component_module_names():
+    import inspect
+    import pickle
+    import sys
+    import types
+    from typy.std import fn, num
+    def make():
+        @component
+        def c():
+            @fn
+            def f(x : num) -> num:
+                x + 1
+        return c
+    c1 = make()
+    # components with the same name in one module do not share a name
+    @component
+    def c():
+        @fn
+        def f(x : num) -> num:
+            x + 2
+    c2 = c
+    assert c1._module_name == "%s.c:%d" % (
+        __name__, inspect.getsourcelines(make)[1] + 1)
+    assert c1._module_name != c2._module_name
+    f1, f2 = c1._module.f, c2._module.f
+    assert pickle.loads(pickle.dumps(f1)) is f1
+    assert pickle.loads(pickle.dumps(f2)) is f2
+    # defining a component again at the same site takes the name
+    c1 = make()
+    assert sys.modules[c1._module_name] is c1._module
+    assert c1._module.f(1) == 2 and c2._module.f(1) == 3
+    # modules that are not translations of components keep their names
+    line = inspect.currentframe().f_lineno + 4
+    name = "%s.c:%d" % (__name__, line)
+    other = sys.modules[name] = types.ModuleType(name)
+    try:
+        @component
+        def c():
+            x [: num] = 1
+        assert sys.modules[name] is other
+        assert c._module_name != name
+        assert sys.modules[c._module_name] is c._module
+    finally:
+        del sys.modules[name]
+
+def test_component_pickle_spawn(tmpdir):
+    import os
+    import subprocess
+    import sys
+    import textwrap
+    # references to the values of components defined in the main module of
+    # a program resolve in the processes that multiprocessing spawns
+    script = tmpdir.join("main.py")
+    script.write(textwrap.dedent("""
+        import multiprocessing
+        from typy import component
+        from typy.std import fn, num
+        @component
+        def c():
+            @fn
+            def f(x : num) -> num:
+                x + 1
+        if __name__ == "__main__":
+            with multiprocessing.get_context("spawn").Pool(2) as pool:
+                print(pool.map_async(c._module.f, [1, 2, 3]).get(60))
+    """))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.dirname(typy.__file__))] + 
+        sys.path)
+    out = subprocess.check_output(
+        [sys.executable, str(script)], env=env, timeout=120)
+    assert out.decode().strip() == "[2, 3, 4]"
+
+def test_component_lazy():
+    @component(lazy=True)
+    def c():
+        t [type] = unit
+        x [: t] = ()
+        y [: t] = x
+        z [: t] = 3 # ill-typed, but never used
+    assert not c._checked
+    assert c.y == ()
+    assert c._module.x == ()
+    assert not hasattr(c._module, 'z')
+    with pytest.raises(typy.TyError):
+        c.z
+    with pytest.raises(typy.TyError):
+        c.force()
+
+def test_component_lazy_order():
+    @component(lazy=True)
+    def c():
+        x [: unit] = y # y is not in scope here
+        y [: unit] = ()
+    assert c.y == ()
+    with pytest.raises(typy.TyError):
+        c.x
+
+def test_component_lazy_ref():
+    @component(lazy=True)
+    def c():
+        x [: unit] = ()
+        y [: unit] = ()
+    @component
+    def d():
+        z [: unit] = c.x
+    assert d._module.z == ()
+    assert not hasattr(c._module, 'y')
+    assert c.force()._module.y == ()
+
+def test_parallel_check():
+    from typy import _parallel
+    from typy.std import fn, num, variant
+    @component
+    def c():
+        x [: num] = 1
+    def define():
+        @component
+        def d():
+            t [type] = variant[A, B(num)]
+            @fn
+            def f0(v : t) -> num:
+                [v].match
+                with A: c.x
+                with B(y): y
+            @fn
+            def f1(y : num) -> t: B(y + 1)
+            @fn
+            def f2(y : num) -> t: B(y + 2)
+            @fn
+            def f3(y : num) -> t: B(y + 3)
+            @fn
+            def f4(y : num) -> t: A
+            @fn
+            def f5(y : num) -> t: B(y * 5)
+            @fn
+            def f6(y : num) -> t: B(y * 6)
+            @fn
+            def f7(y : num) -> t: B(y * 7)
+            @fn
+            def g(y : num) -> num:
+                f0(f1(y)) + f0(f4(y)) + f0(f7(y))
+        return d
+    sequential = define()
+    typy.set_workers(2)
+    try:
+        parallel = define()
+        with pytest.raises(typy.TyError):
+            @component
+            def e():
+                @fn
+                def f0(y : num) -> num: y
+                @fn
+                def f1(y : num) -> num: y
+                @fn
+                def f2(y : num) -> num: y
+                @fn
+                def f3(y : num) -> num: y
+                @fn
+                def f4(y : num) -> num: y
+                @fn
+                def f5(y : num) -> num: y
+                @fn
+                def f6(y : num) -> num: y
+                @fn
+                def f7(y : num) -> num: () # ill-typed
+    finally:
+        typy.set_workers(None)
+    assert ([len(level) for level in _parallel.levels(parallel)] == 
+            [1, 8, 1])
+    for y in range(3):
+        assert parallel._module.g(y) == sequential._module.g(y)
+
+def test_component_recompile():
+    from typy.std import fn, num, ieee, string
+    @component
+    def c():
+        @fn
+        def f(x : num) -> num: x + 1
+        @fn
+        def g(x : num) -> num: f(x) * 2
+        @fn
+        def h(x : num) -> num: x
+    @component
+    def d():
+        @fn
+        def k(x : num) -> num: c.g(x)
+    checked = [ ]
+    def check_member(member):
+        checked.append(member.label)
+        typy.Component._check_member(c, member)
+    c._check_member = check_member
+    # only the edited member is checked again
+    def c_edited():
+        @fn
+        def f(x : num) -> num: x + 2
+        @fn
+        def g(x : num) -> num: f(x) * 2
+        @fn
+        def h(x : num) -> num: x
+    c.recompile(c_edited)
+    assert checked == ['f']
+    assert c.g(1) == 6 and d._module.k(1) == 6
+    # and the members that refer to members whose types changed
+    del checked[:]
+    def c_edited():
+        @fn
+        def f(x : num) -> ieee: 1.0
+        @fn
+        def g(x : num) -> num: f(x) * 2
+        @fn
+        def h(x : num) -> num: x
+    with pytest.raises(typy.TyError):
+        c.recompile(c_edited)
+    assert checked == ['f', 'g']
+    # components that use members whose types changed are checked again
+    def c_edited():
+        @fn
+        def f(x : num) -> num: x + 2
+        @fn
+        def g(x : num) -> string: "g"
+        @fn
+        def h(x : num) -> num: x
+    with pytest.raises(typy.TyError):
+        c.recompile(c_edited)
+    assert c.g(1) == "g"
+    with pytest.raises(typy.TyError):
+        d._module.k(1)
+    def c_edited():
+        @fn
+        def f(x : num) -> num: x + 2
+        @fn
+        def g(x : num) -> num: f(x) * 3
+        @fn
+        def h(x : num) -> num: x
+    c.recompile(c_edited)
+    assert d._module.k(1) == 9
+
+def test_component_recompile_harness():
+    import typy.std
+    from typy.util.testing import check_recompile
+    source = """def c():
+    t [type] = variant[A, B(num)]
+    @fn
+    def f(x : num) -> t: B(x + 1)
+    @fn
+    def g(x : num) -> num:
+        [f(x)].match
+        with A: 0
+        with B(y): y
+    h [: num] = g(1)
+"""
+    check_recompile(source, [
+        lambda s: s.replace("x + 1", "x + 2"),
+        lambda s: s.replace("B(num)]", "B(num), C]").replace(
+            "with A: 0", "with A: 0\n        with C: 3"),
+        lambda s: s.replace("    h [: num] = g(1)\n", ""),
+        lambda s: s + "    k [: num] = g(2)\n",
+        lambda s: s.replace("-> t: B(x + 2)", "-> num: x"), # ill-typed
+        lambda s: s.replace("-> num: x", "-> t: A"),
+        lambda s: s.replace("def c():\n", "def c():\n    pass\n"),
+        lambda s: s.replace("    pass\n", ""),
+    ], dict(vars(typy.std)))
+
+def test_canonical_ty_interning():
+    import pickle
+    from typy._ty_exprs import CanonicalTy
+    from typy.std import record, num_ty, string_ty
+    ty1 = CanonicalTy(record, {'a': num_ty, 'b': string_ty})
+    ty2 = CanonicalTy(record, {'b': string_ty, 'a': num_ty})
+    assert ty1 is ty2
+    assert ty1 != CanonicalTy(record, {'a': num_ty})
+    assert {ty1: 0}[ty2] == 0
+    assert pickle.loads(pickle.dumps(ty1)) is ty1
+
+def test_canonical_ty_mapping_kinds():
+    from collections import OrderedDict
+    from typy._ty_exprs import CanonicalTy
+    from typy.std import record, num_ty, string_ty
+    ty1 = CanonicalTy(record, {'a': num_ty, 'b': string_ty})
+    ty2 = CanonicalTy(record, OrderedDict((('a', num_ty), ('b', string_ty))))
+    ty3 = CanonicalTy(record, OrderedDict((('b', string_ty), ('a', num_ty))))
+    # a dict index is equal to an OrderedDict index with the same items
+    assert ty1 == ty2 and ty1 == ty3
+    assert hash(ty1) == hash(ty2) == hash(ty3)
+    assert {ty1: 0}[ty2] == 0
+    # but the order of OrderedDict indices matters
+    assert ty2 != ty3
+    assert ty1 != CanonicalTy(record, OrderedDict((('a', num_ty),)))
+
+def test_fragment_dispatch_table():
+    from typy.std import num, unit
+    assert num._dispatch[("syn", ast.BinOp)] == num.syn_BinOp
+    assert num.supports("ana", ast.Num)
+    assert not unit.supports("ana", ast.Num) # only the default handler
+    assert num.supports("ana", ast.Num(n=0))
+
+def test_binop_chain_synthesis_failures_memoized():
+    from typy._static_envs import StaticEnv
+    from typy._contexts import Context
+    from typy.std import num
+    n = 50
+    source = "def c():\n    x [: num] = " + " + ".join(["1"] * n) + "\n"
+    c = typy.Component(ast.parse(source).body[0], StaticEnv({}, {'num': num}))
+    calls = [0]
+    _syn = Context._syn
+    def counting_syn(self, tree):
+        calls[0] += 1
+        return _syn(self, tree)
+    Context._syn = counting_syn
+    try:
+        c._evaluate()
+    finally:
+        Context._syn = _syn
+    assert c._module.x == n
+    assert calls[0] <= 2 * n # each node at most once
+
+def test_instrumentation():
+    import io, json
+    out = io.StringIO()
+    typy.enable_instrumentation(typy.JSONLinesSink(out))
+    try:
+        @component
+        def c():
+            t [type] = unit
+            x [: t] = ()
+    finally:
+        typy.disable_instrumentation()
+    stats = c.stats
+    assert set(stats.times.keys()) == \
+        set(("parse", "check", "translate", "compile", "exec"))
+    assert list(stats.members.keys()) == ["t", "x"]
+    assert stats.judgments[("unit", "ana")] == 1
+    assert stats.members["x"].nodes_after > 0
+    record = json.loads(out.getvalue())
+    assert record["component"] == "c"
+    assert record["judgments"]["unit"]["ana"] == 1
+
+def test_instrumentation_sink_close(tmpdir):
+    import json
+    path = str(tmpdir.join("stats.jsonl"))
+    sink = typy.JSONLinesSink(path)
+    typy.enable_instrumentation(sink)
+    try:
+        @component
+        def c():
+            x [: unit] = ()
+    finally:
+        # replacing the sink closes the file it opened
+        typy.disable_instrumentation()
+    assert sink.file.closed
+    with open(path) as f:
+        assert json.loads(f.readline())["component"] == "c"
+    with typy.JSONLinesSink(path) as sink:
+        pass
+    assert sink.file.closed
+
+def test_tracing():
+    import io, json
+    tracer = typy.start_tracing()
+    try:
+        @component
+        def c():
+            x [: unit] = ()
+    finally:
+        assert typy.stop_tracing() is tracer
+    out = io.StringIO()
+    tracer.write(out)
+    events = json.loads(out.getvalue())["traceEvents"]
+    assert [e["ph"] for e in events].count("B") == \
+        [e["ph"] for e in events].count("E")
+    ana = [e for e in events if e["name"] == "unit.ana_Tuple"]
+    assert ana[0]["ph"] == "B"
+    assert ana[0]["args"]["line"] == 3
+    assert ana[1]["ph"] == "E" and ana[1]["args"]["duration_us"] >= 0
+    assert any(e["name"] == "check x" for e in events)
+
+def test_constant_hoisting():
+    from typy.std import fn, ieee, num, variant
+    from typy.util.testing import trans_str
+    @component
+    def c():
+        t [type] = variant[A, B(num), C(num, ieee)]
+        @fn
+        def f(x : num) -> t:
+            A
+        @fn
+        def g(x : num) -> t:
+            C(1, NaN)
+        @fn
+        def h(x : num) -> t:
+            C(x, NaN)
+        y [: t] = A
+    m = c._module
+    assert m.f(0) is m.f(1)
+    assert m.g(0) is m.g(1)
+    assert m.h(0) is not m.h(0) and m.h(0)[1] == 0
+    # constants are bound at the top level, outside of the functions
+    functions = [stmt for stmt in c._translation.body
+                 if isinstance(stmt, ast.FunctionDef)]
+    for stmt in functions:
+        assert "float(" not in trans_str(stmt)
+    assert isinstance(functions[0].body[0].value, ast.Name)
+    assert "y = (_typy_hoisted_" in trans_str(c._translation)
@@ -11,6 +11,7 @@ from typy.util.testing import ast_eq, trans_str, trans_truth
 import typy
 from typy._ty_exprs import CanonicalTy
 from typy.std import boolean, unit, num, ieee, record, string, py, fn, variant, tpl
+from typy.std import slotted_record
 from typy._components import component # TODO
 
 # 
@@ -48,10 +49,7 @@ def test_unit_match():
         import builtins as __builtins__
         x = ()
         __typy_scrutinee__ = x
-        if True:
-            x
-        else:
-            raise Exception('typy match failure')""")
+        x""")
 
 def test_unit_intro_bad():
     with pytest.raises(typy.TyError):
@@ -132,10 +130,8 @@ def test_boolean():
         __typy_scrutinee__ = x
         if __typy_scrutinee__:
             y
-        elif (not __typy_scrutinee__):
-            y
         else:
-            raise Exception('typy match failure')
+            y
         b1 = (x == y)
         b2 = (x != y)
         b3 = (x is y)
@@ -234,12 +230,12 @@ def test_num():
         __typy_scrutinee__ = x
         if (__typy_scrutinee__ == 42):
             y
-        elif ((__typy_scrutinee__ < 0) and ((- __typy_scrutinee__) == 42)):
+        elif (__typy_scrutinee__ == -42):
             y
-        elif ((__typy_scrutinee__ < 0) and True):
+        elif (__typy_scrutinee__ < 0):
             _z_0 = (- __typy_scrutinee__)
             _z_0
-        elif ((__typy_scrutinee__ > 0) and True):
+        elif (__typy_scrutinee__ > 0):
             _z_1 = __typy_scrutinee__
             _z_1
         else:
@@ -477,6 +473,56 @@ def test_record():
             a : string]
         y2 [: t2] = x
 
+def test_record_idx():
+    @component
+    def c():
+        t [type] = record[b : num, a : string]
+        x [: t] = {b: 2, a: "test"}
+        xb [: num] = x.b
+        [x].match
+        with {b, a}: b
+    idx = c._members[0].ty.idx
+    assert idx.labels == ('a', 'b')
+    assert idx.positions == {'a': 0, 'b': 1}
+    assert c._module.x == ("test", 2)
+    assert c._module.xb == 2
+
+def test_slotted_record():
+    @component
+    def c():
+        t [type] = slotted_record[b : num, a : string]
+        x [: t] = {b: 2, a: "test"}
+        y [: t] = {a: "test", b: 3}
+        xb [: num] = x.b
+        @fn
+        def get(r : t) -> num:
+            r.b
+        @fn
+        def f(r : t) -> string:
+            [r].match
+            with {a: a, b: 3}: "three"
+            with {a, b}: a
+    x = c._module.x
+    assert x.__slots__ == ('a', 'b')
+    assert not hasattr(x, '__dict__')
+    assert repr(x) == "{a: 'test', b: 2}"
+    assert type(c._module.y) is type(x)
+    assert c._module.xb == 2
+    assert c._module.get(c._module.y) == 3
+    assert c._module.f(x) == "test"
+    assert c._module.f(c._module.y) == "three"
+
+def test_slotted_record_not_shared():
+    @component
+    def c():
+        t [type] = slotted_record[a : num, b : num]
+        @fn
+        def mk(x : num) -> t:
+            {a: 1, b: 2}
+    r = c._module.mk(0)
+    r.a = 99
+    assert c._module.mk(0).a == 1
+
 # 
 # tpl
 # 
@@ -512,6 +558,17 @@ def test_tpl():
         y_0 [: string] = y1[0]
         y_1 [: num] = y1[1]
 
+def test_tpl_idx():
+    @component
+    def c():
+        t [type] = tpl[b : num, a : string]
+        x [: t] = {a: "test", b: 2}
+        xa [: string] = x.a
+    idx = c._members[0].ty.idx
+    assert idx.labels == ('b', 'a')
+    assert c._module.x == (2, "test")
+    assert c._module.xa == "test"
+
 # 
 # variant
 # 
@@ -530,6 +587,214 @@ def test_variant():
         with B(x, y): y
         void [type] = variant[()]
 
+def test_variant_tags():
+    @component
+    def c():
+        t [type] = variant[B(num, num), A(num), D, C]
+        x [: t] = B(1, 2)
+        y [: t] = D
+        @fn
+        def f(v : t) -> num:
+            [v].match
+            with A(n): n
+            with B(n, 3): n
+            with C: 0
+            with _: 42
+    assert c._members[0].ty.idx.numbers == {'A': 0, 'B': 1, 'C': 2, 'D': 3}
+    x, y = c._module.x, c._module.y
+    assert x == (1, 1, 2) and repr(x) == "(B, 1, 2)"
+    assert y == (3,) and repr(y) == "(D,)"
+    f = c._module.f
+    assert f(x) == 42
+    assert f((x[0], 5, 3)) == 5
+    assert f(y) == 42
+    # the match dispatches on the tag with a binary search
+    f_trans = c._translation.body[-1]
+    assert (trans_str(f_trans.body[1]).strip() == 
+            "__typy_case__ = __typy_scrutinee__[0]")
+    switch = f_trans.body[2]
+    assert isinstance(switch, ast.If)
+    assert trans_str(switch.test).strip() == "(__typy_case__ < 2)"
+
+def test_variant_representations():
+    @component
+    def c():
+        opt [type] = variant[Nothing, Just(num)]
+        dyn [type] = variant[Nothing, Just(py)]
+        nested [type] = variant[Nothing, Just(opt)]
+        color [type] = variant[Red, Green, Blue]
+        @fn
+        def get(o : opt) -> num:
+            [o].match
+            with Just(3): 1
+            with Just(x): x
+            with Nothing: 0
+        @fn
+        def code(c : color) -> num:
+            [c].match
+            with Red: 1
+            with Green: 2
+            with Blue: 3
+        n [: opt] = Nothing
+        j [: opt] = Just(5)
+        d [: dyn] = Nothing
+        s [: nested] = Just(Nothing)
+        g [: color] = Green
+    assert ([member.ty.idx.representation for member in c._members[:4]] ==
+            ["option", "tuple", "tuple", "enum"])
+    m = c._module
+    # options whose argument cannot be None are unboxed
+    assert m.n is None and m.j == 5
+    assert [m.get(v) for v in (3, 4, None)] == [1, 4, 0]
+    get_str = trans_str(next(
+        stmt for stmt in c._translation.body
+        if isinstance(stmt, ast.FunctionDef) and stmt.name == "get"))
+    assert "(__typy_scrutinee__ is not None)" in get_str
+    assert "[" not in get_str
+    assert repr(m.d) == "(Nothing,)"
+    assert repr(m.s) == "(Just, None)"
+    # enums are represented by their tags
+    assert repr(m.g) == "Green"
+    assert [m.code(v) for v in (m.g, 0, 2)] == [2, 3, 1]
+
+def test_variant_nested_match():
+    @component
+    def c():
+        ab [type] = variant[A, B]
+        pr [type] = variant[Pair(ab, num)]
+        lst [type] = variant[Cons(pr, num), Nil]
+        @fn
+        def f(l : lst) -> num:
+            [l].match
+            with Cons(Pair(A, x), 0): x
+            with Cons(Pair(B, 1), rest): rest + 100
+            with Cons(y, rest): rest + 200
+            with Nil: 0
+        v1 [: lst] = Cons(Pair(A, 3), 0)
+        v2 [: lst] = Cons(Pair(A, 3), 1)
+        v3 [: lst] = Cons(Pair(B, 1), 5)
+        v4 [: lst] = Cons(Pair(B, 3), 2)
+        v5 [: lst] = Nil
+    m = c._module
+    assert [m.f(v) for v in (m.v1, m.v2, m.v3, m.v4, m.v5)] == [
+        3, 201, 105, 202, 0]
+    # the outer tag is tested once, and each part of the scrutinee is 
+    # loaded once along each path
+    f_str = trans_str(next(
+        stmt for stmt in c._translation.body 
+        if isinstance(stmt, ast.FunctionDef)))
+    assert f_str.count("__typy_scrutinee__[0]") == 1
+    assert f_str.count("= __typy_scrutinee__[1]") == 1
+
+def test_match_exhaustiveness():
+    with pytest.warns(typy.RedundantRuleWarning) as record:
+        @component
+        def c():
+            t [type] = variant[A(num), B(boolean), C]
+            @fn
+            def f(v : t) -> num:
+                [v].match
+                with A(n): n
+                with B(True): 1
+                with B(False): 2
+                with C: 3
+                with _: 4
+            @fn
+            def g(v : t) -> num:
+                [v].match
+                with A(n): n
+                with B(True): 1
+    assert len(record) == 1
+    assert "line 11" in str(record[0].message)
+    f_str, g_str = (trans_str(stmt) for stmt in c._translation.body
+                    if isinstance(stmt, ast.FunctionDef))
+    # f is exhaustive, so does not fail, and its last rule is not translated
+    assert "typy match failure" not in f_str
+    assert "return 4" not in f_str
+    assert "not __typy_scrutinee_0__" not in f_str # B(False) is not tested
+    assert "typy match failure" in g_str
+
+def test_match_literal_dispatch():
+    @component
+    def c():
+        @fn
+        def f(s : string) -> num:
+            [s].match
+            with "a": 1
+            with f"x{y}": 2
+            with "xb": 3
+            with "c": 4
+            with "d": 5
+            with "e": 6
+            with "f": 7
+            with "g": 8
+            with "h": 9
+            with _: 0
+        @fn
+        def g(n : num) -> num:
+            [n].match
+            with 1: 1
+            with 2: 2
+            with _: 0
+    f_str, g_str = (trans_str(stmt) for stmt in c._translation.body
+                    if isinstance(stmt, ast.FunctionDef))
+    # f's literals are looked up in a dict, g's are compared in turn
+    assert ("{'a': 0, 'xb': 1, 'c': 2, 'd': 3, 'e': 4, 'f': 5, 'g': 6, 'h': 7}.get"
+            in trans_str(c._translation))
+    assert "__typy_case__" in f_str
+    assert "__typy_case__" not in g_str
+    # rule order is preserved: f"x{y}" precedes "xb"
+    f = c._module.f
+    assert ([f(s) for s in ("a", "xb", "xq", "c", "h", "z")] == 
+            [1, 2, 2, 4, 9, 0])
+
+def test_match_format_string_dispatch():
+    @component
+    def c():
+        @fn
+        def route(s : string) -> num:
+            [s].match
+            with f"GET /{p}.png": 1
+            with f"GET /api/{p}": 2
+            with f"GET /{p}": 3
+            with f"PUT /{p}": 4
+            with f"POST /{'x'}": 5
+            with f"POST /{p}": 6
+            with f"DELETE /{p}": 7
+            with f"HEAD /{p}": 8
+            with f"{p}!": 9
+            with _: 0
+        @fn
+        def path(s : string) -> string:
+            [s].match
+            with f"GET /{p}.png": p
+            with f"GET /api/{p}": p
+            with f"GET /{p}": p
+            with f"PUT /{p}": p
+            with f"POST /{'x'}": "x"
+            with f"POST /{p}": p
+            with f"DELETE /{p}": p
+            with f"HEAD /{p}": p
+            with f"{p}!": p
+            with _: ""
+    # the rules dispatch on one compiled pattern, rather than on a chain of
+    # prefix tests
+    translation = trans_str(c._translation)
+    assert ".compile(" in translation
+    assert "startswith" not in translation
+    # the first rule whose pattern matches is selected
+    route = c._module.route
+    assert ([route(s) for s in (
+        "GET /a.png", "GET /api/a.png", "GET /api/a", "GET /a", "PUT /a", 
+        "POST /x", "POST /a", "DELETE /a", "HEAD /a", "a!", "GET /a!", "a")] ==
+        [1, 1, 2, 3, 4, 5, 6, 7, 8, 9, 3, 0])
+    # and binds the variables of the rule that it selects
+    path = c._module.path
+    assert ([path(s) for s in (
+        "GET /a.png", "GET /api/b.png", "GET /api/c", "GET /d", "PUT /e/f", 
+        "POST /x", "POST /g", "DELETE /h", "HEAD /i", "j!", "k")] ==
+        ["a", "api/b", "c", "d", "e/f", "x", "g", "h", "i", "j", ""])
+
 # 
 # fn
 # 
@@ -650,6 +915,34 @@ def test_fn():
                 x
 
     # assert ast_eq(c._translation, "")
+
+def test_fn_recursion():
+    @component
+    def c():
+        @fn
+        def count(n : num, acc : num) -> num:
+            [n].match
+            with 0: acc
+            with _: count(n - 1, acc + 1)
+        @fn
+        def fact(n : num) -> num:
+            if n == 0: 1
+            else: n * fact(n - 1)
+        @fn
+        def outer(n : num) -> num:
+            @fn
+            def inner(k : num, acc : num) -> num:
+                if k == 0: acc
+                else: inner(k - 1, acc + k)
+            inner(n, 0)
+    m = c._module
+    assert m.fact(5) == 120
+    # self tail calls do not use stack frames
+    assert m.count(100000, 0) == 100000
+    assert m.outer(100000) == 5000050000
+    count_tr, fact_tr = c._translation.body[-3:-1]
+    assert isinstance(count_tr.body[0], ast.While)
+    assert not isinstance(fact_tr.body[0], ast.While)
     
 # 
 # py
@@ -3,4 +3,11 @@
 from ._errors import *
 from ._components import component, Component, is_component
 from ._fragments import Fragment
+from ._matches import RedundantRuleWarning
+from ._caches import set_cache_dir
+from ._parallel import set_workers
 
+from ._instrumentation import (
+    enable_instrumentation, disable_instrumentation, 
+    LoggingSink, JSONLinesSink)
+from ._tracing import Tracer, start_tracing, stop_tracing
@@ -0,0 +1,209 @@
+"""typy translation caches
+
+Checking and translating a component is expensive relative to loading its
+compiled code, so translations can be persisted across interpreter
+sessions. The cache is opt-in: call set_cache_dir, or set the
+TYPY_CACHE_DIR environment variable before importing typy.
+
+The translation of a component is a function of its source, the typy
+compiler itself, and the values of the names and expressions that the
+checker looks up in its static environment (fragments, other components,
+...). Each cache entry therefore consists of:
+
+  - a manifest, addressed by a digest of the source, which lists the
+    static environment queries made while checking the component, and
+  - an artifact, the marshalled code of the translation, addressed by a
+    digest of the source together with a fingerprint of the current
+    answer to each of these queries.
+
+A change to a fragment (its version attribute or, if that is None, its
+defining module) or to a referenced component thus changes the artifact
+key and causes a miss. Entries are written atomically, so concurrent
+processes sharing a cache directory never observe partial files.
+"""
+
+import ast
+import hashlib
+import importlib.util
+import json
+import marshal
+import os
+import sys
+import tempfile
+
+from ._fragments import is_fragment
+
+__all__ = ('TranslationCache', 'set_cache_dir', 'get_cache')
+
+# bump when the layout of cache entries changes
+FORMAT_VERSION = 1
+
+_HEADER = importlib.util.MAGIC_NUMBER + FORMAT_VERSION.to_bytes(4, 'little')
+
+class TranslationCache(object):
+    """An on-disk cache of component translations."""
+    def __init__(self, path):
+        self.path = path
+
+    def load(self, component):
+        """Returns the cached code for component, or None on a miss."""
+        source_key = _source_key(component)
+        queries = self._read_manifest(source_key)
+        if queries is None:
+            return None
+        key = _artifact_key(source_key, queries, component.static_env)
+        if key is None:
+            return None
+        data = self._read(key + ".code")
+        if data is None:
+            return None
+        try:
+            code = marshal.loads(data)
+        except (EOFError, ValueError, TypeError):
+            return None
+        component._cache_key = key
+        return code
+
+    def store(self, component, code):
+        """Stores the code that component was translated to.
+
+        Does nothing if the static environment queries made while checking
+        component cannot be fingerprinted."""
+        source_key = _source_key(component)
+        static_env = component.static_env
+        queries = list(static_env.queries)
+        key = _artifact_key(source_key, queries, static_env)
+        if key is None:
+            return
+        self._write(source_key + ".manifest",
+                    json.dumps(queries).encode('utf-8'))
+        self._write(key + ".code", marshal.dumps(code))
+        component._cache_key = key
+
+    def _read_manifest(self, source_key):
+        data = self._read(source_key + ".manifest")
+        if data is None:
+            return None
+        try:
+            return [tuple(query) for query in json.loads(data.decode('utf-8'))]
+        except (ValueError, TypeError):
+            return None
+
+    def _read(self, filename):
+        try:
+            with open(os.path.join(self.path, filename), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        if not data.startswith(_HEADER):
+            return None
+        return data[len(_HEADER):]
+
+    def _write(self, filename, data):
+        os.makedirs(self.path, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(_HEADER)
+                f.write(data)
+            os.replace(tmp_path, os.path.join(self.path, filename))
+        except BaseException:
+            try: os.unlink(tmp_path)
+            except OSError: pass
+            raise
+
+_cache = None
+
+def set_cache_dir(path):
+    """Enables the translation cache in directory path (None disables it)."""
+    global _cache
+    _cache = None if path is None else TranslationCache(path)
+
+def get_cache():
+    """Returns the active TranslationCache, or None."""
+    return _cache
+
+def _digest(*parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(repr(part).encode('utf-8'))
+        h.update(b'\0')
+    return h.hexdigest()
+
+def _source_key(component):
+    source = component.source
+    if source is None:
+        source = ast.dump(component.tree, include_attributes=True)
+    return _digest(_compiler_fingerprint(), source)
+
+_compiler_fingerprint_value = None
+def _compiler_fingerprint():
+    """Identifies the version of typy that is currently running."""
+    global _compiler_fingerprint_value
+    if _compiler_fingerprint_value is None:
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        entries = [sys.version]
+        for dirpath, dirnames, filenames in os.walk(package_dir):
+            dirnames[:] = sorted(d for d in dirnames if d != "old")
+            for filename in sorted(filenames):
+                if filename.endswith(".py"):
+                    entries.append((os.path.relpath(
+                        os.path.join(dirpath, filename), package_dir),
+                        _file_stamp(os.path.join(dirpath, filename))))
+        _compiler_fingerprint_value = _digest(*entries)
+    return _compiler_fingerprint_value
+
+def _artifact_key(source_key, queries, static_env):
+    parts = [source_key]
+    for query in queries:
+        fingerprint = _query_fingerprint(query, static_env)
+        if fingerprint is None:
+            return None
+        parts.append((query, fingerprint))
+    return _digest(*parts)
+
+def _query_fingerprint(query, static_env):
+    kind, arg = query
+    if kind == "contains":
+        return ("bool", static_env.defines(arg))
+    if kind not in ("getitem", "eval_expr"):
+        return None
+    try:
+        value = static_env.answer(query)
+    except Exception as e:
+        return ("raises", type(e).__name__)
+    return _value_fingerprint(value)
+
+def _value_fingerprint(value):
+    if is_fragment(value):
+        version = value.version
+        if version is None:
+            module = sys.modules.get(value.__module__, None)
+            filename = getattr(module, '__file__', None)
+            if filename is None:
+                return None
+            version = _file_stamp(filename)
+        return ("fragment", value.__module__, value.__qualname__, version)
+    from ._components import is_component
+    if is_component(value):
+        key = getattr(value, '_cache_key', None)
+        if key is None:
+            return None
+        return ("component", key)
+    if isinstance(value, type(sys)):
+        return ("module", value.__name__)
+    if value is None or isinstance(value, (bool, int, float, complex, str)):
+        return ("constant", type(value).__name__, repr(value))
+    # other values can only affect checking through their type
+    return ("value", type(value).__module__, type(value).__qualname__)
+
+def _file_stamp(filename):
+    try:
+        st = os.stat(filename)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+_env_cache_dir = os.environ.get('TYPY_CACHE_DIR', None)
+if _env_cache_dir:
+    set_cache_dir(_env_cache_dir)
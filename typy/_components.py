@@ -1,156 +1,855 @@
 """typy component system"""
 
 import ast
+import collections
+import hashlib
 import inspect
+import sys
 import textwrap
+import types
+import weakref
 
 import astunparse
 
 from .util import astx as _astx
-from ._errors import ComponentFormationError, InternalError
+from ._errors import TyError, ComponentFormationError, InternalError
 from ._fragments import Fragment
 from ._static_envs import StaticEnv
 from ._contexts import Context, BlockTransMechanism
 from ._ty_exprs import UTyExpr, UName, TypeKind, SingletonKind
 from . import _terms
+from . import _caches
+from . import _instrumentation
+from . import _tracing
+from . import _constants
+from . import _parallel
 
 __all__ = ('component', 'Component', 'is_component')
 
-def component(f):
-    """Decorator that transforms Python function definitions into Components."""
-    (tree, static_env) = _reflect_func(f)
-    c = Component(tree, static_env)
-    c._evaluate()
+def component(f=None, lazy=False):
+    """Decorator that transforms Python function definitions into Components.
+
+    If lazy is True, the component is only parsed up front. Each member is
+    checked, translated and evaluated when it is first used (see
+    Component.force)."""
+    if f is None:
+        return lambda f: component(f, lazy)
+    (source, tree, static_env) = _reflect_func(f)
+    c = Component(tree, static_env, source, lazy, f.__code__.co_firstlineno)
+    if lazy:
+        c._parse()
+    else:
+        c._evaluate()
     return c
 
 def _reflect_func(f):
-    """Returns the ast and StaticEnv of Python function f."""
+    """Returns the source, ast and StaticEnv of Python function f."""
     source = textwrap.dedent(inspect.getsource(f))
     tree = ast.parse(source).body[0]
     static_env = StaticEnv.from_func(f)
-    return (tree, static_env)
+    return (source, tree, static_env)
+
+class _LazyModule(types.ModuleType):
+    """Registered in sys.modules in place of the module that the members of
+    a lazy component are evaluated in. Looking up a member evaluates it, 
+    if it has not been evaluated yet, so that e.g. pickle can resolve 
+    references to it."""
+    def __init__(self, name, component):
+        types.ModuleType.__init__(self, name)
+        self.__typy_component__ = component
+
+    def __getattr__(self, name):
+        # only called when ordinary attribute lookup fails
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.__typy_component__, name)
 
 class Component(object):
     """Top-level components."""
-    def __init__(self, tree, static_env):
-        """Called by component."""
+    def __init__(self, tree, static_env, source=None, lazy=False, 
+                 lineno=None):
+        """Called by component. lineno is the line of the definition in the
+        defining module, if known."""
         self.tree = tree
         self.static_env = static_env
+        self.source = source
+        self.ctx = None
+        self._lazy = lazy
+        self._cache_key = None
+        self._parsed = False
+        self._checked = False
+        self._translated = False
+        self._evaluated = False
+        # per-member state (see _check_member and _evaluate_member)
+        self._checked_members = set()
+        self._member_errors = { }
+        self._evaluated_members = set()
+        self._evaluated_imports = set()
+        self._evaluated_hoisted = set()
+        # member -> translation. The members translated by the workers that
+        # checked them (see _parallel), and those whose translations are 
+        # reused (see recompile), are added before _translate adds the rest.
+        self._translations = { }
+        # member -> the members of other components that checking it used 
+        # (see Context.consumed)
+        self._consumed = { }
+        # member -> its definition (see _definition), computed when the 
+        # component is recompiled
+        self._definitions = None
+        # component -> (namespace, {variable: member name}), for the
+        # variables that the translations of other components bind to the
+        # values of this component's members (see _bind_ref)
+        self._ref_bindings = weakref.WeakKeyDictionary()
+        # component -> None, for the components that used the types or 
+        # kinds of this component's members when they were checked (see 
+        # _record_consumed), in the order that they did so
+        self._dependents = weakref.WeakKeyDictionary()
+        if _instrumentation.is_enabled():
+            self.stats = _instrumentation.Stats(tree.name)
+        else:
+            self.stats = None
+        # the name that the translated module is registered under in 
+        # sys.modules, so that e.g. the functions that it defines can be
+        # pickled (see _register_module)
+        if lineno is not None:
+            site = str(lineno)
+        elif source is not None:
+            site = hashlib.sha1(source.encode("utf-8")).hexdigest()[:12]
+        else:
+            site = "%x" % id(self)
+        self._module_name = _module_name(
+            static_env.globals.get("__name__", "__typy__"), tree.name, site)
+        if lazy:
+            self._module = self._new_module()
+            self._register_module()
+
+    def __getattr__(self, name):
+        # only called when ordinary attribute lookup fails
+        if name.startswith('_'):
+            raise AttributeError(name)
+        self._parse()
+        try:
+            member = self._val_exports[name]
+        except KeyError:
+            raise AttributeError("Invalid component member: " + name)
+        self._evaluate_member(member)
+        return getattr(self._module, name)
+
+    def force(self):
+        """Checks, translates and evaluates all members.
+
+        Lazy components otherwise only do so on first use, so this is
+        useful to surface all type errors, e.g. in CI."""
+        self._evaluate()
+        return self
+
+    def recompile(self, f):
+        """Replaces the definition of this component with that of Python 
+        function f, e.g. an edited version of the original definition, and
+        evaluates it again.
+
+        Only the members whose definitions changed, or that refer to 
+        members whose types changed, are checked and translated again (see
+        _fingerprint); the other members keep their types and translations.
+        Components that refer to this one use the new values of its members
+        (see _rebind_refs), and are checked again if they use members whose
+        types or kinds changed (see _check_dependents). Recompiling a lazy
+        component forces it."""
+        (source, tree, static_env) = _reflect_func(f)
+        self._recompile(tree, static_env, source)
+        return self
+
+    def _recompile(self, tree, static_env, source=None):
+        previous = self._previous_state(static_env)
+        old_queries = self.static_env.queries
+        self.tree = tree
+        self.static_env = static_env
+        self.source = source
+        self._cache_key = None
+        if self.stats is not None:
+            self.stats = _instrumentation.Stats(tree.name)
+        self._reset()
+        if previous is not None:
+            ctx = self.ctx
+            ctx.static_env = static_env
+            ctx.stats = self.stats
+            ctx._syn_failures = { }
+            # static_env answers the queries made so far in the same way
+            # (see _previous_state)
+            static_env.queries.update(old_queries)
+            if not self._check_incrementally(previous):
+                static_env.queries.clear()
+                self._reset()
+                previous = None
+        if previous is None:
+            self.ctx = None
+            if self._lazy:
+                self._evaluated_members = set()
+                self._evaluated_imports = set()
+                self._evaluated_hoisted = set()
+                self._module = self._new_module()
+                self._register_module()
+                self._parse()
+                self._evaluate()
+                self._rebind_refs()
+                self._check_dependents()
+                return
+        self._evaluate()
+        self._check_dependents()
+
+    def _check_dependents(self):
+        """Checks the components that use members of this one again, after 
+        it was recompiled, if they use members whose types or kinds changed 
+        (see _uses_changed_members). 
+
+        If a component is no longer well-typed, the variables that its 
+        translation binds to the values of this component's members are 
+        bound to functions that raise the error instead, and the error is 
+        raised once the other components have been checked."""
+        dependents = list(self._dependents.keys())
+        dependents.extend(dependent for dependent in self._ref_bindings.keys()
+                          if dependent not in self._dependents)
+        error = None
+        for dependent in dependents:
+            if dependent is self or not dependent._uses_changed_members():
+                continue
+            try:
+                # the checker memoizes types on the nodes of the tree
+                dependent._recompile(
+                    _unchecked_copy(dependent.tree), dependent.static_env, 
+                    dependent.source)
+            except TyError as e:
+                bindings = self._ref_bindings.get(dependent)
+                if bindings is not None:
+                    namespace, names = bindings
+                    for id in names:
+                        namespace[id] = _stale_value(e)
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+
+    def _uses_changed_members(self):
+        """Returns True if the members of other components that this 
+        component used when it was checked (see Context.consumed) changed 
+        types or kinds, or if it has not been checked and evaluated in full,
+        e.g. because it was loaded from the cache or failed to check."""
+        if not self._lazy and not (self._checked and self._evaluated):
+            return True
+        return not all(_consumed_unchanged(consumed) 
+                       for consumed in self._consumed.values())
+
+    def _reset(self):
         self._parsed = False
         self._checked = False
         self._translated = False
         self._evaluated = False
+        self._checked_members = set()
+        self._member_errors = { }
+        self._translations = { }
+        self._consumed = { }
+        self._definitions = None
+
+    def _timing(self, phase, member=None):
+        stats = self.stats
+        tracer = _tracing.get_tracer()
+        if stats is None and tracer is None:
+            return _instrumentation.null_timing
+        else:
+            return _instrumentation.Timing(
+                stats, tracer, phase, 
+                None if member is None else member.label,
+                self.tree.name)
+
+    def _record_nodes(self, member, translation):
+        stats = self.stats
+        if stats is not None:
+            member_stats = stats.member(member.label)
+            member_stats.nodes_before = _instrumentation.count_nodes(
+                member._trees())
+            member_stats.nodes_after = _instrumentation.count_nodes(
+                translation)
+
+    def _emit_stats(self):
+        sink = _instrumentation.get_sink()
+        if self.stats is not None and sink is not None:
+            sink.emit(self.stats)
 
     def _parse(self):
         if self._parsed: return
 
-        tree = self.tree
+        with self._timing("parse"):
+            tree = self.tree
 
-        # make sure there are no arguments
-        if not _astx.is_empty_args(tree.args):
-            raise ComponentFormationError(
-                "Components cannot take arguments.", tree)
+            # make sure there are no arguments
+            if not _astx.is_empty_args(tree.args):
+                raise ComponentFormationError(
+                    "Components cannot take arguments.", tree)
 
-        # parse the members
-        def _parse_members():
-            body = list(tree.body)
-            while len(body) > 0:
-                stmt = body.pop(0)
-                if isinstance(stmt, ast.Assign):
-                    type_member = TypeMember.parse_Assign(stmt)
-                    if type_member is not None: yield type_member
-                    else:
-                        value_member = ValueMember.parse_Assign(stmt)
+            # parse the members
+            def _parse_members():
+                body = collections.deque(tree.body)
+                while len(body) > 0:
+                    stmt = body.popleft()
+                    if isinstance(stmt, ast.Assign):
+                        type_member = TypeMember.parse_Assign(stmt)
+                        if type_member is not None: yield type_member
+                        else:
+                            value_member = ValueMember.parse_Assign(stmt)
+                            if value_member is not None: yield value_member
+                            else: 
+                                raise ComponentFormationError(
+                                    "Invalid member definition.", stmt)
+                    elif isinstance(stmt, ast.FunctionDef):
+                        value_member = ValueMember.parse_FunctionDef(stmt)
                         if value_member is not None: yield value_member
-                        else: 
+                        else:
                             raise ComponentFormationError(
                                 "Invalid member definition.", stmt)
-                elif isinstance(stmt, ast.FunctionDef):
-                    value_member = ValueMember.parse_FunctionDef(stmt)
-                    if value_member is not None: yield value_member
                     else:
-                        raise ComponentFormationError(
-                            "Invalid member definition.", stmt)
+                        stmt_member = StmtMember.parse_stmts(stmt, body)
+                        if stmt_member is not None: yield stmt_member
+                        else:
+                            raise ComponentFormationError(
+                                "Invalid statement form in component definition.", stmt)
+            members = self._members = tuple(_parse_members())
+            self._member_index = dict((member, i) 
+                                      for (i, member) in enumerate(members))
+
+            # determine exports
+            ty_expr_exports = self._ty_expr_exports = { }
+            val_exports = self._val_exports = { }
+            for member in members:
+                if isinstance(member, TypeMember):
+                    exports = ty_expr_exports
+                elif isinstance(member, ValueMember):
+                    exports = val_exports
                 else:
-                    stmt_member = StmtMember.parse_stmts(stmt, body)
-                    if stmt_member is not None: yield stmt_member
-                    else:
-                        raise ComponentFormationError(
-                            "Invalid statement form in component definition.", stmt)
-        members = self._members = tuple(_parse_members())
-
-        # determine exports
-        ty_expr_exports = self._ty_expr_exports = { }
-        val_exports = self._val_exports = { }
-        for member in members:
-            if isinstance(member, TypeMember):
-                exports = ty_expr_exports
-            elif isinstance(member, ValueMember):
-                exports = val_exports
-            else:
-                continue
-            lbl = member.id
-            if lbl in exports:
-                raise ComponentFormationError(
-                    "Duplicate component member: " + lbl, member.tree)
-            exports[lbl] = member
+                    continue
+                lbl = member.id
+                if lbl in exports:
+                    raise ComponentFormationError(
+                        "Duplicate component member: " + lbl, member.tree)
+                exports[lbl] = member
 
         self._parsed = True
 
     def _check(self):
         if self._checked: return
         self._parse()
-        ctx = self.ctx = Context(self.static_env)
-        ctx.default_fragments.append(component_singleton)
-        for member in self._members:
+        if _parallel.enabled(self):
+            _parallel.check(self)
+        else:
+            for member in self._members:
+                self._check_member(member)
+        self._checked = True
+
+    def _get_ctx(self):
+        ctx = self.ctx
+        if ctx is None:
+            ctx = self.ctx = Context(self.static_env)
+            ctx.default_fragments.append(component_singleton)
+            ctx.stats = self.stats
+        return ctx
+
+    def _check_member(self, member):
+        if member in self._checked_members: return
+        try:
+            raise self._member_errors[member]
+        except KeyError: pass
+        ctx = self._get_ctx()
+        if not self._checked:
+            # members may be forced in any order (when lazy, or when the
+            # component was loaded from the cache and another component
+            # uses one of its members), so pull in the members that this
+            # member refers to
+            for dep in self._dependencies(member):
+                if dep not in self._checked_members:
+                    self._check_member(dep)
+        # hide the bindings of any later members that have been checked
+        # already (when members are forced, or checked in parallel)
+        hidden = self._hide_later_bindings(member)
+        stacks = (ctx.ty_ids, ctx.ty_vars, ctx.exp_ids, ctx.exp_vars)
+        depths = [len(stack.stack) for stack in stacks]
+        n_fragments = len(ctx.default_fragments)
+        outer_consumed = ctx.consumed
+        consumed = ctx.consumed = [ ]
+        try:
+            with self._timing("check", member):
+                member.check(ctx)
+        except TyError as e:
+            for stack, depth in zip(stacks, depths):
+                del stack.stack[depth:]
+            del ctx.default_fragments[n_fragments:]
+            self._member_errors[member] = e
+            raise
+        finally:
+            ctx.consumed = outer_consumed
+            for (scope, name, value) in hidden:
+                scope[name] = value
+        self._record_consumed(member, consumed)
+        self._checked_members.add(member)
+
+    def _record_consumed(self, member, consumed):
+        self._consumed[member] = consumed
+        for (c, _, _, _) in consumed:
+            c._dependents[self] = None
+
+    def _dependencies(self, member):
+        """Earlier members that member refers to by name."""
+        index = self._member_index[member]
+        for name in member.names:
+            for exports in (self._ty_expr_exports, self._val_exports):
+                try:
+                    other = exports[name]
+                except KeyError: continue
+                if self._member_index[other] < index:
+                    yield other
+
+    def _hide_later_bindings(self, member):
+        ctx = self.ctx
+        index = self._member_index[member]
+        hidden = [ ]
+        for name in member.names:
+            for (exports, scope) in ((self._ty_expr_exports, ctx.ty_ids.stack[0]),
+                                     (self._val_exports, ctx.exp_ids.stack[0])):
+                try:
+                    other = exports[name]
+                except KeyError: continue
+                if self._member_index[other] > index and name in scope:
+                    hidden.append((scope, name, scope.pop(name)))
+        return hidden
+
+    def _fingerprint(self, member):
+        """Identifies what checking member depends on within this component:
+        its definition, and the bindings of the earlier members that it 
+        refers to. The members of other components that it uses are
+        recorded as it is checked (see Context.consumed)."""
+        ty_ids = self.ctx.ty_ids.stack[0]
+        inputs = [ ]
+        for dep in self._dependencies(member):
+            if isinstance(dep, TypeMember):
+                # types refer to the variables bound to type members
+                inputs.append((dep.id, ty_ids.get(dep.id), dep.kind.ty))
+            else:
+                inputs.append((dep.id, dep.ty))
+        return (self._definition(member), inputs)
+
+    def _definition(self, member):
+        """Returns the source of member, i.e. the lines from its first line
+        to the first line of the next member, or if the source of the 
+        component is not known, a dump of its trees."""
+        definitions = self._definitions
+        if definitions is None:
+            definitions = self._definitions = { }
+            source = self.source
+            if source is None:
+                for m in self._members:
+                    definitions[m] = [ast.dump(tree) for tree in m._trees()]
+            else:
+                lines = source.splitlines(True)
+                starts = [_first_line(m) - 1 for m in self._members]
+                for (m, start, end) in zip(
+                        self._members, starts, starts[1:] + [len(lines)]):
+                    definitions[m] = "".join(lines[start:end])
+        return definitions[member]
+
+    def _previous_state(self, static_env):
+        """Returns a map from the key of each member (see _member_keys) to
+        the member and, if it has been checked and translated, its 
+        fingerprint, the members of other components that it used and its
+        translation (otherwise None), or returns None if the component is 
+        to be checked from scratch in static_env."""
+        if self._lazy or self.ctx is None or not self._parsed:
+            return None
+        translations = self._translations
+        done = [member in self._checked_members and member in translations
+                for member in self._members]
+        # statement members may bind names in the context that later members
+        # refer to, so they are not checked again in the same context
+        if any(isinstance(member, StmtMember) and not member_done
+               for (member, member_done) in zip(self._members, done)):
+            return None
+        if not static_env.answers_unchanged(self.static_env.queries):
+            return None
+        return dict(
+            (key, (member, self._fingerprint(member), 
+                   self._consumed[member], translations[member])
+                  if member_done else (member, None, None, None))
+            for (key, member, member_done) in zip(
+                _member_keys(self._members), self._members, done))
+
+    def _check_incrementally(self, previous):
+        """Checks the members, reusing the types and translations of the
+        members in previous (see _previous_state) whose fingerprints are
+        unchanged, and that use the same types from other components. 
+        Returns False if the component is instead to be checked from 
+        scratch, because a statement member changed or was removed."""
+        self._parse()
+        ctx = self.ctx
+        keys = _member_keys(self._members)
+        # remove the bindings of the members that were removed
+        for key in set(previous).difference(keys):
+            old = previous[key][0]
+            if isinstance(old, StmtMember):
+                return False
+            elif isinstance(old, TypeMember):
+                ctx.ty_ids.stack[0].pop(old.id, None)
+            else:
+                ctx.exp_ids.stack[0].pop(old.id, None)
+                ctx.exp_vars.stack[0].pop(old.id, None)
+        for key, member in zip(keys, self._members):
             try:
-                print("checking " + member.id)
-            except: pass
-            member.check(ctx)
+                old, fingerprint, consumed, translation = previous[key]
+            except KeyError:
+                pass
+            else:
+                if fingerprint is not None:
+                    if self._definition(member) == fingerprint[0]:
+                        # the same definition mentions the same names
+                        member._names = old.names
+                    if (self._fingerprint(member) == fingerprint and 
+                            _consumed_unchanged(consumed)):
+                        self._reuse(member, old, consumed, translation)
+                        continue
+                    elif isinstance(member, StmtMember):
+                        return False
+            self._check_member(member)
         self._checked = True
+        return True
+
+    def _reuse(self, member, old, consumed, translation):
+        """Gives member, which has the same fingerprint as old, the type and
+        translation of old."""
+        if isinstance(member, TypeMember):
+            member.ty, member.kind = old.ty, old.kind
+        elif isinstance(member, ValueMember):
+            member.ty = old.ty
+            if hasattr(old, "translation"):
+                member.translation = old.translation
+        delta = member._trees()[0].lineno - old._trees()[0].lineno
+        if delta != 0:
+            _shift_lines(translation, delta)
+        self._translations[member] = translation
+        self._consumed[member] = consumed
+        self._checked_members.add(member)
 
     def _translate(self):
         if self._translated: return
         self._check()
         _members = self._members
         body = [ ]
+        translations = self._translations
         for member in self._members:
-            translation = member.translate(self.ctx)
+            try:
+                translation = translations[member]
+            except KeyError:
+                with self._timing("translate", member):
+                    translation = translations[member] = \
+                        _constants.hoist_constants(
+                            self.ctx, member.translate(self.ctx))
+            self._record_nodes(member, translation)
             body.extend(translation)
-        imports = self.ctx.imports
-        for name in sorted(imports.keys()):
-            asname = imports[name]
-            body.insert(0, 
-                ast.Import(names=[ast.alias(name=name, asname=asname)],
-                           lineno=0, col_offset=0))
         self._translation = ast.Module(
-            body=body,
+            body=self._prelude() + body,
             lineno=0, col_offset=0) # TODO
         self._translated = True
 
+    def _prelude(self):
+        """Returns the imports and hoisted bindings (see Context.hoist) that
+        have not been evaluated yet."""
+        ctx = self.ctx
+        imports = ctx.imports
+        evaluated_imports = self._evaluated_imports
+        prelude = [
+            ast.Import(names=[ast.alias(name=name, asname=imports[name])],
+                       lineno=0, col_offset=0)
+            for name in sorted(imports.keys(), reverse=True)
+            if name not in evaluated_imports]
+        evaluated_hoisted = self._evaluated_hoisted
+        for key, (uniq_id, value) in ctx.hoisted.items():
+            if key not in evaluated_hoisted:
+                prelude.append(ast.fix_missing_locations(ast.Assign(
+                    targets=[ast.Name(id=uniq_id, ctx=_astx.store_ctx,
+                                      lineno=0, col_offset=0)],
+                    value=value,
+                    lineno=0, col_offset=0)))
+        return prelude
+
     def _evaluate(self):
         if self._evaluated: return
+        if self._lazy:
+            for member in self._members:
+                self._evaluate_member(member)
+            self._checked = True
+            self._evaluated = True
+            self._emit_stats()
+            return
+        static_env = self.static_env
+        cache = _caches.get_cache()
+        if cache is not None and not self._checked:
+            code = cache.load(self)
+            if code is not None:
+                # the checker is only run later if another component
+                # needs the types of this component's members
+                with self._timing("exec"):
+                    self._module = self._new_module()
+                    static_env.exec_module_code(code, self._module)
+                self._register_module()
+                self._rebind_refs()
+                if self.stats is not None:
+                    self.stats.cache_hit = True
+                self._evaluated = True
+                self._emit_stats()
+                return
         self._translate()
         _translation = self._translation
         try:
-            self._module = self.static_env.eval_module_ast(_translation)
+            with self._timing("compile"):
+                code = static_env.compile_module_ast(_translation)
+            with self._timing("exec"):
+                self._module = self._new_module()
+                static_env.exec_module_code(code, self._module)
         except Exception as e:
             print("Broken code: ", astunparse.unparse(_translation))
             raise e
+        self._register_module()
+        self._rebind_refs()
+        if cache is not None:
+            cache.store(self, code)
         self._evaluated = True
+        self._emit_stats()
+
+    def _evaluate_member(self, member):
+        if self._evaluated or member in self._evaluated_members: return
+        self._check_member(member)
+        for dep in self._dependencies(member):
+            self._evaluate_member(dep)
+        ctx = self.ctx
+        with self._timing("translate", member):
+            body = _constants.hoist_constants(ctx, member.translate(ctx))
+        self._record_nodes(member, body)
+        translation = ast.Module(
+            body=self._prelude() + body, 
+            lineno=0, col_offset=0)
+        try:
+            with self._timing("compile", member):
+                code = self.static_env.compile_module_ast(translation)
+            with self._timing("exec", member):
+                self.static_env.exec_module_code(code, self._module)
+        except Exception as e:
+            print("Broken code: ", astunparse.unparse(translation))
+            raise e
+        self._evaluated_imports.update(ctx.imports.keys())
+        self._evaluated_hoisted.update(ctx.hoisted.keys())
+        self._evaluated_members.add(member)
+
+    def _new_module(self):
+        """Returns an empty module to evaluate the translation in. It refers
+        to this component weakly, so that the components that this one 
+        refers to can tell whose bindings they hold (see _bind_ref)."""
+        module = self.static_env.new_module(self._module_name)
+        module.__typy_owner__ = weakref.ref(self)
+        return module
+
+    def _register_module(self):
+        """Registers the translated module in sys.modules under a name 
+        derived from the name of the defining module, and the name and line
+        of the definition of the component, e.g. app.models.c:12, so that 
+        pickle can resolve references to the values that it defines (see 
+        _module_name). The most recent evaluation of a definition takes the
+        name. For lazy components, a _LazyModule is registered instead.
+
+        A process that does not have the module (e.g. a process pool 
+        worker) imports the defining module to unpickle such a reference,
+        which defines the component again, so the module is then 
+        registered as a side effect. With a translation cache (see 
+        set_cache_dir) this does not check the component again."""
+        if self._lazy:
+            module = _LazyModule(self._module_name, self)
+        else:
+            module = self._module
+        sys.modules[self._module_name] = module
+
+    def _bind_ref(self, name, namespace, id):
+        """Returns the value of the member called name, which the 
+        translation of another component binds to the variable id in 
+        namespace when it is loaded (see component_singleton.trans_Attribute),
+        and records the binding so that it can be updated if the member is
+        re-evaluated. 
+
+        The bindings are recorded per referring component, which is held 
+        weakly, and are replaced when it is evaluated in a new namespace 
+        (e.g. when it is defined again)."""
+        owner = namespace.get("__typy_owner__")
+        owner = owner() if owner is not None else None
+        if owner is not None:
+            bindings = self._ref_bindings.get(owner)
+            if bindings is None or bindings[0] is not namespace:
+                bindings = self._ref_bindings[owner] = (namespace, { })
+            bindings[1][id] = name
+        if self._lazy:
+            return self.__getattr__(name)
+        return getattr(self._module, name)
+
+    def _rebind_refs(self):
+        """Updates the variables bound to the values of this component's
+        members by the translations of other components, e.g. after the 
+        members have been re-evaluated."""
+        module = self._module
+        for namespace, names in list(self._ref_bindings.values()):
+            for id, name in names.items():
+                namespace[id] = getattr(module, name)
 
     def kind_of(self, lbl):
+        self._parse()
         exports = self._ty_expr_exports
         if lbl in exports:
             member = exports[lbl]
             if isinstance(member, TypeMember):
+                self._check_member(member)
                 return member.kind
 
 def is_component(x):
     return isinstance(x, Component)
 
+def _module_name(module_name, name, site):
+    """Returns the name to register the translated module of the component
+    called name, defined at site (e.g. a line number) in the module called 
+    module_name, under. The site keeps components with the same name in one
+    module apart, and since it is not an identifier, the name is not that 
+    of a submodule that could be imported. A name that is nonetheless taken
+    by a module that is not the translation of a component is not used.
+
+    multiprocessing imports the main module of a program as __mp_main__ in
+    the processes that it spawns, and makes __main__ refer to it, so 
+    components defined there take the names that they have in the main
+    process, under which references to their values were pickled."""
+    if module_name == "__mp_main__":
+        module_name = "__main__"
+    base = "%s.%s:%s" % (module_name, name, site)
+    candidate, n = base, 1
+    while (candidate in sys.modules and 
+           not _is_typy_module(sys.modules[candidate])):
+        n += 1
+        candidate = "%s~%d" % (base, n)
+    return candidate
+
+def _is_typy_module(module):
+    """Returns True if module is the (lazy) translated module of a 
+    component."""
+    return (isinstance(module, _LazyModule) or 
+            "__typy_owner__" in getattr(module, "__dict__", ()))
+
+def _member_keys(members):
+    """Returns a key for each of members that identifies it across 
+    definitions of a component: its kind and name, or for statement 
+    members, their position among the statement members."""
+    keys = [ ]
+    n_stmts = 0
+    for member in members:
+        if isinstance(member, TypeMember):
+            keys.append(("type", member.id))
+        elif isinstance(member, ValueMember):
+            keys.append(("value", member.id))
+        else:
+            keys.append(("stmt", n_stmts))
+            n_stmts += 1
+    return keys
+
+def _first_line(member):
+    tree = member._trees()[0]
+    return min([tree.lineno] + [
+        decorator.lineno 
+        for decorator in getattr(tree, "decorator_list", ())])
+
+def _consumed_unchanged(consumed):
+    """Returns True if the members of other components in consumed (see
+    Context.consumed) still have the same kinds and types."""
+    for (c, sort, lbl, previous) in consumed:
+        try:
+            if sort == "type":
+                current = c.kind_of(lbl)
+            else:
+                c._parse()
+                member = c._val_exports[lbl]
+                if member not in c._checked_members:
+                    c._check_member(member)
+                current = member.ty
+        except Exception:
+            return False
+        if isinstance(current, SingletonKind):
+            if not (isinstance(previous, SingletonKind) and 
+                    current.ty == previous.ty):
+                return False
+        elif current != previous:
+            return False
+    return True
+
+def _stale_value(error):
+    """Returns a function that raises error, which is bound in place of 
+    the values that a component that is no longer well-typed refers to 
+    (see Component._check_dependents)."""
+    def stale(*args, **kwargs):
+        raise error
+    return stale
+
+def _unchecked_copy(node):
+    """Copies node and its descendants, without the attributes that the
+    checker sets on them."""
+    copy = node.__class__()
+    for name in node._fields + node._attributes:
+        try:
+            value = getattr(node, name)
+        except AttributeError:
+            continue
+        if isinstance(value, ast.AST):
+            value = _unchecked_copy(value)
+        elif isinstance(value, list):
+            value = [_unchecked_copy(item) if isinstance(item, ast.AST) 
+                     else item for item in value]
+        setattr(copy, name, value)
+    return copy
+
+def _shift_lines(nodes, delta):
+    """Adds delta to the line numbers of nodes and their descendants. Each
+    node is shifted once, although translations may share nodes."""
+    seen = set()
+    stack = list(nodes)
+    while stack:
+        node = stack.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if "lineno" in node._attributes and hasattr(node, "lineno"):
+            node.lineno += delta
+        stack.extend(ast.iter_child_nodes(node))
+
 class ComponentMember(object):
     """Base class for component members."""
+    @property
+    def names(self):
+        """The identifiers that appear in this member (cached)."""
+        try:
+            return self._names
+        except AttributeError:
+            names = self._names = frozenset(
+                node.id 
+                for tree in self._trees() 
+                for node in ast.walk(tree)
+                if isinstance(node, ast.Name))
+            return names
+
+    def _trees(self):
+        return (self.tree,)
+
+    @property
+    def label(self):
+        """Identifies the member in instrumentation data."""
+        try:
+            return self.id
+        except AttributeError:
+            return "<statement at line " + str(self._trees()[0].lineno) + ">"
 
 class TypeMember(ComponentMember):
     """Type members."""
@@ -253,14 +952,23 @@ class StmtMember(ComponentMember):
     def __init__(self, stmt):
         self.stmt = stmt
 
+    def _trees(self):
+        stmt = self.stmt
+        if isinstance(stmt, _terms.MatchStatementExpression):
+            return [stmt.scrutinizer] + [rule.stmt for rule in stmt.rules]
+        else:
+            return (stmt,)
+
     @classmethod
     def parse_stmts(cls, stmt, body):
+        """Parses stmt, consuming any match rules that follow it from the 
+        front of body (a deque)."""
         if _terms.is_match_scrutinizer(stmt):
             rules = [ ] 
             while len(body) > 0:
                 next_stmt = body[0]
                 if _terms.is_match_rule(next_stmt):
-                    body.pop(0)
+                    body.popleft()
                     rules.append(_terms.MatchRule.parse_with_stmt(next_stmt))
                 else:
                     break
@@ -278,23 +986,40 @@ class StmtMember(ComponentMember):
 class component_singleton(Fragment):
     @classmethod
     def syn_Attribute(cls, ctx, e, idx):
+        idx._parse()
         try:
             member = idx._val_exports[e.attr]
         except KeyError:
             raise TyError("Invalid component member: " + e.attr, e)
         if isinstance(member, ValueMember):
+            idx._check_member(member)
+            consumed = ctx.consumed
+            if consumed is not None:
+                consumed.append((idx, "value", e.attr, member.ty))
             return member.ty
         else:
             raise TyError("Component member is not a value member: " + e.attr, e)
 
     @classmethod
     def trans_Attribute(cls, ctx, e, idx):
-        return ast.fix_missing_locations(ast.copy_location(
-            ast.Attribute(
-                value=ctx.trans(e.value),
-                attr=e.attr,
-                ctx=ast.Load()),
-            e))
+        # the value is bound to a variable when the translation is loaded, 
+        # so that uses are global loads rather than attribute lookups
+        # on the component:
+        #   _typy_hoisted_N = c._bind_ref(attr, globals(), '_typy_hoisted_N')
+        idx._evaluate_member(idx._val_exports[e.attr])
+        bind_ref = ast.Call(
+            func=ast.Attribute(
+                value=_astx.copy_node(e.value),
+                attr="_bind_ref",
+                ctx=_astx.load_ctx),
+            args=[
+                ast.Str(s=e.attr),
+                _astx.builtin_call("globals", []),
+                ast.Str(s="")],
+            keywords=[])
+        id = bind_ref.args[2].s = ctx.hoist(("component_ref", idx, e.attr), 
+                                            bind_ref)
+        return ast.copy_location(ast.Name(id=id, ctx=_astx.load_ctx), e)
 
     @classmethod
     def integrate_static_FunctionDef(cls, ctx, stmt):
@@ -0,0 +1,121 @@
+"""typy constant hoisting
+
+Translations often contain subexpressions whose values are known at
+translation time, e.g. the tuples that represent nullary variant values,
+or float('NaN'). When such an expression appears in the body of a
+function, it would be evaluated each time the function runs.
+hoist_constants binds each of these expressions at the top level of the
+translation instead (see Context.hoist), so that it is evaluated once,
+when the module is loaded.
+
+An expression is constant if it is
+  - a literal, or the negation of a numeric literal,
+  - a variable bound by Context.hoist,
+  - a tuple of constants,
+  - a call to one of the builtins in pure_builtins with constant
+    arguments.
+
+Constants that CPython already folds (literals, and tuples of literals)
+and variables are left in place.
+"""
+
+import ast
+
+__all__ = ('hoist_constants',)
+
+# builtins that, applied to literals, have no side effects and return
+# immutable values
+pure_builtins = frozenset(('float', 'complex'))
+
+def hoist_constants(ctx, stmts):
+    """Replaces the constant expressions in the bodies of the functions in
+    stmts with variables bound at the top level, and returns stmts as a
+    list."""
+    stmts = list(stmts)
+    _Hoister(ctx).visit_list(stmts, False)
+    return stmts
+
+# kinds of expressions: not constant, constants that are not worth
+# hoisting on their own, and constants to hoist
+_OTHER, _LITERAL, _VARIABLE, _CONSTANT = range(4)
+
+class _Hoister(object):
+    def __init__(self, ctx):
+        self.ctx = ctx
+        # references to the members of other components are rebound when
+        # those components are re-evaluated (see Component._bind_ref), so
+        # they are not constant
+        self.hoisted_ids = set(
+            uniq_id for (key, (uniq_id, _)) in ctx.hoisted.items()
+            if not (isinstance(key, tuple) and key[:1] == ("component_ref",)))
+
+    def hoist(self, expr):
+        uniq_id = self.ctx.hoist(("constant", ast.dump(expr)), expr)
+        self.hoisted_ids.add(uniq_id)
+        return ast.copy_location(
+            ast.Name(id=uniq_id, ctx=ast.Load()), expr)
+
+    def visit_list(self, nodes, in_function):
+        return [self.visit(node, in_function) for node in nodes]
+
+    def visit(self, node, in_function):
+        """Returns the kind of node. The constant subexpressions of node
+        that are not part of a larger constant are hoisted, if they are in
+        the body of a function; node itself is left to the caller."""
+        if not isinstance(node, ast.AST):
+            return _OTHER
+        kinds = { }
+        children_in_function = { }
+        for field, value in ast.iter_fields(node):
+            field_in_function = children_in_function[field] = (
+                in_function or (
+                    field == "body" and 
+                    isinstance(node, (ast.FunctionDef, ast.Lambda))))
+            if isinstance(value, list):
+                kinds[field] = self.visit_list(value, field_in_function)
+            else:
+                kinds[field] = self.visit(value, field_in_function)
+        kind = self.kind(node, kinds)
+        if kind == _OTHER:
+            for field, value in ast.iter_fields(node):
+                if not children_in_function[field]:
+                    continue
+                field_kinds = kinds[field]
+                if isinstance(value, list):
+                    for i, child_kind in enumerate(field_kinds):
+                        if child_kind == _CONSTANT:
+                            value[i] = self.hoist(value[i])
+                elif field_kinds == _CONSTANT:
+                    setattr(node, field, self.hoist(value))
+        return kind
+
+    def kind(self, node, kinds):
+        if isinstance(node, (ast.Num, ast.Str, ast.Bytes, ast.NameConstant,
+                             ast.Ellipsis)):
+            return _LITERAL
+        elif isinstance(node, ast.UnaryOp):
+            if (isinstance(node.op, (ast.USub, ast.UAdd)) and
+                    isinstance(node.operand, ast.Num)):
+                return _LITERAL
+        elif isinstance(node, ast.Name):
+            if isinstance(node.ctx, ast.Load) and node.id in self.hoisted_ids:
+                return _VARIABLE
+        elif isinstance(node, ast.Tuple):
+            if isinstance(node.ctx, ast.Load):
+                elt_kinds = kinds["elts"]
+                if _OTHER in elt_kinds:
+                    return _OTHER
+                elif all(kind == _LITERAL for kind in elt_kinds):
+                    return _LITERAL # folded by CPython
+                return _CONSTANT
+        elif isinstance(node, ast.Call):
+            if (len(node.keywords) == 0 and self.is_pure(node.func) and
+                    _OTHER not in kinds["args"]):
+                return _CONSTANT
+        return _OTHER
+
+    def is_pure(self, func):
+        return (isinstance(func, ast.Attribute) and
+                isinstance(func.value, ast.Name) and
+                func.value.id == "__builtins__" and
+                func.attr in pure_builtins)
@@ -1,16 +1,19 @@
 """typy contexts"""
 
 import ast
+import collections
 from . import util as _util
 from .util import astx as _astx
 from ._ty_exprs import (
     TyExprVar, TypeKind, SingletonKind, UName, 
     CanonicalTy, UCanonicalTy, UTyExpr, UProjection, 
     TyExprPrj)
-from ._errors import UsageError, KindError, TyError
+from ._errors import UsageError, KindError, TyError, FragmentError
 from ._fragments import is_fragment, Fragment
 from . import _components
 from . import _terms
+from . import _tracing
+from . import _matches
 
 __all__ = ("BlockTransMechanism", "Context")
 
@@ -43,9 +46,58 @@ class Context(object):
         self.imports = { 'builtins': '__builtins__' }
         self.last_import_var = 0
 
+        # map from key to (uniq_id, value ast) (see hoist)
+        self.hoisted = collections.OrderedDict()
+        self.last_hoisted_var = 0
+
         # py type for python values
         self.py_type = CanonicalTy(std.py, ())
 
+        # map from tree to the error raised when synthesizing a type for it
+        # (see syn)
+        self._syn_failures = { }
+
+        # _instrumentation.Stats, if instrumentation is enabled
+        self.stats = None
+
+        # _tracing.Tracer, if tracing is enabled
+        self.tracer = _tracing.get_tracer()
+
+        # while a component member is being checked, a list of the 
+        # (component, "type" or "value", lbl, kind or type) of the members 
+        # of other components that it used (see Component._check_member)
+        self.consumed = None
+
+    #
+    # Dispatch
+    #
+
+    def _handler(self, delegate, judgment, tree, form=None):
+        """Returns delegate's handler for the given judgment about tree 
+        (form defaults to the class of tree)."""
+        if form is None:
+            form = tree.__class__
+        stats = self.stats
+        if stats is not None:
+            stats.count_judgment(delegate, judgment)
+        try:
+            handler = delegate._dispatch[(judgment, form)]
+        except KeyError:
+            form_name = form if isinstance(form, str) else form.__name__
+            if judgment.startswith("trans"):
+                raise FragmentError(
+                    delegate.__name__ + " missing translation method: " + 
+                    judgment + "_" + form_name + ".", delegate)
+            else:
+                raise TyError(
+                    delegate.__name__ + " does not support " + 
+                    judgment + "_" + form_name + ".", tree)
+        tracer = self.tracer
+        if tracer is not None:
+            form_name = form if isinstance(form, str) else form.__name__
+            handler = tracer.traced(handler, delegate, judgment, form_name, tree)
+        return handler
+
     #
     # Bindings
     # 
@@ -100,6 +152,25 @@ class Context(object):
             imports[name] = uniq_id
             return uniq_id
 
+    def hoist(self, key, value):
+        """Binds the expression value at the top level of the translation, 
+        after the imports, and returns the variable it is bound to. 
+
+        Fragments use this for values, like generated classes, that should 
+        be computed once rather than each time a term is evaluated. Values
+        are bound in the order in which they are first hoisted, and value
+        may refer to imports and to values hoisted before it. Hoisting 
+        another value with an equal (hashable) key returns the same 
+        variable."""
+        hoisted = self.hoisted
+        try:
+            return hoisted[key][0]
+        except KeyError:
+            uniq_id = "_typy_hoisted_" + str(self.last_hoisted_var)
+            self.last_hoisted_var += 1
+            hoisted[key] = (uniq_id, value)
+            return uniq_id
+
     # 
     # Statements and expressions
     # 
@@ -109,14 +180,12 @@ class Context(object):
             return self.syn(stmt)
         elif _terms.is_targeted_stmt_form(stmt):
             target = stmt._typy_target # side effect of the guard call
-            form_name = stmt.__class__.__name__
             target_ty = self.syn(target)
             c_target_ty = self.canonicalize(target_ty)
             delegate = stmt.delegate = c_target_ty.fragment
             delegate_idx = stmt.delegate_idx = c_target_ty.idx
-            check_method_name = "check_" + form_name
-            stmt.translation_method_name = "trans_" + form_name
-            check_method = getattr(delegate, check_method_name)
+            stmt.translation_key = ("trans", stmt.__class__)
+            check_method = self._handler(delegate, "check", stmt)
             check_method(self, stmt, delegate_idx)
         elif _terms.is_default_stmt_form(stmt):
             try:
@@ -124,10 +193,8 @@ class Context(object):
             except IndexError:
                 raise TyError("No default fragment.", stmt)
             delegate_idx = stmt.delegate_idx = None
-            cls_name = stmt.__class__.__name__
-            check_method_name = "check_" + cls_name
-            stmt.translation_method_name = "trans_checked_" + cls_name
-            check_method = getattr(delegate, check_method_name)
+            stmt.translation_key = ("trans_checked", stmt.__class__)
+            check_method = self._handler(delegate, "check", stmt)
             check_method(self, stmt)
         elif _terms.is_unsupported_stmt_form(stmt):
             raise TyError("Unsupported statement form.", stmt)
@@ -139,59 +206,55 @@ class Context(object):
         # handle the case where neither left or right synthesize a type
         if isinstance(tree, (ast.BinOp, ast.BoolOp)):
             left, right = _astx.get_left_right(tree)
-            try:
-                self.syn(left)
-            except:
-                try:
-                    self.syn(right)
-                except:
-                    ty_c = self.canonicalize(ty)
-                    delegate = ty_c.fragment
-                    delegate_idx = ty_c.idx
-
-                    # will get picked up by subsumption below
-                    class_name = tree.__class__.__name__
-                    ana_method = getattr(delegate, "ana_" + class_name)
-                    ana_method(self, tree, delegate_idx)
-                    tree.ty = ty
-                    tree.delegate = delegate
-                    tree.delegate_idx = delegate_idx
-                    tree.translation_method_name = "trans_" + class_name
+            # (the fallback is deliberately outside of the except clauses: 
+            # raising while an exception is being handled chains the new
+            # exception to it, which costs time proportional to the nesting
+            # depth of the operator chain)
+            if not (self._syn_succeeds(left) or self._syn_succeeds(right)):
+                ty_c = self.canonicalize(ty)
+                delegate = ty_c.fragment
+
+                # will get picked up by subsumption below
+                # (binary forms are not passed the index, as in _do_binary)
+                ana_method = self._handler(delegate, "ana", tree)
+                ana_method(self, tree)
+                tree.ty = ty
+                tree.delegate = delegate
+                tree.delegate_idx = None
+                tree.translation_key = ("trans", tree.__class__)
 
         is_intro_form = False
         if _terms.is_intro_form(tree):
             is_intro_form = True
             ty = self.canonicalize(ty)
-            classname = tree.__class__.__name__
-            ana_method_name = "ana_" + classname
             delegate = ty.fragment
             delegate_idx = ty.idx
             if isinstance(tree, (ast.Name, ast.Call)):
                 try:
-                    ana_method = getattr(delegate, ana_method_name)
+                    ana_method = self._handler(delegate, "ana", tree)
                     ana_method(self, tree, delegate_idx)
                 except:
                     delegate = None
                     delegate_idx = None
                 else:
                     tree.is_intro_form = True
-                    translation_method_name = "trans_" + classname
+                    translation_key = ("trans", tree.__class__)
             else:
-                ana_method = getattr(delegate, ana_method_name)
+                ana_method = self._handler(delegate, "ana", tree)
                 ana_method(self, tree, delegate_idx)
                 tree.is_intro_form = True
-                translation_method_name = "trans_" + classname
+                translation_key = ("trans", tree.__class__)
         if not is_intro_form or (isinstance(tree, (ast.Name, ast.Call)) and delegate is None):
             if isinstance(tree, ast.Expr):
                 self.ana(tree.value, ty)
-                delegate = delegate_idx = translation_method_name = None
+                delegate = delegate_idx = translation_key = None
             elif isinstance(tree, _terms.MatchStatementExpression):
                 scrutinee = tree.scrutinee
                 scrutinee_ty = self.syn(scrutinee)
                 scrutinee_ty_c = self.canonicalize(scrutinee_ty)
                 delegate = None
                 delegate_idx = None
-                translation_method_name = None
+                translation_key = None
                 for rule in tree.rules:
                     pat = rule.pat
                     bindings = self.ana_pat(rule.pat, scrutinee_ty_c)
@@ -206,9 +269,8 @@ class Context(object):
                 test_ty_c = self.canonicalize(test_ty)
                 delegate = test_ty_c.fragment
                 delegate_idx = test_ty_c.idx
-                class_name = tree.__class__.__name__
-                translation_method_name = "trans_" + class_name
-                ana_method = getattr(delegate, "ana_" + class_name)
+                translation_key = ("trans", tree.__class__)
+                ana_method = self._handler(delegate, "ana", tree)
                 ana_method(self, tree, delegate_idx, ty)
             else:
                 syn_ty = self.syn(tree)
@@ -222,7 +284,7 @@ class Context(object):
         tree.ty = ty
         tree.delegate = delegate
         tree.delegate_idx = delegate_idx
-        tree.translation_method_name = translation_method_name
+        tree.translation_key = translation_key
         if isinstance(tree, ast.FunctionDef):
             try:
                 default_fragment = self.default_fragments[-1]
@@ -232,13 +294,34 @@ class Context(object):
 
     def syn(self, tree):
         if hasattr(tree, "ty"): return tree.ty
+        # callers such as _do_binary attempt synthesis speculatively, so 
+        # without remembering failures, each level of a chain like 
+        # 1 + 2 + ... + n would re-attempt synthesis for all the levels 
+        # below it
+        failures = self._syn_failures
+        if tree in failures:
+            raise failures[tree].with_traceback(None)
+        try:
+            return self._syn(tree)
+        except TyError as e:
+            failures[tree] = e
+            raise
+
+    def _syn_succeeds(self, tree):
+        try:
+            self.syn(tree)
+        except:
+            return False
+        return True
+
+    def _syn(self, tree):
         if isinstance(tree, ast.Name):
             try:
                 uniq_id, ty = self.lookup_exp_var_by_id(tree.id)
                 tree.uniq_id = uniq_id
                 delegate = None
                 delegate_idx = None
-                translation_method_name = None
+                translation_key = None
             except KeyError:
                 try:
                     static_val = self.static_env[tree.id]
@@ -248,34 +331,32 @@ class Context(object):
                     delegate = _components.component_singleton
                     ty = CanonicalTy(delegate, static_val)
                     delegate_idx = static_val
-                    translation_method_name = "trans_component_ref"
+                    translation_key = ("trans", "component_ref")
                 else:
                     ty = self.py_type
                     delegate = None
                     delegate_idx = None
-                    translation_method_name = None
+                    translation_key = None
         elif isinstance(tree, ast.Expr):
             ty = self.syn(tree.value)
-            delegate = delegate_idx = translation_method_name = None
+            delegate = delegate_idx = translation_key = None
         elif _terms.is_ascription(tree):
             uty = UTyExpr.parse(tree.ascription)
             ty = self.ana_uty_expr(uty, TypeKind)
             self.ana(tree.value, ty)
             delegate = None
             delegate_idx = None
-            translation_method_name = None
+            translation_key = None
         elif _terms.is_targeted_form(tree):
             target = tree._typy_target # side effect of guard call
-            form_name = tree.__class__.__name__
             target_ty = self.syn(target)
             can_target_ty = self.canonicalize(target_ty)
             if isinstance(can_target_ty, CanonicalTy):
                 delegate = can_target_ty.fragment
                 delegate_idx = can_target_ty.idx
-                syn_method_name = "syn_" + form_name
-                syn_method = getattr(delegate, syn_method_name)
+                syn_method = self._handler(delegate, "syn", tree)
                 ty = syn_method(self, tree, delegate_idx)
-                translation_method_name = "trans_" + form_name
+                translation_key = ("trans", tree.__class__)
             else:
                 raise TyError(
                     "Target type cannot be canonicalized.", target)
@@ -301,29 +382,30 @@ class Context(object):
                         raise TyError("First decorator is not a fragment.", asc)
                     self.default_fragments.append(fragment)
                     tree.fragment_ascription = True
-                    ty = fragment.syn_FunctionDef(self, tree)
+                    syn_method = self._handler(fragment, "syn", tree)
+                    ty = syn_method(self, tree)
                     self.default_fragments.pop()
                     self.ana_ty_expr(ty, TypeKind)
                     delegate = fragment
                     delegate_idx = ()
-                    translation_method_name = "trans_FunctionDef"
+                    translation_key = ("trans", ast.FunctionDef)
             else:
                 self.ana(tree, ty) 
                 return ty
         elif isinstance(tree, ast.BinOp):
             left = tree.left
             right = tree.right
-            delegate, delegate_idx, ty, translation_method_name = \
+            delegate, delegate_idx, ty, translation_key = \
                 self._do_binary(left, right, tree)
         elif isinstance(tree, ast.Compare):
             left = tree.left
             right = tree.comparators[0]
-            delegate, delegate_idx, ty, translation_method_name = \
+            delegate, delegate_idx, ty, translation_key = \
                 self._do_binary(left, right, tree)
         elif isinstance(tree, ast.BoolOp): # TODO put these in ast docs order
             left = tree.values[0]
             right = tree.values[1]
-            delegate, delegate_idx, ty, translation_method_name = \
+            delegate, delegate_idx, ty, translation_key = \
                 self._do_binary(left, right, tree)
         elif isinstance(tree, _terms.MatchStatementExpression):
             scrutinee = tree.scrutinee
@@ -331,7 +413,7 @@ class Context(object):
             scrutinee_ty_c = self.canonicalize(scrutinee_ty)
             delegate = None
             delegate_idx = None
-            translation_method_name = None
+            translation_key = None
             ty = None
             for rule in tree.rules:
                 pat = rule.pat
@@ -354,7 +436,7 @@ class Context(object):
         tree.ty = ty
         tree.delegate = delegate
         tree.delegate_idx = delegate_idx
-        tree.translation_method_name = translation_method_name
+        tree.translation_key = translation_key
         if isinstance(tree, ast.FunctionDef):
             try:
                 default_fragment = self.default_fragments[-1]
@@ -364,7 +446,6 @@ class Context(object):
         return ty
 
     def _do_binary(self, left, right, tree):
-        class_name = tree.__class__.__name__
         try:
             left_ty = self.syn(left)
         except:
@@ -380,12 +461,12 @@ class Context(object):
         elif left_ty is not None and right_ty is None:
             left_ty_c = self.canonicalize(left_ty)
             delegate = left_ty_c.fragment
-            syn_method = getattr(delegate, "syn_" + class_name)
+            syn_method = self._handler(delegate, "syn", tree)
             ty = syn_method(self, tree)
         elif left_ty is None and right_ty is not None:
             right_ty_c = self.canonicalize(right_ty)
             delegate = right_ty_c.fragment
-            syn_method = getattr(delegate, "syn_" + class_name)
+            syn_method = self._handler(delegate, "syn", tree)
             ty = syn_method(self, tree)
         else:
             left_ty_c = self.canonicalize(left_ty)
@@ -408,11 +489,11 @@ class Context(object):
                     raise TyError(
                         "Left and right of operator synthesize types where "
                         "the fragments are mutually non-precedent.", tree)
-            syn_method = getattr(delegate, "syn_" + class_name)
+            syn_method = self._handler(delegate, "syn", tree)
             ty = syn_method(self, tree)
         delegate_idx = None
-        translation_method_name = "trans_" + class_name
-        return delegate, delegate_idx, ty, translation_method_name
+        translation_key = ("trans", tree.__class__)
+        return delegate, delegate_idx, ty, translation_key
 
     def ana_block(self, block, ty):
         block.segmented_stmts = segmented_stmts = \
@@ -485,10 +566,11 @@ class Context(object):
         if hasattr(tree, 'delegate') and tree.delegate is not None:
             delegate = tree.delegate
             idx = tree.delegate_idx
-            translation_method_name = tree.translation_method_name
-            if translation_method_name is None:
+            translation_key = tree.translation_key
+            if translation_key is None:
                 raise TyError("missing translation method", tree)
-            translation_method = getattr(delegate, translation_method_name)
+            translation_method = self._handler(
+                delegate, translation_key[0], tree, translation_key[1])
             if idx is not None:
                 if _terms.is_stmt_expression(tree):
                     translation = translation_method(self, tree, idx, mechanism)
@@ -524,52 +606,7 @@ class Context(object):
                         ast.Return(value=value_tr),
                         tree)]
         elif isinstance(tree, _terms.MatchStatementExpression):
-            # __typy__scrutinee__ = scrutinee_trans
-            # if condition1:
-            #     binding1 = value1
-            #     binding2 = value2
-            #     binding3 = value3
-            #     ...
-            #     branch translation
-            # elif condition2: ...
-            # ...
-            # else:
-            #     raise Exception('typy match failure')
-            scrutinee = tree.scrutinee
-            scrutinee_trans = self.trans(scrutinee)
-            scrutinee_var = ast.copy_location(
-                ast.Name(id="__typy_scrutinee__", ctx=_astx.load_ctx),
-                scrutinee)
-            scrutinee_var_store = ast.copy_location(
-                ast.Name(id="__typy_scrutinee__", ctx=_astx.store_ctx), 
-                scrutinee)
-            rules = tree.rules
-            rule_stmts = [ ]
-            conditions = [ ]
-            branches = [ ]
-            for rule in rules:
-                rule_stmts.append(rule.stmt)
-                pat = rule.pat
-                condition, binding_translations = self.trans_pat(pat, scrutinee_var)
-                conditions.append(condition)
-                branch = _astx.assignments_from_dict(
-                    dict(
-                        (uniq_id, (binding_translations[id], pat))
-                        for id, (uniq_id, _) in pat.var_bindings.items()
-                    )
-                )
-                branch.extend(self.trans_block(rule.block, mechanism))
-                branches.append(branch)
-
-            translation = [
-                ast.copy_location(
-                    ast.Assign(targets=[scrutinee_var_store], value=scrutinee_trans),
-                    scrutinee)
-            ]
-            translation.extend(_astx.conditionals(
-                conditions, branches, rule_stmts, 
-                [_astx.standard_raise_str('Exception', 
-                                         'typy match failure', scrutinee)]))
+            translation = _matches.trans_match(self, tree, mechanism)
         else:
             print(tree.__class__.__name__)
             raise NotImplementedError()
@@ -603,8 +640,7 @@ class Context(object):
             canonical_ty = self.canonicalize(ty)
             delegate = pat.delegate = canonical_ty.fragment
             delegate_idx = pat.delegate_idx = canonical_ty.idx
-            method_name = "ana_pat_" + pat.__class__.__name__
-            method = getattr(delegate, method_name)
+            method = self._handler(delegate, "ana_pat", pat)
             bindings = method(self, pat, delegate_idx)
             pat.bindings = bindings
             return bindings
@@ -622,10 +658,20 @@ class Context(object):
         else:
             delegate = pat.delegate
             delegate_idx = pat.delegate_idx
-            method_name = "trans_pat_" + pat.__class__.__name__ # TODO add stubs
-            method = getattr(delegate, method_name)
+            method = self._handler(delegate, "trans_pat", pat)
             return method(self, pat, delegate_idx, scrutinee_trans)
 
+    def match_pat(self, pat):
+        """Returns the Decomposition of pat given by the match_pat judgment
+        of its fragment, or None if the fragment does not implement it for
+        pat's form (see _matches)."""
+        delegate = pat.delegate
+        if delegate.supports("match_pat", pat):
+            method = self._handler(delegate, "match_pat", pat)
+            return method(self, pat, pat.delegate_idx)
+        else:
+            return None
+
     # 
     # Kinds and type expressions
     # 
@@ -669,7 +715,11 @@ class Context(object):
         elif isinstance(c, TyExprPrj):
             path_val = c.path_val
             lbl = c.lbl
-            return path_val.kind_of(lbl)
+            k = path_val.kind_of(lbl)
+            consumed = self.consumed
+            if consumed is not None:
+                consumed.append((path_val, "type", lbl, k))
+            return k
         else:
             raise UsageError("Invalid construction.")
 
@@ -1,5 +1,6 @@
 """typy fragments"""
 
+import ast
 import inspect
 
 from ._errors import TyError, FragmentError
@@ -10,6 +11,39 @@ class Fragment(object):
     def __init__(self):
         raise NotImplementedError()
 
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._init_dispatch_table()
+
+    @classmethod
+    def _init_dispatch_table(cls):
+        """Builds the table that contexts use to find the handler for a
+        judgment about a form, e.g. ('syn', ast.BinOp) -> cls.syn_BinOp.
+
+        Keys use the AST class if the form names one, and the name of the 
+        form otherwise (e.g. ('trans', 'component_ref')). Called when a 
+        subclass is created, so must be called again if handlers are added 
+        to a fragment afterwards."""
+        dispatch = cls._dispatch = { }
+        supported = cls._supported = set()
+        for name in dir(cls):
+            for judgment in _judgments:
+                prefix = judgment + "_"
+                if name.startswith(prefix):
+                    key = dispatch_key(judgment, name[len(prefix):])
+                    dispatch[key] = getattr(cls, name)
+                    if not _is_default_handler(cls, name):
+                        supported.add(key)
+                    break
+
+    @classmethod
+    def supports(cls, judgment, form):
+        """Returns whether this fragment overrides the default handler for 
+        the given judgment (e.g. 'syn') and form (an AST class or name)."""
+        if isinstance(form, ast.AST):
+            form = form.__class__
+        return (judgment, form) in cls._supported
+
     @classmethod
     def init_idx(cls, ctx, idx_ast):
         raise FragmentError(cls.__name__ + " does not implement init_idx.", cls)
@@ -20,6 +54,10 @@ class Fragment(object):
 
     precedence = set()
 
+    # bump to invalidate cached translations that depend on this fragment;
+    # if None, the modification time of the defining module is used instead
+    version = None
+
     ## 
     ## intro expression forms
     ## 
@@ -189,6 +227,24 @@ class Fragment(object):
     def trans_BinOp(cls, ctx, e):
         raise FragmentError(cls.__name__ + " missing translation method: trans_BinOp.", cls)
 
+# ordered so that longer prefixes are tried first
+_judgments = ("trans_checked", "trans_pat", "match_pat", "ana_pat", 
+              "check", "trans", "syn", "ana")
+
+def dispatch_key(judgment, form_name):
+    form = getattr(ast, form_name, None)
+    if isinstance(form, type) and issubclass(form, ast.AST):
+        return (judgment, form)
+    else:
+        return (judgment, form_name)
+
+def _is_default_handler(cls, name):
+    for c in cls.__mro__:
+        if name in c.__dict__:
+            return c is Fragment
+
+Fragment._init_dispatch_table()
+
 def is_fragment(x):
     return inspect.isclass(x) and issubclass(x, Fragment)
 
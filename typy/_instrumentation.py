@@ -0,0 +1,201 @@
+"""typy instrumentation
+
+Instrumentation is opt-in. When enabled, each component records a Stats
+object (available as Component.stats) with wall times per compilation
+phase, counts of the judgments delegated to each fragment, and AST node
+counts before and after translation. When a component has been evaluated,
+its stats are passed to the active sink, if any.
+"""
+
+import ast
+import collections
+import json
+import logging
+import time
+
+__all__ = ('Stats', 'MemberStats', 'LoggingSink', 'JSONLinesSink',
+           'enable_instrumentation', 'disable_instrumentation')
+
+class MemberStats(object):
+    """Instrumentation data for a single component member."""
+    def __init__(self, label):
+        self.label = label
+        self.times = collections.OrderedDict()
+        self.nodes_before = 0
+        self.nodes_after = 0
+
+    def as_dict(self):
+        return collections.OrderedDict((
+            ("member", self.label),
+            ("times", dict(self.times)),
+            ("nodes_before", self.nodes_before),
+            ("nodes_after", self.nodes_after)))
+
+class Stats(object):
+    """Instrumentation data for a component."""
+    def __init__(self, name):
+        self.name = name
+        self.cache_hit = False
+        # phase -> seconds
+        self.times = collections.OrderedDict()
+        # member label -> MemberStats
+        self.members = collections.OrderedDict()
+        # (fragment name, judgment) -> number of delegated calls
+        self.judgments = collections.Counter()
+
+    @property
+    def nodes_before(self):
+        return sum(m.nodes_before for m in self.members.values())
+
+    @property
+    def nodes_after(self):
+        return sum(m.nodes_after for m in self.members.values())
+
+    def member(self, label):
+        try:
+            return self.members[label]
+        except KeyError:
+            member_stats = self.members[label] = MemberStats(label)
+            return member_stats
+
+    def add_time(self, phase, seconds, member_label=None):
+        times = self.times
+        times[phase] = times.get(phase, 0.0) + seconds
+        if member_label is not None:
+            times = self.member(member_label).times
+            times[phase] = times.get(phase, 0.0) + seconds
+
+    def timing(self, phase, member_label=None):
+        return Timing(self, None, phase, member_label)
+
+    def count_judgment(self, fragment, judgment):
+        self.judgments[(fragment.__name__, judgment)] += 1
+
+    def as_dict(self):
+        judgments = collections.OrderedDict()
+        for (fragment_name, judgment), n in sorted(self.judgments.items()):
+            judgments.setdefault(fragment_name, { })[judgment] = n
+        return collections.OrderedDict((
+            ("component", self.name),
+            ("cache_hit", self.cache_hit),
+            ("times", dict(self.times)),
+            ("nodes_before", self.nodes_before),
+            ("nodes_after", self.nodes_after),
+            ("judgments", judgments),
+            ("members", [m.as_dict() for m in self.members.values()])))
+
+class Timing(object):
+    """Context manager that times a phase, recording it in stats and/or as a
+    span in tracer (either may be None)."""
+    def __init__(self, stats, tracer, phase, member_label, component_name=None):
+        self.stats = stats
+        self.tracer = tracer
+        self.phase = phase
+        self.member_label = member_label
+        self.component_name = component_name
+
+    def __enter__(self):
+        tracer = self.tracer
+        if tracer is not None:
+            name = self.phase
+            if self.member_label is not None:
+                name += " " + self.member_label
+            self.name = name
+            self.begin_ts = tracer.begin(name, "phase", {
+                "component": self.component_name,
+                "member": self.member_label})
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc_value, tb):
+        stats = self.stats
+        if stats is not None:
+            stats.add_time(self.phase, time.perf_counter() - self.start,
+                           self.member_label)
+        tracer = self.tracer
+        if tracer is not None:
+            tracer.end(self.name, "phase", self.begin_ts)
+
+class _NullTiming(object):
+    def __enter__(self): pass
+    def __exit__(self, exc_type, exc_value, tb): pass
+null_timing = _NullTiming()
+
+def count_nodes(trees):
+    return sum(1 for tree in trees for _ in ast.walk(tree))
+
+class LoggingSink(object):
+    """Logs a one-line summary of each component's stats."""
+    def __init__(self, logger=None, level=logging.INFO):
+        if logger is None:
+            logger = logging.getLogger("typy")
+        self.logger = logger
+        self.level = level
+
+    def emit(self, stats):
+        times = " ".join("%s=%.4fs" % (phase, seconds)
+                         for (phase, seconds) in stats.times.items())
+        self.logger.log(
+            self.level, "component %s: %s, %d members, %d -> %d nodes%s",
+            stats.name, times, len(stats.members),
+            stats.nodes_before, stats.nodes_after,
+            " (cached)" if stats.cache_hit else "")
+
+class JSONLinesSink(object):
+    """Writes each component's stats as a line of JSON to a file, given
+    either as a path (appended to) or as a file object. 
+
+    close closes the file if it was given as a path. It is called when the
+    sink is replaced (see enable_instrumentation), and on exit when the 
+    sink is used as a context manager."""
+    def __init__(self, file):
+        self._owns_file = isinstance(file, str)
+        if self._owns_file:
+            file = open(file, "a")
+        self.file = file
+
+    def emit(self, stats):
+        self.file.write(json.dumps(stats.as_dict()) + "\n")
+        self.file.flush()
+
+    def close(self):
+        if self._owns_file:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+_enabled = False
+_sink = None
+
+def enable_instrumentation(sink=None):
+    """Records Stats for components created from now on, passing them to
+    sink (e.g. a LoggingSink or JSONLinesSink) once evaluated."""
+    global _enabled
+    _enabled = True
+    _set_sink(sink)
+
+def disable_instrumentation():
+    global _enabled
+    _enabled = False
+    _set_sink(None)
+
+def _set_sink(sink):
+    """Replaces the active sink, closing the previous one if it has a 
+    close method."""
+    global _sink
+    previous, _sink = _sink, sink
+    if previous is not None and previous is not sink:
+        close = getattr(previous, "close", None)
+        if close is not None:
+            close()
+
+def is_enabled():
+    return _enabled
+
+def get_sink():
+    return _sink
@@ -0,0 +1,591 @@
+"""typy match compilation
+
+Context.trans delegates the translation of match statement expressions to
+trans_match, which compiles the rules of a match together into a decision
+tree.
+
+Fragments describe the structure of their patterns by implementing the
+match_pat judgment, which returns a Decomposition: the Test that the
+pattern performs on its scrutinee, if any, and the subpatterns that are
+then matched against parts of the scrutinee. Patterns whose fragment does
+not implement match_pat for their form are tested as a whole, using the
+condition given by their trans_pat judgment.
+
+Along any path through the tree, each part of the scrutinee that is
+tested is loaded into a local variable once, and each test is performed
+at most once: when a test succeeds, the rules that perform it go on to
+match their subpatterns and, if the tests of its Family are exclusive, the
+rules that perform a different test in the family are discarded, and when
+it fails, the rules that perform it are discarded. The first remaining
+rule with nothing left to test is selected, so rules keep their
+first-match semantics. When rules test the same part of the scrutinee
+against several members of a family, the family can choose to have the
+tree switch on a small integer computed from the scrutinee (see Switch),
+using a binary search, rather than perform the tests one at a time.
+
+The tree also determines whether the match is exhaustive: when every other
+test in a family with a finite set of tests (see Family.all_keys) has
+failed, the remaining test is known to succeed and is not performed, so
+a match whose rules cover every value has no path on which it fails.
+Rules that are not selected on any path are redundant: they are reported
+with a RedundantRuleWarning, and not translated.
+
+Branches reachable along several paths through the tree are duplicated. If
+the tree would be too large as a result, the match is instead translated
+to a chain of conditionals, one per rule, using trans_pat.
+"""
+
+import ast
+import copy
+import warnings
+
+from . import _terms
+from .util import astx as _astx
+
+__all__ = ('Family', 'Literals', 'Switch', 'Test', 'Decomposition', 
+           'trans_match', 'RedundantRuleWarning')
+
+class RedundantRuleWarning(UserWarning):
+    """Warns that a match rule can never be selected, because the rules
+    before it match every value that it does. Such rules are not 
+    translated."""
+    def __init__(self, message, tree):
+        UserWarning.__init__(self, message)
+        self.tree = tree
+
+class Family(object):
+    """A family of tests, e.g. the tests for each tag of a variant type. 
+    Families that describe the same tests must compare equal. The tests in
+    a family are mutually exclusive unless exclusive is False."""
+    exclusive = True
+
+    def __init__(self, all_keys=None):
+        # the keys of all of the tests in the family, if exactly one of them
+        # succeeds on any value (used to determine that a test must succeed)
+        self.all_keys = all_keys
+
+    def switch(self, ctx, keys, scrutinee_trans):
+        """Returns a Switch that selects among the tests in this family with
+        the given keys (in rule order), or None to perform the tests one at
+        a time."""
+        return None
+
+class Literals(Family):
+    """The equality tests against the literal values of a type, e.g. the 
+    literal patterns of num. Tests against min_switch_keys or more values
+    are performed together, by looking up the scrutinee in a dict that maps
+    each value to its index (with fewer values, comparing the scrutinee 
+    against each value in turn is faster). The dict is bound at the top 
+    level of the translation (see Context.hoist), so it is only built once.
+    
+    trans_key returns the translation of a literal value."""
+    min_switch_keys = 8
+
+    def __init__(self, name, trans_key):
+        Family.__init__(self)
+        self.name = name
+        self.trans_key = trans_key
+
+    def switch(self, ctx, keys, scrutinee_trans):
+        if len(keys) < self.min_switch_keys:
+            return None
+        keys = tuple(keys)
+        # {key0: 0, key1: 1, ...}.get
+        lookup = ctx.hoist(("literals", self.name, keys), ast.Attribute(
+            value=ast.Dict(
+                keys=[self.trans_key(key) for key in keys],
+                values=[ast.Num(n=i) for i in range(len(keys))]),
+            attr="get",
+            ctx=_astx.load_ctx))
+        return Switch(
+            selector=ast.Call(
+                func=ast.Name(id=lookup, ctx=_astx.load_ctx),
+                args=[scrutinee_trans, ast.Num(n=-1)],
+                keywords=[]),
+            cases=dict((key, i) for (i, key) in enumerate(keys)),
+            domain=range(-1, len(keys)))
+
+class Switch(object):
+    """Describes how to select among tests: selector is an expression that
+    evaluates to an integer in domain (a sorted sequence of all of the
+    values it can take), and cases maps the key of each test to the value
+    that the selector takes when that test succeeds. If the tests are not
+    exclusive, the selector takes the value of the first test (in the 
+    order of the values) that succeeds."""
+    def __init__(self, selector, cases, domain):
+        self.selector = selector
+        self.cases = cases
+        self.domain = domain
+
+class Test(object):
+    """A test performed by a pattern. key identifies the test within family
+    (or None, if the test is not part of a family). condition is a function
+    from the translation of the scrutinee to an expression that evaluates to
+    whether the test succeeds."""
+    def __init__(self, family, key, condition):
+        self.family = family
+        self.key = key
+        self.condition = condition
+
+    def same_as(self, other):
+        return self is other or (
+            self.family is not None and
+            self.family == other.family and
+            self.key == other.key)
+
+    def excludes(self, other):
+        return (self.family is not None and
+                self.family.exclusive and
+                self.family == other.family and
+                self.key != other.key)
+
+class Decomposition(object):
+    """The structure of a pattern: an optional Test, and the subpatterns that
+    are matched against parts of the scrutinee if it succeeds, as (key,
+    access, pat) triples. access is a function from the translation of the
+    scrutinee to the translation of the part, or None if the part is the
+    scrutinee itself, and key identifies the part, e.g. ('item', 1). Parts
+    with equal keys must be accessed equivalently."""
+    def __init__(self, test=None, subpatterns=()):
+        self.test = test
+        self.subpatterns = subpatterns
+
+def is_var_pat(pat):
+    return isinstance(pat, ast.Name) and not _terms.is_intro_form(pat)
+
+scrutinee_id = "__typy_scrutinee__"
+selector_id = "__typy_case__"
+
+# the number of leaves allowed in a decision tree, per rule (see trans_match)
+max_leaves_per_rule = 8
+min_max_leaves = 64
+
+def trans_match(ctx, tree, mechanism):
+    # __typy_scrutinee__ = scrutinee_trans
+    # if condition1:
+    #     __typy_scrutinee_0__ = part of __typy_scrutinee__
+    #     if condition2:
+    #         binding1 = value1
+    #         ...
+    #         branch translation
+    #     ...
+    # ...
+    # else:
+    #     raise Exception('typy match failure')
+    scrutinee = tree.scrutinee
+    scrutinee_trans = ctx.trans(scrutinee)
+    scrutinee_var_store = ast.copy_location(
+        ast.Name(id=scrutinee_id, ctx=_astx.store_ctx),
+        scrutinee)
+    translation = [
+        ast.copy_location(
+            ast.Assign(targets=[scrutinee_var_store], value=scrutinee_trans),
+            scrutinee)
+    ]
+    branches = _Branches(ctx, mechanism)
+    rules = tree.rules
+    compiler = _Compiler(ctx, scrutinee, branches, max(
+        min_max_leaves, max_leaves_per_rule * len(rules)))
+    try:
+        translation.extend(compiler.compile(
+            [compiler.row(rule) for rule in rules], {(): scrutinee_id}, { }))
+    except _TooLarge:
+        translation.extend(_trans_chain(ctx, rules, scrutinee, branches))
+    else:
+        tree.exhaustive = compiler.exhaustive
+        tree.redundant_rules = [
+            rule for rule in rules if rule not in compiler.reached]
+        for rule in tree.redundant_rules:
+            warnings.warn(RedundantRuleWarning(
+                "Rule at line " + str(rule.stmt.lineno) + 
+                " is unreachable.", rule.stmt))
+    return translation
+
+class _Branches(object):
+    """Translates the branch of each rule once, and copies the translation
+    if it is needed again."""
+    def __init__(self, ctx, mechanism):
+        self.ctx = ctx
+        self.mechanism = mechanism
+        self.translations = { }
+
+    def __getitem__(self, rule):
+        translations = self.translations
+        try:
+            return copy.deepcopy(translations[rule])
+        except KeyError:
+            translation = translations[rule] = self.ctx.trans_block(
+                rule.block, self.mechanism)
+            return translation
+
+def _failure(loc_source):
+    return [_astx.standard_raise_str(
+        'Exception', 'typy match failure', loc_source)]
+
+def _bind(pat, binding_translations, branch):
+    body = _astx.assignments_from_dict(
+        dict(
+            (uniq_id, (binding_translations[id], pat))
+            for id, (uniq_id, _) in pat.var_bindings.items()
+        )
+    )
+    body.extend(branch)
+    return body
+
+def _trans_chain(ctx, rules, scrutinee, branches):
+    """Translates rules to a chain of conditionals, one per rule."""
+    scrutinee_var = ast.copy_location(
+        ast.Name(id=scrutinee_id, ctx=_astx.load_ctx),
+        scrutinee)
+    conditions = [ ]
+    bodies = [ ]
+    for rule in rules:
+        pat = rule.pat
+        condition, binding_translations = ctx.trans_pat(pat, scrutinee_var)
+        conditions.append(condition)
+        bodies.append(_bind(pat, binding_translations, branches[rule]))
+    return _astx.conditionals(
+        conditions, bodies, [rule.stmt for rule in rules],
+        _failure(scrutinee))
+
+class _TooLarge(Exception): pass
+
+class _Opaque(object):
+    """A pattern that is tested as a whole, using trans_pat."""
+    def __init__(self, pat):
+        self.pat = pat
+
+class _Row(object):
+    """A rule that has yet to be selected or discarded.
+
+    entries are the tests left to perform, as (path, entry) pairs in the
+    order in which they are to be performed, where path identifies a part
+    of the scrutinee (as a tuple of part keys) and entry is either a
+    Decomposition with a test, or an _Opaque pattern. bindings maps the
+    variables bound so far to the paths of the parts that they are bound
+    to, or to their translations."""
+    def __init__(self, rule, entries, bindings):
+        self.rule = rule
+        self.entries = entries
+        self.bindings = bindings
+
+    def find(self, path):
+        for i, (entry_path, _) in enumerate(self.entries):
+            if entry_path == path:
+                return i
+        return None
+
+class _Compiler(object):
+    def __init__(self, ctx, scrutinee, branches, max_leaves):
+        self.ctx = ctx
+        self.scrutinee = scrutinee
+        self.branches = branches
+        self.max_leaves = max_leaves
+        self.n_leaves = 0
+        # the rules selected at some leaf, and whether there is no leaf at
+        # which the match fails
+        self.reached = set()
+        self.exhaustive = True
+        # path -> (parent path, access function)
+        self.accesses = { }
+        self.n_vars = 0
+
+    #
+    # Rows
+    #
+
+    def row(self, rule):
+        entries = [ ]
+        bindings = { }
+        self.expand(entries, bindings, (), rule.pat)
+        return _Row(rule, entries, bindings)
+
+    def expand(self, entries, bindings, path, pat):
+        """Adds the entries and bindings needed to match pat against the
+        part of the scrutinee at path."""
+        if is_var_pat(pat):
+            if pat.id != "_":
+                bindings[pat.id] = path
+            return
+        decomposition = self.ctx.match_pat(pat)
+        if decomposition is None:
+            entries.append((path, _Opaque(pat)))
+        elif decomposition.test is None:
+            self.expand_subpatterns(entries, bindings, path, decomposition)
+        else:
+            entries.append((path, decomposition))
+
+    def expand_subpatterns(self, entries, bindings, path, decomposition):
+        accesses = self.accesses
+        for key, access, subpat in decomposition.subpatterns:
+            subpath = path + (key,)
+            accesses[subpath] = (path, access)
+            self.expand(entries, bindings, subpath, subpat)
+
+    def succeed(self, row, i):
+        """Returns row, given that the test of its ith entry succeeded."""
+        entries = row.entries
+        path, decomposition = entries[i]
+        new_entries = entries[:i]
+        new_bindings = dict(row.bindings)
+        self.expand_subpatterns(new_entries, new_bindings, path, decomposition)
+        new_entries.extend(entries[i + 1:])
+        return _Row(row.rule, new_entries, new_bindings)
+
+    @staticmethod
+    def _test_at(row, path):
+        i = row.find(path)
+        if i is not None:
+            entry = row.entries[i][1]
+            if isinstance(entry, Decomposition):
+                return i, entry.test
+        return None, None
+
+    def specialize(self, rows, path, test):
+        """Returns the rows that remain if test succeeds on the part of the
+        scrutinee at path."""
+        new_rows = [ ]
+        for row in rows:
+            i, row_test = self._test_at(row, path)
+            if row_test is None:
+                new_rows.append(row)
+            elif row_test.same_as(test):
+                new_rows.append(self.succeed(row, i))
+            elif not row_test.excludes(test):
+                new_rows.append(row)
+        return new_rows
+
+    def default(self, rows, path, test):
+        """Returns the rows that remain if test fails on the part of the
+        scrutinee at path."""
+        new_rows = [ ]
+        for row in rows:
+            _, row_test = self._test_at(row, path)
+            if row_test is None or not row_test.same_as(test):
+                new_rows.append(row)
+        return new_rows
+
+    def unselected(self, rows, path, family):
+        """Returns the rows that remain if no test in family succeeds on the
+        part of the scrutinee at path."""
+        new_rows = [ ]
+        for row in rows:
+            _, row_test = self._test_at(row, path)
+            if row_test is None or row_test.family != family:
+                new_rows.append(row)
+        return new_rows
+
+    def discard(self, rows, path, family, keys):
+        """Returns the rows that remain if the tests in family with the given
+        keys fail on the part of the scrutinee at path."""
+        new_rows = [ ]
+        for row in rows:
+            _, row_test = self._test_at(row, path)
+            if (row_test is None or row_test.family != family or 
+                    row_test.key not in keys):
+                new_rows.append(row)
+        return new_rows
+
+    def keys(self, rows, path, family):
+        """Returns the keys of the tests in family that rows perform on the
+        part of the scrutinee at path, in rule order."""
+        keys = [ ]
+        for row in rows:
+            _, test = self._test_at(row, path)
+            if test is not None and test.family == family:
+                key = test.key
+                if key not in keys:
+                    keys.append(key)
+        return keys
+
+    #
+    # Translation
+    #
+
+    def translation_of(self, binding, env):
+        """Returns the translation of binding, given as a path or as a
+        translation."""
+        if isinstance(binding, tuple):
+            try:
+                return ast.Name(id=env[binding], ctx=_astx.load_ctx)
+            except KeyError:
+                parent, access = self.accesses[binding]
+                translation = self.translation_of(parent, env)
+                return translation if access is None else access(translation)
+        else:
+            return binding
+
+    def load(self, path, env):
+        """Returns statements that load the part of the scrutinee at path
+        into a local variable, if it is not already in one, and records the
+        variable in env."""
+        if path in env:
+            return [ ]
+        parent, access = self.accesses[path]
+        stmts = self.load(parent, env)
+        if access is None:
+            env[path] = env[parent]
+            return stmts
+        id = "__typy_scrutinee_" + str(self.n_vars) + "__"
+        self.n_vars += 1
+        stmts.append(ast.fix_missing_locations(ast.copy_location(
+            ast.Assign(
+                targets=[ast.Name(id=id, ctx=_astx.store_ctx)],
+                value=access(ast.Name(id=env[parent], ctx=_astx.load_ctx))),
+            self.scrutinee)))
+        env[path] = id
+        return stmts
+
+    def compile(self, rows, env, failed):
+        """Returns statements that run the branch of the first of rows whose
+        remaining tests succeed. env maps the paths of the parts of the
+        scrutinee that have been loaded into local variables to those
+        variables, and failed maps paths to the keys of the tests known to 
+        have failed on those parts."""
+        if len(rows) == 0:
+            self.exhaustive = False
+            return _failure(self.scrutinee)
+        row = rows[0]
+        if len(row.entries) == 0:
+            return self.leaf(row, env)
+        path, entry = row.entries[0]
+        if isinstance(entry, Decomposition):
+            test = entry.test
+            family = test.family
+            if family is not None and family.all_keys is not None:
+                failed_keys = failed.get(path, ())
+                if all(key == test.key or key in failed_keys
+                       for key in family.all_keys):
+                    # every other test in the family has failed
+                    return self.compile(
+                        self.specialize(rows, path, test), env, failed)
+        loc_source = row.rule.stmt
+        env = dict(env)
+        stmts = self.load(path, env)
+        var = ast.Name(id=env[path], ctx=_astx.load_ctx)
+        if isinstance(entry, _Opaque):
+            condition, binding_translations = self.ctx.trans_pat(
+                entry.pat, var)
+            bindings = dict(row.bindings)
+            bindings.update(binding_translations)
+            success = _Row(row.rule, row.entries[1:], bindings)
+            stmts.append(self.branch(
+                condition,
+                self.compile([success] + rows[1:], env, failed),
+                self.compile(rows[1:], env, failed),
+                loc_source))
+            return stmts
+        switch = None
+        if family is not None:
+            switch = family.switch(
+                self.ctx, self.keys(rows, path, family), var)
+        if switch is None:
+            default_failed = dict(failed)
+            default_failed[path] = failed.get(path, frozenset()) | {test.key}
+            stmts.append(self.branch(
+                test.condition(var),
+                self.compile(self.specialize(rows, path, test), env, failed),
+                self.compile(
+                    self.default(rows, path, test), env, default_failed),
+                loc_source))
+        else:
+            stmts.extend(self.switch(
+                rows, path, test, switch, env, failed, loc_source))
+        return stmts
+
+    def leaf(self, row, env):
+        self.n_leaves += 1
+        if self.n_leaves > self.max_leaves:
+            raise _TooLarge()
+        rule = row.rule
+        self.reached.add(rule)
+        pat = rule.pat
+        bindings = row.bindings
+        return _bind(pat,
+            dict((id, self.translation_of(binding, env))
+                 for id, binding in bindings.items()),
+            self.branches[rule])
+
+    @staticmethod
+    def branch(condition, body, orelse, loc_source):
+        # (body and orelse already have locations; fixing them again would
+        # take time quadratic in the depth of the tree)
+        condition = ast.fix_missing_locations(
+            ast.copy_location(condition, loc_source))
+        return ast.copy_location(
+            ast.If(test=condition, body=body, orelse=orelse),
+            loc_source)
+
+    def switch(self, rows, path, test, switch, env, failed, loc_source):
+        # the values of the selector, grouped into ranges that select the
+        # same test (or none, for contiguous values that select none)
+        keys = dict((value, key) for (key, value) in switch.cases.items())
+        ranges = [ ]
+        for value in switch.domain:
+            if value in keys:
+                ranges.append((value, keys[value]))
+            elif len(ranges) == 0 or ranges[-1][1] in switch.cases:
+                ranges.append((value, None))
+
+        family = test.family
+        subtrees = { }
+        def subtree(key):
+            try:
+                translation, n_leaves = subtrees[key]
+            except KeyError:
+                n_leaves = self.n_leaves
+                selected, selected_failed = rows, failed
+                if key is None:
+                    selected = self.unselected(rows, path, family)
+                else:
+                    if not family.exclusive:
+                        # the tests that precede the selected test failed
+                        value = switch.cases[key]
+                        preceding = frozenset(
+                            other for (other, other_value) 
+                            in switch.cases.items() if other_value < value)
+                        selected = self.discard(
+                            selected, path, family, preceding)
+                        selected_failed = dict(failed)
+                        selected_failed[path] = \
+                            failed.get(path, frozenset()) | preceding
+                    selected = self.specialize(
+                        selected, path, Test(family, key, None))
+                translation = self.compile(selected, env, selected_failed)
+                subtrees[key] = (translation, self.n_leaves - n_leaves)
+                return translation
+            else:
+                self.n_leaves += n_leaves
+                if self.n_leaves > self.max_leaves:
+                    raise _TooLarge()
+                return copy.deepcopy(translation)
+
+        if len(ranges) == 1:
+            return subtree(ranges[0][1])
+        if isinstance(switch.selector, ast.Name):
+            # the selector is already in a variable
+            selector_var = switch.selector
+            stmts = [ ]
+        else:
+            selector_var = ast.Name(id=selector_id, ctx=_astx.load_ctx)
+            stmts = [ast.fix_missing_locations(ast.copy_location(
+                ast.Assign(
+                    targets=[ast.Name(id=selector_id, ctx=_astx.store_ctx)],
+                    value=switch.selector),
+                loc_source))]
+
+        def bisect(ranges):
+            if len(ranges) == 1:
+                return subtree(ranges[0][1])
+            mid = len(ranges) // 2
+            return [self.branch(
+                ast.Compare(
+                    left=selector_var,
+                    ops=[ast.Lt()],
+                    comparators=[ast.Num(n=ranges[mid][0])]),
+                bisect(ranges[:mid]),
+                bisect(ranges[mid:]),
+                loc_source)]
+
+        stmts.extend(bisect(ranges))
+        return stmts
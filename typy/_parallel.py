@@ -0,0 +1,363 @@
+"""typy parallel checking
+
+Checking a component's members one at a time takes time linear in the
+number of members, on one core. Members that do not refer to one another
+can instead be checked and translated at the same time. Parallel checking
+is opt-in: call set_workers, or set the TYPY_WORKERS environment variable
+before importing typy.
+
+The members of a component are scheduled in levels (see levels): each
+member comes after the earlier members whose names it mentions, and
+statement members come after all earlier members and before all later
+ones. The value members of a level are checked and translated by a pool
+of worker processes, which are forked from the compiling process at the
+start of the level and so share its state. The other members are checked
+in the compiling process.
+
+A worker checks each member from the state at the start of the level and
+returns the member's type, its translation, and the bindings that checking
+and translating it added to the context: hoisted values and imports (see
+_merge), and static environment queries (see _caches). Warnings issued in 
+the worker are issued again as results are merged. Each member mints
+variables from its own ranges, and results are merged in member order, so
+the translation does not depend on how members are divided between
+workers.
+If a member fails to check in a worker, or its results cannot be pickled,
+it is checked again in the compiling process, which raises any error.
+
+Parallel checking requires the fork start method. It is not used for lazy
+components, or while instrumentation or tracing is enabled.
+"""
+
+import ast
+import copyreg
+import io
+import multiprocessing
+import os
+import pickle
+import warnings
+
+from ._fragments import Fragment
+from ._ty_exprs import TyExprVar
+from . import _constants
+from . import _static_envs
+from . import _instrumentation
+from . import _tracing
+
+__all__ = ('set_workers', 'get_workers', 'levels', 'check')
+
+_workers = None
+
+def set_workers(n):
+    """Checks the independent members of each component with n worker
+    processes (None, or 1, checks them one at a time)."""
+    global _workers
+    if n is not None and n < 1:
+        raise ValueError("n must be positive")
+    _workers = None if n == 1 else n
+
+def get_workers():
+    """Returns the number of worker processes, or None."""
+    return _workers
+
+# levels with fewer value members than this are checked in the compiling
+# process, since forking the workers costs more than checking them
+min_parallel_members = 8
+
+# each member of a level mints variables (see Context.add_id_binding and
+# Context.hoist) from its own ranges of this size, so that the variables 
+# of different members do not collide
+_var_stride = 100000
+
+def enabled(component):
+    """Returns True if component's members are to be checked in
+    parallel."""
+    return (_workers is not None and not component._lazy and
+            not _instrumentation.is_enabled() and
+            _tracing.get_tracer() is None and
+            "fork" in multiprocessing.get_all_start_methods())
+
+def levels(component):
+    """Returns the members of component grouped into a list of levels,
+    each in member order, such that each member only depends on members
+    in earlier levels."""
+    from ._components import StmtMember
+    level_of = { }
+    # statement members are barriers
+    first = 0
+    for member in component._members:
+        if isinstance(member, StmtMember):
+            level = max([first] + [l + 1 for l in level_of.values()])
+            first = level + 1
+        else:
+            level = first
+            for dep in component._dependencies(member):
+                level = max(level, level_of[dep] + 1)
+        level_of[member] = level
+    result = [[ ] for _ in range(max(level_of.values()) + 1)] \
+        if level_of else [ ]
+    for member in component._members:
+        result[level_of[member]].append(member)
+    return result
+
+def check(component):
+    """Checks the members of component, level by level (see levels)."""
+    from ._components import ValueMember
+    for level in levels(component):
+        parallel = [member for member in level
+                    if isinstance(member, ValueMember)]
+        if len(parallel) < min_parallel_members:
+            parallel = [ ]
+        for member in level:
+            if member not in parallel:
+                component._check_member(member)
+        if parallel:
+            _check_level(component, parallel)
+
+# (component, members, baseline), set in the compiling process while a
+# level's workers are forked
+_state = None
+
+def _check_level(component, members):
+    global _state
+    ctx = component._get_ctx()
+    baseline = _Baseline(ctx, component.static_env)
+    _state = (component, members, baseline)
+    try:
+        pool = multiprocessing.get_context("fork").Pool(
+            min(_workers, len(members)))
+        try:
+            chunksize = max(1, len(members) // (_workers * 4))
+            results = pool.map(_check_in_worker, range(len(members)),
+                               chunksize)
+        finally:
+            pool.terminate()
+            pool.join()
+    finally:
+        _state = None
+    shared = _shared_objects(component)
+    counters = list(baseline.counters)
+    for i, (member, data) in enumerate(zip(members, results)):
+        result = None
+        if data is not None:
+            try:
+                result = _Unpickler(io.BytesIO(data), shared).load()
+            except Exception:
+                # e.g. a reference to a component that is not in the
+                # static environment (see _shared_objects)
+                pass
+        if result is None:
+            # mint variables after the ranges of the members of the level
+            for counter, value in zip(_counters, baseline.counters):
+                setattr(ctx, counter, max(
+                    getattr(ctx, counter), 
+                    value + len(members) * _var_stride))
+            component._check_member(member)
+        else:
+            _merge(component, member, result)
+            # the counters continue after the last variable minted
+            counters = [
+                max(value, start + i * _var_stride + minted) if minted 
+                else value
+                for (value, start, minted) in zip(
+                    counters, baseline.counters, result.minted)]
+    for counter, value in zip(_counters, counters):
+        setattr(ctx, counter, max(getattr(ctx, counter), value))
+
+# the counters from which a context mints variables
+_counters = ("last_exp_var", "last_ty_var", "last_hoisted_var",
+             "last_import_var")
+
+class _Baseline(object):
+    """The state of a context at the start of a level, which a worker
+    restores before checking each member."""
+    def __init__(self, ctx, static_env):
+        self.exp_ids = dict(ctx.exp_ids.stack[0])
+        self.exp_vars = dict(ctx.exp_vars.stack[0])
+        self.counters = [getattr(ctx, counter) for counter in _counters]
+        self.imports = dict(ctx.imports)
+        self.hoisted = ctx.hoisted.copy()
+        self.queries = static_env.queries.copy()
+
+    def restore(self, ctx, static_env, i):
+        """Restores the state for checking the ith member of the level, 
+        which mints variables from the ith range of each counter."""
+        ctx.exp_ids.stack[0] = dict(self.exp_ids)
+        ctx.exp_vars.stack[0] = dict(self.exp_vars)
+        for counter, value in zip(_counters, self.counters):
+            setattr(ctx, counter, value + i * _var_stride)
+        ctx.imports = dict(self.imports)
+        ctx.hoisted = self.hoisted.copy()
+        static_env.queries = self.queries.copy()
+
+    def minted(self, ctx, i):
+        """Returns the number of variables minted from each counter by the
+        ith member of the level."""
+        return [getattr(ctx, counter) - (value + i * _var_stride)
+                for counter, value in zip(_counters, self.counters)]
+
+class _Result(object):
+    """What a worker returns for a member."""
+    def __init__(self, ty, translation, imports, hoisted, queries, 
+                 consumed, minted, warnings):
+        self.ty = ty
+        self.translation = translation
+        # [(name, uniq_id)]
+        self.imports = imports
+        # [(key, uniq_id, value)]
+        self.hoisted = hoisted
+        self.queries = queries
+        # see Context.consumed
+        self.consumed = consumed
+        # the number of variables minted from each counter (see _counters)
+        self.minted = minted
+        # the warnings issued while checking and translating the member
+        self.warnings = warnings
+
+def _check_in_worker(i):
+    """Returns the pickled _Result for the ith member of the level, or None
+    if it could not be checked or pickled."""
+    component, members, baseline = _state
+    ctx, static_env = component.ctx, component.static_env
+    baseline.restore(ctx, static_env, i)
+    member = members[i]
+    try:
+        with warnings.catch_warnings(record=True) as caught:
+            component._check_member(member)
+            translation = _constants.hoist_constants(
+                ctx, member.translate(ctx))
+        minted = baseline.minted(ctx, i)
+        if max(minted) >= _var_stride:
+            return None
+        result = _Result(
+            member.ty, translation,
+            [(name, uniq_id) for (name, uniq_id) in ctx.imports.items()
+             if name not in baseline.imports],
+            [(key, uniq_id, value)
+             for (key, (uniq_id, value)) in ctx.hoisted.items()
+             if key not in baseline.hoisted],
+            [query for query in static_env.queries
+             if query not in baseline.queries],
+            component._consumed[member], minted, [w.message for w in caught])
+        data = io.BytesIO()
+        _Pickler(data).dump(result)
+        return data.getvalue()
+    except Exception:
+        return None
+
+def _merge(component, member, result):
+    """Adds the bindings in result to the context of component.
+
+    The variables that the worker bound are in the member's own ranges
+    (see _Baseline.restore), so they are kept, and the translation is used
+    as is. If another member of the level bound the same import or hoisted
+    value (i.e. with the same key), the worker's variable is bound again, 
+    to the same value."""
+    ctx = component.ctx
+    imports, hoisted = ctx.imports, ctx.hoisted
+    for (name, uniq_id) in result.imports:
+        try:
+            other_id = imports[name]
+        except KeyError:
+            imports[name] = uniq_id
+        else:
+            hoisted[("import", name, uniq_id)] = (
+                uniq_id, ast.Name(id=other_id, ctx=ast.Load()))
+    for (key, uniq_id, value) in result.hoisted:
+        if key in hoisted:
+            # extending the key keeps its prefix, which e.g. _constants
+            # looks at (the keys that fragments use are tuples)
+            key = key + (uniq_id,)
+        hoisted[key] = (uniq_id, value)
+    static_env = component.static_env
+    queries = static_env.queries
+    for query in result.queries:
+        # the answers are not sent, since they need not be picklable
+        try:
+            queries[query] = static_env.answer(query)
+        except Exception:
+            queries[query] = _static_envs.raises
+    for message in result.warnings:
+        warnings.warn(message)
+    ctx.add_id_var_binding(member.id, member.id, result.ty)
+    member.ty = result.ty
+    component._record_consumed(member, result.consumed)
+    component._checked_members.add(member)
+    component._translations[member] = result.translation
+
+# AST nodes are pickled without the attributes that the checker sets on
+# them (which need not be picklable). Components, their contexts and the
+# type variables bound by their type members, and fragments (which need not
+# be importable, e.g. if they are defined in a function) are pickled by
+# reference to the objects in the compiling process, which the workers
+# share.
+
+def _reduce_ast(node):
+    state = { }
+    for name in node._fields + node._attributes:
+        try:
+            state[name] = getattr(node, name)
+        except AttributeError:
+            continue
+    return (node.__class__, (), state)
+
+def _ast_classes(cls=ast.AST):
+    yield cls
+    for subclass in cls.__subclasses__():
+        yield from _ast_classes(subclass)
+
+_dispatch_table = copyreg.dispatch_table.copy()
+_dispatch_table.update((cls, _reduce_ast) for cls in _ast_classes())
+
+class _Pickler(pickle.Pickler):
+    dispatch_table = _dispatch_table
+
+    def __init__(self, file):
+        pickle.Pickler.__init__(self, file)
+        from ._components import Component
+        from ._contexts import Context
+        self.shared_types = (Component, Context, TyExprVar)
+
+    def persistent_id(self, obj):
+        if isinstance(obj, self.shared_types) or (
+                isinstance(obj, type) and issubclass(obj, Fragment)):
+            return id(obj)
+        return None
+
+class _Unpickler(pickle.Unpickler):
+    def __init__(self, file, shared):
+        pickle.Unpickler.__init__(self, file)
+        self.shared = shared
+
+    def persistent_load(self, pid):
+        return self.shared[pid]
+
+def _shared_objects(component):
+    """The objects that a worker checking the members of component may
+    refer to by reference (see _Pickler), by id."""
+    shared = { }
+    fragments = [Fragment]
+    while fragments:
+        fragment = fragments.pop()
+        shared[id(fragment)] = fragment
+        fragments.extend(fragment.__subclasses__())
+    from ._components import is_component
+    static_env = component.static_env
+    components = [component] + [
+        value 
+        for env in (static_env.globals, static_env.closure)
+        for value in env.values()
+        if is_component(value)]
+    for c in components:
+        shared[id(c)] = c
+        ctx = c.ctx
+        if ctx is not None:
+            shared[id(ctx)] = ctx
+            for ty_ids in ctx.ty_ids.stack:
+                for var in ty_ids.values():
+                    shared[id(var)] = var
+    return shared
+
+_env_workers = os.environ.get('TYPY_WORKERS', None)
+if _env_workers:
+    set_workers(int(_env_workers))
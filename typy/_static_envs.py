@@ -1,18 +1,73 @@
 """typy static environments"""
 
 import ast
+import collections
 import types
 import builtins
 
+import astunparse
+
 __all__ = ("StaticEnv",)
 
 _builtins_dict = builtins.__dict__
+
+# the answer recorded for queries that raised
+raises = object()
+
+_constant_types = (bool, int, float, complex, str, bytes)
+
 class StaticEnv(object):
     def __init__(self, closure, globals):
         self.closure = closure
         self.globals = globals
+        # the static queries made so far, in order, mapped to their answers
+        # (or to raises, if they raised); see _caches.TranslationCache and
+        # answers_unchanged
+        self.queries = collections.OrderedDict()
 
     def __getitem__(self, item):
+        return self._record(("getitem", item), self.lookup, item)
+
+    def __contains__(self, item):
+        return self._record(("contains", item), self.defines, item)
+
+    def _record(self, query, f, arg):
+        queries = self.queries
+        queries[query] = raises
+        answer = queries[query] = f(arg)
+        return answer
+
+    def answer(self, query):
+        """Answers query (a key of queries) without recording it."""
+        kind, arg = query
+        if kind == "getitem":
+            return self.lookup(arg)
+        elif kind == "contains":
+            return self.defines(arg)
+        elif kind == "eval_expr":
+            return self._eval_expr_ast(ast.parse(arg, mode="eval").body)
+        raise ValueError("Invalid query: " + repr(query))
+
+    def answers_unchanged(self, queries):
+        """Returns True if this environment answers each of queries (the 
+        queries of another environment, e.g. that of an earlier definition
+        of a component) as it was answered. Answers are compared by 
+        identity, except for constants, which are compared by value."""
+        for query, previous in queries.items():
+            try:
+                answer = self.answer(query)
+            except Exception:
+                answer = raises
+            if answer is previous:
+                continue
+            if not (type(answer) is type(previous) and
+                    isinstance(answer, _constant_types) and 
+                    answer == previous):
+                return False
+        return True
+
+    def lookup(self, item):
+        """Looks up item without recording the query."""
         try:
             return self.closure[item]
         except KeyError:
@@ -21,7 +76,8 @@ class StaticEnv(object):
             except KeyError:
                 return _builtins_dict[item]
 
-    def __contains__(self, item):
+    def defines(self, item):
+        """Membership test that does not record the query."""
         return item in self.closure or item in self.globals
 
     @classmethod
@@ -57,17 +113,58 @@ class StaticEnv(object):
                 continue
 
     def eval_expr_ast(self, expr):
+        return self._record(
+            ("eval_expr", astunparse.unparse(expr).strip()),
+            self._eval_expr_ast, expr)
+
+    def _eval_expr_ast(self, expr):
         expr = ast.Expression(expr)
         code = compile(expr, "<eval_expr_ast>", "eval")
         return eval(code, self.globals, self.closure)
 
-    def eval_module_ast(self, module_ast):
-        print(ast.dump(module_ast, include_attributes=True))
-        code = compile(module_ast, "<eval_module_ast>", "exec")
-        _module = types.ModuleType("TestModule", "Module test") # TODO properly name them
+    def eval_module_ast(self, module_ast, name="TestModule"):
+        return self.eval_module_code(
+            self.compile_module_ast(module_ast), name)
+
+    def compile_module_ast(self, module_ast):
+        return compile(module_ast, "<eval_module_ast>", "exec")
+
+    def eval_module_code(self, code, name="TestModule"):
+        _module = self.new_module(name)
+        self.exec_module_code(code, _module)
+        return _module
+
+    def exec_module_code(self, code, _module):
+        """Executes code in the namespace of _module, after binding the 
+        names from this environment that code references, and that _module
+        does not already define. 
+
+        Only those names are copied into the namespace, rather than all of 
+        the defining module's globals, so code must not look up names 
+        dynamically (e.g. via globals()[name])."""
         _module_dict = _module.__dict__
-        _module_dict.update(self.globals)
-        _module_dict.update(self.closure)
+        closure, globals = self.closure, self.globals
+        for name in referenced_names(code):
+            if name in _module_dict:
+                continue
+            try:
+                _module_dict[name] = closure[name]
+            except KeyError:
+                try:
+                    _module_dict[name] = globals[name]
+                except KeyError:
+                    continue
         exec(code, _module_dict)
-        return _module
+
+    def new_module(self, name="TestModule"):
+        return types.ModuleType(name)
+
+def referenced_names(code):
+    """Returns the set of global (and attribute) names referenced by code 
+    and the code objects nested in it."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names.update(referenced_names(const))
+    return names
 
@@ -0,0 +1,90 @@
+"""typy tracing
+
+Tracing is opt-in. While a Tracer is active (see start_tracing), contexts
+created by the checker record a begin and an end event around each
+judgment that they delegate to a fragment, e.g. std.num.syn_BinOp, and
+components record events around the checking, translation and evaluation
+of each member. Tracer.write saves these events in the Chrome trace event
+format, which can be opened in chrome://tracing or Perfetto to see a flame
+chart of where compilation time goes.
+"""
+
+import json
+import os
+import threading
+import time
+
+__all__ = ('Tracer', 'start_tracing', 'stop_tracing')
+
+class Tracer(object):
+    """Collects trace events."""
+    def __init__(self):
+        self.events = [ ]
+        self.pid = os.getpid()
+        self._t0 = time.perf_counter()
+
+    def _now(self):
+        return (time.perf_counter() - self._t0) * 1e6 # microseconds
+
+    def begin(self, name, cat, args):
+        """Records a begin event and returns its timestamp."""
+        ts = self._now()
+        self.events.append({
+            "name": name, "cat": cat, "ph": "B", "ts": ts,
+            "pid": self.pid, "tid": threading.get_ident(),
+            "args": args})
+        return ts
+
+    def end(self, name, cat, begin_ts):
+        ts = self._now()
+        self.events.append({
+            "name": name, "cat": cat, "ph": "E", "ts": ts,
+            "pid": self.pid, "tid": threading.get_ident(),
+            "args": {"duration_us": ts - begin_ts}})
+
+    def traced(self, handler, fragment, judgment, form_name, tree):
+        """Wraps a fragment handler so that calls to it are traced."""
+        name = fragment.__name__ + "." + judgment + "_" + form_name
+        args = {
+            "fragment": fragment.__module__ + "." + fragment.__qualname__,
+            "judgment": judgment,
+            "form": form_name,
+            "line": getattr(tree, "lineno", None)}
+        def traced_handler(*handler_args):
+            begin_ts = self.begin(name, "judgment", args)
+            try:
+                return handler(*handler_args)
+            finally:
+                self.end(name, "judgment", begin_ts)
+        return traced_handler
+
+    def as_dict(self):
+        return {"traceEvents": self.events, "displayTimeUnit": "ms"}
+
+    def write(self, file):
+        """Writes the trace to file, given as a path or a file object."""
+        if isinstance(file, str):
+            with open(file, "w") as f:
+                json.dump(self.as_dict(), f)
+        else:
+            json.dump(self.as_dict(), file)
+
+_tracer = None
+
+def start_tracing(tracer=None):
+    """Activates tracer (a new Tracer by default) and returns it. Only
+    contexts created while a tracer is active are traced."""
+    global _tracer
+    if tracer is None:
+        tracer = Tracer()
+    _tracer = tracer
+    return tracer
+
+def stop_tracing():
+    """Deactivates and returns the active tracer."""
+    global _tracer
+    tracer, _tracer = _tracer, None
+    return tracer
+
+def get_tracer():
+    return _tracer
@@ -1,6 +1,8 @@
 """typy type expression system"""
 
 import ast
+import collections
+import weakref
 
 from ._errors import TypeFormationError
 
@@ -35,9 +37,42 @@ class TyExpr(object):
     pass
 
 class CanonicalTy(TyExpr):
-    def __init__(self, fragment, idx):
+    """Canonical types.
+
+    Canonical types are hash-consed: constructing a canonical type that is
+    structurally equal to a live one returns the existing object, so
+    equality is (almost always) identity and types can be used as 
+    dictionary keys. The exception is that a dict is equal to an 
+    OrderedDict with the same items, though two OrderedDicts with the same
+    items in different orders are not, so indices of the two kinds are 
+    interned apart, and distinct types with the same hash (which ignores 
+    the order of OrderedDicts) are compared structurally. Indices must not
+    be mutated after construction. If an index contains an unhashable value
+    that _freeze_idx does not know about, the type is not interned, and 
+    falls back to structural equality (and is unhashable)."""
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, fragment, idx):
+        try:
+            key = (fragment, _freeze_idx(idx))
+        except TypeError:
+            key = None
+        else:
+            try:
+                return cls._interned[key]
+            except KeyError: pass
+        self = TyExpr.__new__(cls)
         self.fragment = fragment
         self.idx = idx
+        self._interned_key = key
+        if key is not None:
+            self._hash = hash((fragment, _freeze_idx(idx, ordered=False)))
+            cls._interned[key] = self
+        return self
+
+    def __reduce__(self):
+        # re-interned upon unpickling
+        return (CanonicalTy, (self.fragment, self.idx))
 
     @classmethod
     def new(cls, ctx, fragment, idx_ast):
@@ -50,7 +85,13 @@ class CanonicalTy(TyExpr):
         return self.__str__()
 
     def __eq__(self, other):
-        if isinstance(other, CanonicalTy):
+        if self is other:
+            return True
+        elif isinstance(other, CanonicalTy):
+            if (self._interned_key is not None 
+                    and other._interned_key is not None
+                    and self._hash != other._hash):
+                return False
             return (self.fragment == other.fragment) \
                    and (self.idx == other.idx)
         else:
@@ -59,6 +100,30 @@ class CanonicalTy(TyExpr):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        if self._interned_key is None:
+            raise TypeError("unhashable type index: " + repr(self.idx))
+        return self._hash
+
+def _freeze_idx(idx, ordered=True):
+    """Returns a hashable key such that structurally equal indices (in the 
+    sense of ==) of the same kinds have equal keys. If ordered is False, 
+    OrderedDicts have the same keys as dicts with the same items, so that 
+    all structurally equal indices do. Raises TypeError if this is not 
+    possible."""
+    if ordered and isinstance(idx, collections.OrderedDict):
+        return (collections.OrderedDict, 
+                tuple((k, _freeze_idx(v)) for (k, v) in idx.items()))
+    elif isinstance(idx, dict):
+        return (dict, 
+                frozenset((k, _freeze_idx(v, ordered)) 
+                          for (k, v) in idx.items()))
+    elif isinstance(idx, (tuple, list)):
+        return (type(idx), tuple(_freeze_idx(x, ordered) for x in idx))
+    else:
+        hash(idx)
+        return idx
+
 class TyExprVar(TyExpr):
     def __init__(self, ctx, name_ast, uniq_id):
         self.ctx = ctx
@@ -74,6 +139,12 @@ class TyExprVar(TyExpr):
     def __ne__(self, other):
         return not self.__eq__(other)
 
+    def __hash__(self):
+        return hash((self.ctx, self.uniq_id))
+
+    def __repr__(self):
+        return self.uniq_id
+
 class TyExprPrj(TyExpr):
     def __init__(self, path_ast, path_val, lbl):
         self.path_ast = path_ast
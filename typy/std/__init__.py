@@ -1,5 +1,6 @@
 """typy standard library"""
 import ast
+import re
 from collections import OrderedDict
 
 from .. import util as _util 
@@ -9,12 +10,21 @@ from .._fragments import Fragment
 from .._ty_exprs import CanonicalTy, TypeKind
 from .._errors import TypeValidationError, TyError
 from .. import _terms
+from .. import _matches
 
 try:
     integer_types = (int, long)
 except NameError:
     integer_types = (int,)
 
+def _literal_test(family, value, trans_value):
+    """Returns the match test for a literal pattern, given its value and its
+    translation."""
+    return _matches.Test(family, value, lambda scrutinee_trans: ast.Compare(
+        left=scrutinee_trans,
+        ops=[ast.Eq()],
+        comparators=[trans_value]))
+
 class unit(Fragment):
     @classmethod
     def init_idx(cls, ctx, idx_ast):
@@ -42,6 +52,10 @@ class unit(Fragment):
         return (ast.copy_location(
             ast.NameConstant(value=True), pat), { })
 
+    @classmethod
+    def match_pat_Tuple(cls, ctx, pat, idx):
+        return _matches.Decomposition()
+
     @classmethod
     def syn_Compare(cls, ctx, e):
         ctx.ana(e.left, unit_ty)
@@ -102,6 +116,19 @@ class boolean(Fragment):
                     operand=scrutinee_trans), pat))
         return condition, {}
 
+    _values = _matches.Family((True, False))
+
+    @classmethod
+    def match_pat_NameConstant(cls, ctx, pat, idx):
+        value = pat.value
+        if value:
+            condition = lambda scrutinee_trans: scrutinee_trans
+        else:
+            condition = lambda scrutinee_trans: ast.UnaryOp(
+                op=ast.Not(), operand=scrutinee_trans)
+        return _matches.Decomposition(
+            test=_matches.Test(cls._values, value, condition))
+
     @classmethod
     def syn_BoolOp(cls, ctx, e):
         for value in e.values:
@@ -109,7 +136,7 @@ class boolean(Fragment):
         return boolean_ty
 
     @classmethod
-    def ana_BoolOp(cls, ctx, e, idx):
+    def ana_BoolOp(cls, ctx, e, idx=None):
         for value in e.values:
             ctx.ana(value, boolean_ty)
 
@@ -196,6 +223,94 @@ class boolean(Fragment):
 
 boolean_ty = CanonicalTy(boolean, ())
 
+def _affix_conditions(scrutinee_trans, before_str, after_str, loc_source):
+    """Returns the conditions under which the string that scrutinee_trans
+    evaluates to starts with before_str and ends with after_str (either of
+    which may be None), without the two overlapping."""
+    conditions = [ ]
+    if before_str is not None and after_str is not None:
+        conditions.append(ast.fix_missing_locations(ast.copy_location(
+            ast.Compare(
+                left=astx.builtin_call('len', [scrutinee_trans]),
+                ops=[ast.GtE()], 
+                comparators=[ast.Num(n=len(before_str) + len(after_str))]),
+            loc_source))) # TODO do the other things do length checks properly?
+    if before_str is not None:
+        conditions.append(ast.fix_missing_locations(ast.copy_location(
+            astx.method_call(
+                scrutinee_trans,
+                "startswith",
+                [ast.Str(s=before_str)]),
+            loc_source)))
+    if after_str is not None:
+        conditions.append(ast.fix_missing_locations(ast.copy_location(
+            astx.method_call(
+                scrutinee_trans,
+                "endswith",
+                [ast.Str(s=after_str)]),
+            loc_source)))
+    return conditions
+
+def _affix_remainder(scrutinee_trans, before_str, after_str, loc_source):
+    """Returns the translation of the part of the string that 
+    scrutinee_trans evaluates to between before_str and after_str."""
+    if before_str is None and after_str is None:
+        return scrutinee_trans
+    return ast.fix_missing_locations(ast.copy_location(
+        ast.Subscript(
+            value=scrutinee_trans,
+            slice=ast.Slice(
+                lower=(ast.Num(n=len(before_str)) 
+                       if before_str is not None else None),
+                upper=(ast.Num(n=-len(after_str)) 
+                       if after_str is not None else None),
+                step=None),
+            ctx=astx.load_ctx), loc_source))
+
+class _Affixes(_matches.Family):
+    """The tests, performed by format string patterns, of whether a string 
+    starts and ends with given strings. Keys are (prefix, suffix) pairs.
+
+    A string can pass several of these tests, so they are not exclusive. 
+    Tests for min_switch_keys or more pairs are performed together, by 
+    matching the string against a regular expression with a group for each
+    pair, in order; the index of the group that matched selects the test.
+    The expression is compiled once, at the top level of the translation.
+    (With fewer pairs, performing the tests in turn is faster.)"""
+    exclusive = False
+    min_switch_keys = 8
+
+    def switch(self, ctx, keys, scrutinee_trans):
+        if len(keys) < self.min_switch_keys:
+            return None
+        keys = tuple(keys)
+        # (?s)(prefix0.*suffix0\Z)|(prefix1.*suffix1\Z)|...|()
+        pattern = "(?s)" + "|".join(
+            "(" + re.escape(prefix) + 
+            (".*" + re.escape(suffix) + "\\Z" if suffix else "") + ")"
+            for (prefix, suffix) in keys) + "|()"
+        re_module = ctx.add_import("re")
+        match = ctx.hoist(("affixes", keys), ast.Attribute(
+            value=ast.Call(
+                func=ast.Attribute(
+                    value=ast.Name(id=re_module, ctx=astx.load_ctx),
+                    attr="compile",
+                    ctx=astx.load_ctx),
+                args=[ast.Str(s=pattern)],
+                keywords=[]),
+            attr="match",
+            ctx=astx.load_ctx))
+        return _matches.Switch(
+            selector=ast.Attribute(
+                value=ast.Call(
+                    func=ast.Name(id=match, ctx=astx.load_ctx),
+                    args=[scrutinee_trans],
+                    keywords=[]),
+                attr="lastindex",
+                ctx=astx.load_ctx),
+            cases=dict((key, i + 1) for (i, key) in enumerate(keys)),
+            domain=range(1, len(keys) + 2))
+
 class string(Fragment):
     @classmethod
     def init_idx(cls, ctx, idx_ast):
@@ -225,6 +340,14 @@ class string(Fragment):
             pat)
         return condition, {}
 
+    _literals = _matches.Literals(
+        "string", lambda value: ast.Str(s=value))
+
+    @classmethod
+    def match_pat_Str(cls, ctx, pat, idx):
+        return _matches.Decomposition(
+            test=_literal_test(cls._literals, pat.s, ast.Str(s=pat.s)))
+
     @classmethod
     def ana_JoinedStr(cls, ctx, e, idx):
         values = e.values
@@ -293,60 +416,11 @@ class string(Fragment):
     def trans_pat_JoinedStr(cls, ctx, pat, idx, scrutinee_trans):
         before_str, formatted_pat, after_str = \
             pat.before_str, pat.formatted_pat, pat.after_str
-        conditions = []
-        min_length = 0
-        if before_str is not None:
-            min_length += len(before_str)
-            before_str_condition = ast.fix_missing_locations(ast.copy_location(
-                astx.method_call(
-                    scrutinee_trans,
-                    "startswith",
-                    [ast.Str(s=before_str)]),
-                pat))
-        else: before_str_condition = None
-
-        if after_str is not None:
-            min_length += len(after_str)
-            after_str_condition = ast.fix_missing_locations(ast.copy_location(
-                astx.method_call(
-                    scrutinee_trans,
-                    "endswith",
-                    [ast.Str(s=after_str)]),
-                pat))
-        else: after_str_condition = None
-        
-        if before_str is not None and after_str is not None and min_length > 0:
-            length_condition = ast.fix_missing_locations(ast.copy_location(
-                ast.Compare(
-                    left=astx.builtin_call('len', [scrutinee_trans]),
-                    ops=[ast.GtE()], 
-                    comparators=[ast.Num(n=min_length)]),
-                pat)) # TODO do the other things do length checks properly?
-            conditions.append(length_condition)
-
-        if before_str_condition is not None:
-            conditions.append(before_str_condition)
-            f_lower = ast.Num(n=len(before_str))
-        else: f_lower = None
-        if after_str_condition is not None:
-            conditions.append(after_str_condition)
-            f_upper = ast.Num(n=-len(after_str))
-        else: f_upper = None
-
-        if f_lower is not None or f_upper is not None:
-            formatted_pat_scrutinee = \
-                ast.fix_missing_locations(ast.copy_location(
-                    ast.Subscript(
-                        value=scrutinee_trans,
-                        slice=ast.Slice(
-                            lower=f_lower,
-                            upper=f_upper,
-                            step=None),
-                        ctx=astx.load_ctx), pat))
-        else:
-            formatted_pat_scrutinee = scrutinee_trans
-        formatted_pat_condition, binding_translations = \
-            ctx.trans_pat(formatted_pat, formatted_pat_scrutinee)
+        conditions = _affix_conditions(
+            scrutinee_trans, before_str, after_str, pat)
+        formatted_pat_condition, binding_translations = ctx.trans_pat(
+            formatted_pat, 
+            _affix_remainder(scrutinee_trans, before_str, after_str, pat))
         conditions.append(formatted_pat_condition)
         
         if len(conditions) >= 2:
@@ -358,6 +432,33 @@ class string(Fragment):
             condition = conditions[0]
         return condition, binding_translations
 
+    _affixes = _Affixes()
+
+    @classmethod
+    def match_pat_JoinedStr(cls, ctx, pat, idx):
+        before_str, formatted_pat, after_str = \
+            pat.before_str, pat.formatted_pat, pat.after_str
+        if formatted_pat is None:
+            return None
+        if before_str is None and after_str is None:
+            return _matches.Decomposition(
+                subpatterns=[(("affixes", None, None), None, formatted_pat)])
+        subpatterns = [(
+            ("affixes", before_str, after_str),
+            lambda scrutinee_trans: _affix_remainder(
+                scrutinee_trans, before_str, after_str, pat),
+            formatted_pat)]
+        def condition(scrutinee_trans):
+            conditions = _affix_conditions(
+                scrutinee_trans, before_str, after_str, pat)
+            if len(conditions) >= 2:
+                return ast.BoolOp(op=ast.And(), values=conditions)
+            return conditions[0]
+        return _matches.Decomposition(
+            test=_matches.Test(
+                cls._affixes, (before_str or "", after_str or ""), condition),
+            subpatterns=subpatterns)
+
     @classmethod
     def ana_FormattedValue(cls, ctx, e, idx):
         e.pretend_e = pretend_e = ast.copy_location(
@@ -381,6 +482,10 @@ class string(Fragment):
         return cls.trans_pat_JoinedStr(ctx, pat.pretend_pat, idx, 
                                        scrutinee_trans)
 
+    @classmethod
+    def match_pat_FormattedValue(cls, ctx, pat, idx):
+        return cls.match_pat_JoinedStr(ctx, pat.pretend_pat, idx)
+
     @classmethod
     def ana_pat_BinOp(cls, ctx, pat, idx):
         op = pat.op
@@ -600,6 +705,39 @@ class num(Fragment):
                 values=[this_condition, operand_condns]), pat))
         return condition, bindings
 
+    _literals = _matches.Literals(
+        "num", lambda value: ast.Num(n=value))
+    _signs = _matches.Family()
+
+    @classmethod
+    def match_pat_Num(cls, ctx, pat, idx):
+        return _matches.Decomposition(
+            test=_literal_test(cls._literals, pat.n, ast.Num(n=pat.n)))
+
+    @classmethod
+    def match_pat_UnaryOp(cls, ctx, pat, idx):
+        operand = pat.operand
+        negative = isinstance(pat.op, ast.USub)
+        if isinstance(operand, ast.Num) and operand.n != 0:
+            # e.g. -42 matches the same values as the literal -42 would
+            n = -operand.n if negative else operand.n
+            return _matches.Decomposition(
+                test=_literal_test(cls._literals, n, ast.Num(n=n)))
+        if negative:
+            sign, op = "-", ast.Lt()
+            access = lambda scrutinee_trans: ast.UnaryOp(
+                op=ast.USub(), operand=scrutinee_trans)
+        else:
+            sign, op = "+", ast.Gt()
+            access = lambda scrutinee_trans: scrutinee_trans
+        return _matches.Decomposition(
+            test=_matches.Test(cls._signs, sign, 
+                lambda scrutinee_trans: ast.Compare(
+                    left=scrutinee_trans,
+                    ops=[op],
+                    comparators=[ast.Num(n=0)])),
+            subpatterns=[((sign,), access, operand)])
+
     @classmethod
     def syn_BinOp(cls, ctx, e):
         op = e.op
@@ -822,6 +960,7 @@ class ieee(Fragment):
 
     @classmethod
     def ana_BinOp(cls, ctx, e):
+        op = e.op
         if isinstance(op, (ast.MatMult, ast.BitOr, ast.BitXor, 
                            ast.BitAnd, ast.LShift, ast.RShift)):
             raise TyError("Invalid operator on ieee.", e)
@@ -895,6 +1034,14 @@ class cplx(Fragment):
     # TODO pattern matching
     pass
 
+def _item_accessor(i):
+    def access(scrutinee_trans):
+        return ast.Subscript(
+            value=scrutinee_trans,
+            slice=ast.Index(value=ast.Num(n=i)),
+            ctx=astx.load_ctx)
+    return access
+
 def _update_name_bindings_disjoint(bindings, new_bindings):
     for name_ast, ty in new_bindings.items():
         for name_ast_orig, _ in bindings.items():
@@ -902,6 +1049,33 @@ def _update_name_bindings_disjoint(bindings, new_bindings):
                 raise TyError("Duplicated binding.", name_ast)
         bindings[name_ast] = ty
 
+class RecordIdx(dict):
+    """The index of a record type: a map from labels to field types.
+
+    Records are represented with their fields in sorted label order, which
+    is precomputed along with each label's position. Do not mutate."""
+    def __init__(self, fields=()):
+        dict.__init__(self, fields)
+        labels = self.labels = tuple(sorted(self.keys()))
+        self.positions = dict((lbl, i) for (i, lbl) in enumerate(labels))
+
+    @classmethod
+    def of(cls, idx):
+        return idx if isinstance(idx, cls) else cls(idx)
+
+class TplIdx(OrderedDict):
+    """The index of a tpl type: an ordered map from labels (identifiers or 
+    positions) to field types, with each label's position precomputed. 
+    Do not mutate."""
+    def __init__(self, fields=()):
+        OrderedDict.__init__(self, fields)
+        labels = self.labels = tuple(self.keys())
+        self.positions = dict((lbl, i) for (i, lbl) in enumerate(labels))
+
+    @classmethod
+    def of(cls, idx):
+        return idx if isinstance(idx, cls) else cls(idx)
+
 class record(Fragment):
     @classmethod
     def init_idx(cls, ctx, idx_ast):
@@ -926,7 +1100,7 @@ class record(Fragment):
                 else:
                     raise TypeValidationError(
                         "Invalid field specification.", dim)
-            return idx_value
+            return RecordIdx(idx_value)
         else:
             raise TypeValidationError(
                 "Invalid record specification.", idx_ast)
@@ -949,12 +1123,27 @@ class record(Fragment):
     def trans_Dict(cls, ctx, e, idx):
         ast_dict = dict((k.id, v)
                         for k, v in zip(e.keys, e.values))
-        return ast.copy_location(ast.Tuple(
-            elts=list(
+        idx = RecordIdx.of(idx)
+        return ast.fix_missing_locations(ast.copy_location(
+            cls._trans_value(ctx, idx, list(
                 ctx.trans(ast_dict[lbl])
-                for lbl in sorted(idx.keys())
-            ), ctx=ast.Load()), 
-            e)
+                for lbl in idx.labels)), 
+            e))
+
+    @classmethod
+    def _trans_value(cls, ctx, idx, field_translations):
+        """Translates a record value, given the translations of its fields 
+        in label order. Records are represented as tuples."""
+        return ast.Tuple(elts=field_translations, ctx=astx.load_ctx)
+
+    @classmethod
+    def _trans_field(cls, ctx, idx, value_trans, lbl):
+        """Translates the projection of field lbl out of value_trans."""
+        return ast.Subscript(
+            value=value_trans,
+            slice=ast.Index(
+                value=ast.Num(n=RecordIdx.of(idx).positions[lbl])),
+            ctx=astx.load_ctx)
 
     @classmethod
     def ana_pat_Dict(cls, ctx, pat, idx):
@@ -984,17 +1173,12 @@ class record(Fragment):
     @classmethod
     def trans_pat_Dict(cls, ctx, pat, idx, scrutinee_trans):
         keys, values = pat.keys, pat.values
-        sorted_idx = sorted(idx.keys())
         conditions = []
         binding_translations = { }
         for key, value in zip(keys, values):
             key_id = key.id
             key_scrutinee = ast.fix_missing_locations(ast.copy_location(
-                ast.Subscript(
-                    value=scrutinee_trans,
-                    slice=ast.Index(
-                        value=ast.Num(n=_util._seq_pos_of(key_id, sorted_idx))),
-                    ctx=astx.load_ctx),
+                cls._trans_field(ctx, idx, scrutinee_trans, key_id),
                 key))
             condition, key_binding_translations = ctx.trans_pat(value, key_scrutinee) 
             conditions.append(condition)
@@ -1034,16 +1218,11 @@ class record(Fragment):
     @classmethod
     def trans_pat_Set(cls, ctx, pat, idx, scrutinee_trans):
         elts = pat.elts
-        sorted_idx = sorted(idx.keys())
         binding_translations = { }
         for elt in elts:
             key_id = elt.id
             key_scrutinee = ast.fix_missing_locations(ast.copy_location(
-                ast.Subscript(
-                    value=scrutinee_trans,
-                    slice=ast.Index(
-                        value=ast.Num(n=_util._seq_pos_of(key_id, sorted_idx))),
-                    ctx=astx.load_ctx),
+                cls._trans_field(ctx, idx, scrutinee_trans, key_id),
                 elt))
             _, key_binding_translations = ctx.trans_pat(elt, key_scrutinee) 
             binding_translations.update(key_binding_translations)
@@ -1052,6 +1231,23 @@ class record(Fragment):
             pat)
         return condition, binding_translations
 
+    @classmethod
+    def match_pat_Dict(cls, ctx, pat, idx):
+        return _matches.Decomposition(subpatterns=[
+            (("field", key.id), cls._field_accessor(ctx, idx, key.id), value)
+            for key, value in zip(pat.keys, pat.values)])
+
+    @classmethod
+    def match_pat_Set(cls, ctx, pat, idx):
+        return _matches.Decomposition(subpatterns=[
+            (("field", elt.id), cls._field_accessor(ctx, idx, elt.id), elt)
+            for elt in pat.elts])
+
+    @classmethod
+    def _field_accessor(cls, ctx, idx, lbl):
+        return lambda scrutinee_trans: \
+            cls._trans_field(ctx, idx, scrutinee_trans, lbl)
+
     @classmethod
     def syn_Attribute(cls, ctx, e, idx):
         try:
@@ -1061,14 +1257,44 @@ class record(Fragment):
 
     @classmethod
     def trans_Attribute(cls, ctx, e, idx):
-        pos = _util._seq_pos_of(e.attr, sorted(idx.keys()))
         return ast.fix_missing_locations(ast.copy_location(
-            ast.Subscript(
-                value=ctx.trans(e.value),
-                slice=ast.Index(ast.Num(n=pos)),
-                ctx=e.ctx),
+            cls._trans_field(ctx, idx, ctx.trans(e.value), e.attr),
             e))
 
+class slotted_record(record):
+    """Records represented as instances of a class with __slots__, generated
+    once per set of labels (see typy.std._runtime.record_class), rather 
+    than as tuples. Values take about as much memory as tuples do, but 
+    show their labels when printed or inspected in a debugger. Values of 
+    the two types are not interchangeable."""
+    @classmethod
+    def _record_class(cls, ctx, idx):
+        labels = RecordIdx.of(idx).labels
+        runtime = ctx.add_import("typy.std._runtime")
+        return ctx.hoist(("slotted_record", labels), ast.Call(
+            func=ast.Attribute(
+                value=ast.Name(id=runtime, ctx=astx.load_ctx),
+                attr="record_class",
+                ctx=astx.load_ctx),
+            args=[ast.Tuple(
+                elts=[ast.Str(s=lbl) for lbl in labels],
+                ctx=astx.load_ctx)],
+            keywords=[]))
+
+    @classmethod
+    def _trans_value(cls, ctx, idx, field_translations):
+        return ast.Call(
+            func=ast.Name(id=cls._record_class(ctx, idx), ctx=astx.load_ctx),
+            args=field_translations,
+            keywords=[])
+
+    @classmethod
+    def _trans_field(cls, ctx, idx, value_trans, lbl):
+        return ast.Attribute(
+            value=value_trans,
+            attr=lbl,
+            ctx=astx.load_ctx)
+
 class tpl(Fragment):
     @classmethod
     def init_idx(cls, ctx, idx_ast):
@@ -1104,7 +1330,7 @@ class tpl(Fragment):
                         "Duplicate label.", dim)
                 ty = ctx.as_type(ty_ast)
                 idx_value[lbl] = ty
-            return idx_value
+            return TplIdx(idx_value)
         else:
             raise TypeValidationError(
                 "Invalid tpl specification.", idx_ast)
@@ -1225,14 +1451,14 @@ class tpl(Fragment):
         keys, values = pat.keys, pat.values
         conditions = []
         binding_translations = { }
-        idx_lbls = list(idx.keys())
+        positions = TplIdx.of(idx).positions
         for key, value in zip(keys, values):
             k = cls._get_key(key)
             key_scrutinee = ast.fix_missing_locations(ast.copy_location(
                 ast.Subscript(
                     value=scrutinee_trans,
                     slice=ast.Index(
-                        value=ast.Num(n=_util._seq_pos_of(k, idx_lbls))), 
+                        value=ast.Num(n=positions[k])), 
                     ctx=astx.load_ctx), 
                 key))
             condition, key_binding_translations = \
@@ -1274,7 +1500,7 @@ class tpl(Fragment):
     @classmethod
     def trans_pat_Set(cls, ctx, pat, idx, scrutinee_trans):
         elts = pat.elts
-        idx_keys = list(idx.keys())
+        positions = TplIdx.of(idx).positions
         binding_translations = { }
         for elt in elts:
             key_id = elt.id
@@ -1282,7 +1508,7 @@ class tpl(Fragment):
                 ast.Subscript(
                     value=scrutinee_trans,
                     slice=ast.Index(
-                        value=ast.Num(n=_util._seq_pos_of(key_id, idx_keys))),
+                        value=ast.Num(n=positions[key_id])),
                     ctx=astx.load_ctx),
                 elt))
             _, key_binding_translations = ctx.trans_pat(elt, key_scrutinee)
@@ -1292,6 +1518,30 @@ class tpl(Fragment):
             pat)
         return condition, binding_translations
 
+    @classmethod
+    def match_pat_Tuple(cls, ctx, pat, idx):
+        return _matches.Decomposition(subpatterns=[
+            (("item", i), _item_accessor(i), elt)
+            for i, elt in enumerate(pat.elts)])
+
+    @classmethod
+    def match_pat_Dict(cls, ctx, pat, idx):
+        positions = TplIdx.of(idx).positions
+        subpatterns = [ ]
+        for key, value in zip(pat.keys, pat.values):
+            i = positions[cls._get_key(key)]
+            subpatterns.append((("item", i), _item_accessor(i), value))
+        return _matches.Decomposition(subpatterns=subpatterns)
+
+    @classmethod
+    def match_pat_Set(cls, ctx, pat, idx):
+        positions = TplIdx.of(idx).positions
+        subpatterns = [ ]
+        for elt in pat.elts:
+            i = positions[elt.id]
+            subpatterns.append((("item", i), _item_accessor(i), elt))
+        return _matches.Decomposition(subpatterns=subpatterns)
+
     @classmethod
     def syn_Attribute(cls, ctx, e, idx):
         try:
@@ -1301,7 +1551,7 @@ class tpl(Fragment):
 
     @classmethod
     def trans_Attribute(cls, ctx, e, idx):
-        pos = _util._seq_pos_of(e.attr, idx.keys())
+        pos = TplIdx.of(idx).positions[e.attr]
         return ast.fix_missing_locations(ast.copy_location(
             ast.Subscript(
                 value=ctx.trans(e.value),
@@ -1327,7 +1577,7 @@ class tpl(Fragment):
     @classmethod
     def trans_Subscript(cls, ctx, e, idx):
         n = e.slice.value.n
-        pos = _util._seq_pos_of(n, idx.keys())
+        pos = TplIdx.of(idx).positions[n]
         return ast.fix_missing_locations(ast.copy_location(
             ast.Subscript(
                 value=ctx.trans(e.value),
@@ -1335,6 +1585,77 @@ class tpl(Fragment):
                 ctx=e.ctx),
             e))
 
+class VariantIdx(dict):
+    """The index of a variant type: a map from tags to argument types.
+
+    Each tag is numbered by its position in sorted order. variant.init_idx
+    chooses how values are represented based on the shape of the type:
+
+      - "tuple": a tuple of the tag (a typy.std._runtime.Tag) followed by 
+        the arguments.
+      - "enum", if every case is nullary: the tag alone.
+      - "option", if there is one nullary case (none_tag) and one unary 
+        case (some_tag) whose argument is never None: None for the 
+        nullary case, and the argument itself for the unary case.
+
+    Do not mutate."""
+    def __init__(self, cases=(), representation="tuple"):
+        dict.__init__(self, cases)
+        tags = self.tags = tuple(sorted(self.keys()))
+        self.numbers = dict((tag, i) for (i, tag) in enumerate(tags))
+        self.representation = representation
+        if representation == "option":
+            (self.none_tag,) = (tag for tag in tags if len(self[tag]) == 0)
+            (self.some_tag,) = (tag for tag in tags if len(self[tag]) == 1)
+
+    @classmethod
+    def of(cls, idx):
+        return idx if isinstance(idx, cls) else cls(idx)
+
+class _VariantTags(_matches.Family):
+    """The tests for the tags of a variant type."""
+    def __init__(self, idx):
+        _matches.Family.__init__(self, idx.tags)
+        self.idx = idx
+        self.tags = idx.tags
+
+    def __eq__(self, other):
+        return isinstance(other, _VariantTags) and self.tags == other.tags
+
+    def __hash__(self):
+        return hash(self.tags)
+
+    def switch(self, ctx, keys, scrutinee_trans):
+        idx = self.idx
+        if len(keys) < 2 or idx.representation == "option":
+            return None
+        numbers = idx.numbers
+        return _matches.Switch(
+            selector=_variant_tag_of(idx, scrutinee_trans),
+            cases=dict((tag, numbers[tag]) for tag in keys),
+            domain=range(len(numbers)))
+
+def _variant_tag_of(idx, scrutinee_trans):
+    if idx.representation == "enum":
+        return scrutinee_trans
+    return ast.Subscript(
+        value=scrutinee_trans,
+        slice=ast.Index(value=ast.Num(n=0)),
+        ctx=astx.load_ctx)
+
+# the fragments of types whose values are never None
+_never_none_fragments = (
+    unit, boolean, string, num, ieee, cplx, record, tpl)
+
+def _never_none(ctx, ty):
+    ty = ctx.canonicalize(ty)
+    if not isinstance(ty, CanonicalTy): # abstract
+        return False
+    fragment = ty.fragment
+    if issubclass(fragment, variant):
+        return VariantIdx.of(ty.idx).representation != "option"
+    return issubclass(fragment, _never_none_fragments + (fn,))
+
 class variant(Fragment):
     @classmethod
     def init_idx(cls, ctx, idx_ast):
@@ -1367,11 +1688,24 @@ class variant(Fragment):
                     ctx.as_type(ty_ast) 
                     for ty_ast in ty_asts)
                 idx[tag] = types
-            return idx
+            return VariantIdx(idx, cls._representation(ctx, idx))
         else:
             raise TypeValidationError(
                 "Invalid case specification.", elt)
 
+    @classmethod
+    def _representation(cls, ctx, idx):
+        """Chooses the representation of values of the variant type with 
+        the given cases (see VariantIdx)."""
+        arities = sorted(len(types) for types in idx.values())
+        if all(arity == 0 for arity in arities):
+            return "enum"
+        if arities == [0, 1]:
+            (ty,) = next(types for types in idx.values() if len(types) == 1)
+            if _never_none(ctx, ty):
+                return "option"
+        return "tuple"
+
     @classmethod
     def ana_Name(cls, ctx, e, idx):
         tag = e.id
@@ -1381,13 +1715,32 @@ class variant(Fragment):
             raise TyError(
                 "Missing arguments to constructor.", e)
 
+    @classmethod
+    def _trans_tag(cls, ctx, idx, tag):
+        number = VariantIdx.of(idx).numbers[tag]
+        runtime = ctx.add_import("typy.std._runtime")
+        return ast.Name(
+            id=ctx.hoist(("variant_tag", tag, number), ast.Call(
+                func=ast.Attribute(
+                    value=ast.Name(id=runtime, ctx=astx.load_ctx),
+                    attr="variant_tag",
+                    ctx=astx.load_ctx),
+                args=[ast.Str(s=tag), ast.Num(n=number)],
+                keywords=[])),
+            ctx=astx.load_ctx)
+
     @classmethod
     def trans_Name(cls, ctx, e, idx):
-        return ast.fix_missing_locations(ast.copy_location(
-            ast.Tuple(
-                elts=[ast.Str(s=e.id)],
-                ctx=astx.load_ctx),
-            e))
+        representation = VariantIdx.of(idx).representation
+        if representation == "option":
+            translation = ast.NameConstant(value=None)
+        elif representation == "enum":
+            translation = cls._trans_tag(ctx, idx, e.id)
+        else:
+            translation = ast.Tuple(
+                elts=[cls._trans_tag(ctx, idx, e.id)],
+                ctx=astx.load_ctx)
+        return ast.fix_missing_locations(ast.copy_location(translation, e))
 
     @classmethod
     def ana_Call(cls, ctx, e, idx):
@@ -1411,17 +1764,19 @@ class variant(Fragment):
             raise TyError("Invalid tag.", func)
 
     @classmethod
-    def trans_Call(cls, ctx, e, idx=None):
-        elts = [ast.copy_location(ast.Str(s=e.func.id), e)]
+    def trans_Call(cls, ctx, e, idx):
+        if VariantIdx.of(idx).representation == "option":
+            return ctx.trans(e.args[0])
+        elts = [cls._trans_tag(ctx, idx, e.func.id)]
         args = e.args
         elts.extend([
             ctx.trans(arg)
             for arg in args])
-        return ast.copy_location(
+        return ast.fix_missing_locations(ast.copy_location(
             ast.Tuple(
                 elts=elts,
                 ctx=astx.load_ctx), 
-            e)
+            e))
 
     @classmethod
     def ana_pat_Name(cls, ctx, pat, idx):
@@ -1435,16 +1790,14 @@ class variant(Fragment):
     @classmethod
     def trans_pat_Name(cls, ctx, pat, idx, scrutinee_trans):
         condition = ast.fix_missing_locations(ast.copy_location(
-            ast.Compare(
-                left=ast.Subscript(
-                    value=scrutinee_trans,
-                    slice=ast.Index(value=ast.Num(n=0)),
-                    ctx=astx.load_ctx),
-                ops=[ast.Eq()],
-                comparators=[ast.Str(s=pat.id)]),
+            cls._tag_condition(idx, pat.id, scrutinee_trans),
             pat))
         return condition, { }
 
+    @classmethod
+    def match_pat_Name(cls, ctx, pat, idx):
+        return cls._decompose(idx, pat.id, ())
+
     @classmethod
     def ana_pat_Call(cls, ctx, pat, idx):
         func, args, keywords = pat.func, pat.args, pat.keywords
@@ -1473,25 +1826,23 @@ class variant(Fragment):
     def trans_pat_Call(cls, ctx, pat, idx, scrutinee_trans):
         tag = pat.func.id
         tag_condition = ast.fix_missing_locations(ast.copy_location(
-            ast.Compare(
-                left=ast.Subscript(
-                    value=scrutinee_trans,
-                    slice=ast.Index(value=ast.Num(n=0)),
-                    ctx=astx.load_ctx),
-                ops=[ast.Eq()],
-                comparators=[ast.Str(s=tag)]), 
+            cls._tag_condition(idx, tag, scrutinee_trans),
             pat))
         conditions = [tag_condition]
         binding_translations = { }
+        unboxed = VariantIdx.of(idx).representation == "option"
         for i, arg in enumerate(pat.args):
-            arg_scrutinee = ast.copy_location(
-                ast.Subscript(
-                    value=scrutinee_trans,
-                    slice=ast.fix_missing_locations(ast.copy_location(
-                        ast.Index(value=ast.Num(n=1 + i)), 
-                        pat)),
-                    ctx=astx.load_ctx), 
-                pat)
+            if unboxed:
+                arg_scrutinee = scrutinee_trans
+            else:
+                arg_scrutinee = ast.copy_location(
+                    ast.Subscript(
+                        value=scrutinee_trans,
+                        slice=ast.fix_missing_locations(ast.copy_location(
+                            ast.Index(value=ast.Num(n=1 + i)), 
+                            pat)),
+                        ctx=astx.load_ctx), 
+                    pat)
             arg_condition, arg_binding_translations = ctx.trans_pat(arg, arg_scrutinee)
             conditions.append(arg_condition)
             binding_translations.update(arg_binding_translations)
@@ -1502,6 +1853,103 @@ class variant(Fragment):
             pat)
         return condition, binding_translations
 
+    @classmethod
+    def match_pat_Call(cls, ctx, pat, idx):
+        return cls._decompose(idx, pat.func.id, pat.args)
+
+    @classmethod
+    def _tag_condition(cls, idx, tag, scrutinee_trans):
+        idx = VariantIdx.of(idx)
+        if idx.representation == "option":
+            return ast.Compare(
+                left=scrutinee_trans,
+                ops=[ast.Is() if tag == idx.none_tag else ast.IsNot()],
+                comparators=[ast.NameConstant(value=None)])
+        return ast.Compare(
+            left=_variant_tag_of(idx, scrutinee_trans),
+            ops=[ast.Eq()],
+            comparators=[ast.Num(n=idx.numbers[tag])])
+
+    @classmethod
+    def _decompose(cls, idx, tag, args):
+        idx = VariantIdx.of(idx)
+        if idx.representation == "option":
+            subpatterns = [
+                (("some",), None, arg) for arg in args]
+        else:
+            subpatterns = [
+                (("item", 1 + i), _item_accessor(1 + i), arg)
+                for i, arg in enumerate(args)]
+        return _matches.Decomposition(
+            test=_matches.Test(
+                _VariantTags(idx), tag, 
+                lambda scrutinee_trans: 
+                    cls._tag_condition(idx, tag, scrutinee_trans)),
+            subpatterns=subpatterns)
+
+def _loop_tail_calls(body, id, arg_ids):
+    """Returns the translation of the body of the function bound to id, 
+    whose arguments are bound to arg_ids, with the calls to the function
+    that it returns replaced by rebinding the arguments and continuing a 
+    loop around the body, so that they do not use stack frames.
+
+    Bodies that define functions are left alone, because the functions 
+    could capture the arguments, which a loop would rebind."""
+    for node in ast.walk(ast.Module(body=body)):
+        if isinstance(node, (ast.FunctionDef, ast.Lambda, ast.ClassDef)):
+            return body
+    def is_tail_call(stmt):
+        if not isinstance(stmt, ast.Return): return False
+        call = stmt.value
+        return (isinstance(call, ast.Call) and
+                isinstance(call.func, ast.Name) and call.func.id == id and
+                len(call.args) == len(arg_ids) and
+                len(call.keywords) == 0 and
+                not any(isinstance(arg, ast.Starred) for arg in call.args))
+    def loop(stmts):
+        # (returns in other loops and in try statements are left alone, 
+        # because continue would not apply to the right loop or would 
+        # run finally clauses)
+        found = False
+        new_stmts = [ ]
+        for stmt in stmts:
+            if is_tail_call(stmt):
+                found = True
+                args = stmt.value.args
+                if len(args) > 0:
+                    # a, b = e1, e2
+                    new_stmts.append(ast.fix_missing_locations(
+                        ast.copy_location(ast.Assign(
+                            targets=[ast.Tuple(
+                                elts=[ast.Name(id=arg_id, ctx=astx.store_ctx)
+                                      for arg_id in arg_ids],
+                                ctx=astx.store_ctx)],
+                            value=ast.Tuple(elts=args, ctx=astx.load_ctx)),
+                            stmt)))
+                new_stmts.append(ast.copy_location(ast.Continue(), stmt))
+                continue
+            if isinstance(stmt, ast.If):
+                found_body, stmt.body = loop(stmt.body)
+                found_orelse, stmt.orelse = loop(stmt.orelse)
+                found = found or found_body or found_orelse
+            elif isinstance(stmt, ast.With):
+                found_body, stmt.body = loop(stmt.body)
+                found = found or found_body
+            new_stmts.append(stmt)
+        return found, new_stmts
+    found, body = loop(body)
+    if not found:
+        return body
+    # while True:
+    #     body
+    #     break
+    return [ast.fix_missing_locations(ast.copy_location(
+        ast.While(
+            test=ast.NameConstant(value=True),
+            body=body + [ast.Break()],
+            orelse=[]),
+        body[0]))]
+
 class fn(Fragment):
     @classmethod
     def init_idx(cls, ctx, idx_ast):
@@ -1615,7 +2063,10 @@ class fn(Fragment):
                 ast.Name(id=stmt.name),
                 stmt)
             self_ty = CanonicalTy(cls, (arg_types, rty))
-            ctx.push_var_bindings({self_name : self_ty})  
+            stmt.uniq_self_id = ctx.push_var_bindings(
+                {self_name : self_ty})[stmt.name][0]
+        else:
+            stmt.uniq_self_id = None
         stmt.uniq_arg_sig = ctx.push_var_bindings(dict(arg_sig))
 
         # process docstring
@@ -1643,6 +2094,11 @@ class fn(Fragment):
         else:
             ctx.ana_block(proper_body_block, rty)
 
+        # bindings
+        ctx.pop_var_bindings()
+        if stmt.uniq_self_id is not None:
+            ctx.pop_var_bindings()
+
         # return canonical type
         return CanonicalTy(fn, (arg_types, rty))
 
@@ -1726,7 +2182,8 @@ class fn(Fragment):
             ast.Name(id=stmt.name),
             stmt)
         self_ty = CanonicalTy(cls, (arg_types, rty))
-        ctx.push_var_bindings({self_name : self_ty})  
+        stmt.uniq_self_id = ctx.push_var_bindings(
+            {self_name : self_ty})[stmt.name][0]
         stmt.uniq_arg_sig = ctx.push_var_bindings(dict(arg_sig))
 
         # process docstring
@@ -1753,6 +2210,7 @@ class fn(Fragment):
 
         # bindings
         ctx.pop_var_bindings()
+        ctx.pop_var_bindings()
 
     @classmethod
     def trans_FunctionDef(cls, ctx, stmt, idx, mechanism):
@@ -1777,6 +2235,15 @@ class fn(Fragment):
         # translate body
         body_tr = ctx.trans_block(stmt.proper_body_block, 
                                   BlockTransMechanism.Return)
+        self_id = stmt.uniq_self_id
+        if self_id is not None:
+            # recursive references are to the variable the function is 
+            # bound to
+            for node in ast.walk(ast.Module(body=body_tr)):
+                if isinstance(node, ast.Name) and node.id == self_id:
+                    node.id = uniq_id
+            body_tr = _loop_tail_calls(
+                body_tr, uniq_id, [arg.arg for arg in arguments_tr.args])
 
         return [ast.copy_location(
             ast.FunctionDef(
@@ -2987,7 +3454,7 @@ class py(Fragment):
         return py_type
 
     @classmethod
-    def ana_BoolOp(cls, ctx, e, idx):
+    def ana_BoolOp(cls, ctx, e, idx=None):
         for value in e.values:
             ctx.ana(value, py_type)
 
@@ -3197,7 +3664,7 @@ class py(Fragment):
             if len(args) == 1 and isinstance(args[0], ast.Name):
                 func_bindings = ctx.ana_pat(func, py_type)
                 bindings = dict(func_bindings)
-                new_binding = { args[0] : CanonicalTy(tpl, OrderedDict(
+                new_binding = { args[0] : CanonicalTy(tpl, TplIdx(
                     (i, py_type)
                     for i in range(len(func.elts))
                 )) }
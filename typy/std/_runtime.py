@@ -0,0 +1,66 @@
+"""Run-time support for translations of typy.std fragments."""
+
+__all__ = ('record_class', 'variant_tag')
+
+_record_classes = { }
+
+def record_class(labels):
+    """Returns the class that represents slotted_record values with the
+    given labels (a tuple, in sorted order), creating it on first use. The
+    constructor takes field values positionally, in label order."""
+    try:
+        return _record_classes[labels]
+    except KeyError:
+        cls = _record_classes[labels] = _make_record_class(labels)
+        return cls
+
+def _make_record_class(labels):
+    params = ", ".join("_" + str(i) for i in range(len(labels)))
+    body = "".join(
+        "    self.%s = _%d\n" % (lbl, i) for (i, lbl) in enumerate(labels))
+    namespace = { }
+    exec("def __init__(self%s):\n%s" % (
+        ", " + params if params else "", body or "    pass\n"), namespace)
+
+    def __repr__(self):
+        return "{" + ", ".join(
+            "%s: %r" % (lbl, getattr(self, lbl)) for lbl in labels) + "}"
+
+    def __reduce__(self):
+        return (_make_record,
+                (labels, tuple(getattr(self, lbl) for lbl in labels)))
+
+    return type("record", (object,), {
+        "__slots__": labels,
+        "__init__": namespace["__init__"],
+        "__repr__": __repr__,
+        "__reduce__": __reduce__,
+        "__module__": __name__})
+
+def _make_record(labels, values):
+    return record_class(labels)(*values)
+
+class Tag(int):
+    """A variant tag. Tags are small integers, so that matches can dispatch
+    on them quickly, that know their name, for readable reprs."""
+    def __new__(cls, name, number):
+        tag = int.__new__(cls, number)
+        tag.name = name
+        return tag
+
+    def __repr__(self):
+        return self.name
+    __str__ = __repr__
+
+    def __reduce__(self):
+        return (variant_tag, (self.name, int(self)))
+
+_variant_tags = { }
+
+def variant_tag(name, number):
+    """Returns the tag with the given name and number."""
+    try:
+        return _variant_tags[(name, number)]
+    except KeyError:
+        tag = _variant_tags[(name, number)] = Tag(name, number)
+        return tag
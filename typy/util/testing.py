@@ -1,4 +1,7 @@
 """Test utilities."""
+import ast
+import copy
+import re
 import textwrap
 
 import astunparse
@@ -19,3 +22,82 @@ def ast_eq(a, b, print_a=False, print_b=False):
         print(b_s)
     return result
 
+def make_component(source, env):
+    """Returns the Component defined by source (the source of a function
+    definition), in which names are looked up in env, without checking 
+    it."""
+    from .._components import Component
+    from .._static_envs import StaticEnv
+    tree = ast.parse(source).body[0]
+    return Component(tree, StaticEnv({ }, env), source)
+
+def summarize(c):
+    """Returns a list of the label, type (or kind) and translation of each 
+    member of evaluated component c, which does not depend on the order in
+    which the members were checked: hoisted values and imports are inlined,
+    and the variables that the checker minted are numbered in order of 
+    appearance."""
+    from .._components import TypeMember, ValueMember
+    ctx = c.ctx
+    inline = _Inliner(ctx)
+    summary = [ ]
+    for member in c._members:
+        if isinstance(member, TypeMember):
+            ty = member.kind.ty
+        elif isinstance(member, ValueMember):
+            ty = member.ty
+        else:
+            ty = None
+        translation = [inline.visit(copy.deepcopy(stmt))
+                       for stmt in c._translations[member]]
+        summary.append(
+            (member.label, str(ty), 
+             "".join(astunparse.unparse(stmt) for stmt in translation)))
+    names = { }
+    def rename(match):
+        return names.setdefault(match.group(0), "_v%d" % len(names))
+    return [tuple(_minted_var.sub(rename, s) for s in entry) 
+            for entry in summary]
+
+_minted_var = re.compile(r"\b_\w+?_\d+\b")
+
+class _Inliner(ast.NodeTransformer):
+    def __init__(self, ctx):
+        self.imports = dict(
+            (uniq_id, name) for (name, uniq_id) in ctx.imports.items())
+        self.hoisted = dict(ctx.hoisted.values())
+
+    def visit_Name(self, node):
+        id = node.id
+        if id in self.hoisted:
+            return self.visit(copy.deepcopy(self.hoisted[id]))
+        elif id in self.imports:
+            return ast.copy_location(
+                ast.Name(id=self.imports[id], ctx=node.ctx), node)
+        return node
+
+def check_recompile(source, edits, env):
+    """Compiles the component defined by source (see make_component), then
+    applies each function in edits, from source to source, in turn, and 
+    checks that recompiling the component after each edit has the same 
+    result as compiling the edited source from scratch: the same summary
+    (see summarize), or the same error. Returns the component."""
+    from .._static_envs import StaticEnv
+    c = make_component(source, env)
+    _outcome(c._evaluate, c) # source need not be well-typed
+    for edit in edits:
+        source = edit(source)
+        tree = ast.parse(source).body[0]
+        fresh = make_component(source, env)
+        expected = _outcome(fresh._evaluate, fresh)
+        actual = _outcome(
+            lambda: c._recompile(tree, StaticEnv({ }, env), source), c)
+        assert actual == expected, (source, actual, expected)
+    return c
+
+def _outcome(compile, c):
+    try:
+        compile()
+    except Exception as e:
+        return (type(e).__name__, _minted_var.sub("_v", str(e)))
+    return summarize(c)